@@ -1,10 +1,82 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import traceback
+from sqlalchemy import event, insert, exc
 from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
 from datetime import datetime
 from typing import Optional
 
-# This model is defined here or imported from models to avoid circular imports if separated carefully.
-# For simplicity, we will assume AuditLog is defined in models.py and we import the Log function here 
-# OR we define the utility here and pass the model.
+# Audit entries are written one of two ways, picked by AUDIT_MODE:
+#   inline  - the AuditLog row joins the caller's transaction (record) or gets its own
+#             commit (log_action). Nothing is lost, but every action pays for the insert.
+#   batched - entries go onto an in-process queue once the caller's transaction commits,
+#             and a writer thread inserts them AUDIT_BATCH_SIZE rows at a time, at least
+#             every AUDIT_FLUSH_SECONDS. Batches the database won't take, and whatever is
+#             queued at shutdown if the database is gone, are spooled to JSON-lines files
+#             in AUDIT_SPOOL_DIR and replayed later. A hard crash loses what was queued.
+
+AUDIT_MODE = os.getenv("AUDIT_MODE", "inline").lower()
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", 1))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 50000))
+AUDIT_SPOOL_DIR = os.getenv("AUDIT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "sktexcot-audit"))
+SPOOL_REPLAY_SECONDS = 60
+
+if AUDIT_MODE not in ("inline", "batched"):
+    raise RuntimeError(f"AUDIT_MODE must be 'inline' or 'batched', not {AUDIT_MODE!r}")
+
+def _entry(user_id, action, table_name, record_id, old_value, new_value, ip_address):
+    # Values are stored in a JSON column; dates, enums and Decimals need converting first
+    return {
+        # Failed logins for unknown emails have no user; 0 would break the foreign key
+        "user_id": user_id or None,
+        "action": action,
+        "table_name": table_name,
+        "record_id": record_id,
+        "old_value": jsonable_encoder(old_value),
+        "new_value": jsonable_encoder(new_value),
+        "ip_address": ip_address,
+        "timestamp": datetime.utcnow()
+    }
+
+def record(
+    db: Session,
+    user_id: int,
+    action: str,
+    table_name: str,
+    record_id: Optional[int] = None,
+    old_value: Optional[dict] = None,
+    new_value: Optional[dict] = None,
+    ip_address: Optional[str] = None
+):
+    """Add an audit entry to the caller's transaction, so it is kept only if the change it describes commits."""
+    entry = _entry(user_id, action, table_name, record_id, old_value, new_value, ip_address)
+    if AUDIT_MODE == "batched":
+        db.info.setdefault("pending_audit", []).append(entry)
+        return
+
+    # We perform a local import to avoid circular dependency if models.py imports this
+    from .models import AuditLog
+    db.add(AuditLog(**entry))
+
+def record_many(db: Session, user_id: int, action: str, table_name: str, records):
+    """record() for a batch of rows, given as [(record_id, new_value)]; inline mode writes them in one multi-row insert."""
+    entries = [_entry(user_id, action, table_name, record_id, None, new_value, None) for record_id, new_value in records]
+    if not entries:
+        return
+    if AUDIT_MODE == "batched":
+        db.info.setdefault("pending_audit", []).extend(entries)
+        return
+
+    from .models import AuditLog
+    db.execute(insert(AuditLog), entries)
 
 def log_action(
     db: Session,
@@ -16,25 +88,241 @@ def log_action(
     new_value: Optional[dict] = None,
     ip_address: Optional[str] = None
 ):
+    """Write an audit entry for an action with no other write (login, logout...).
+
+    Write paths that change data use record() before their single commit instead.
+    """
+    if AUDIT_MODE == "batched":
+        writer.enqueue([_entry(user_id, action, table_name, record_id, old_value, new_value, ip_address)])
+        return
+
     try:
-        # We perform a local import to avoid circular dependency if models.py imports this
-        from .models import AuditLog 
-        
-        # Helper to serialise dicts to JSON string (if database field is Text) or let SQLAlchemy handle JSON type
-        # Postgres supports JSON type directly.
-        
-        log_entry = AuditLog(
-            user_id=user_id,
-            action=action,
-            table_name=table_name,
-            record_id=record_id,
-            old_value=old_value,
-            new_value=new_value,
-            ip_address=ip_address,
-            timestamp=datetime.utcnow()
-        )
-        db.add(log_entry)
+        record(db, user_id, action, table_name, record_id, old_value, new_value, ip_address)
         db.commit()
     except Exception as e:
         print(f"Failed to write audit log: {e}")
         db.rollback()
+
+# Batched mode: entries recorded in a session wait in session.info until it commits
+@event.listens_for(Session, "after_commit")
+def _enqueue_committed(session):
+    entries = session.info.pop("pending_audit", None)
+    if entries:
+        writer.enqueue(entries)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("pending_audit", None)
+
+class AuditWriter:
+    def __init__(self, batch_size: int = AUDIT_BATCH_SIZE, flush_seconds: float = AUDIT_FLUSH_SECONDS,
+                 queue_size: int = AUDIT_QUEUE_SIZE, spool_dir: str = AUDIT_SPOOL_DIR):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.spool_dir = spool_dir
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._spool_seq = 0
+        self._atexit_registered = False
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "max_queue_depth": 0,
+            "last_flush_ms": 0.0,
+            "last_error": None
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                # Scripts that log in batched mode never see the app's shutdown event
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self):
+        """Flush everything still queued. Whatever the database won't take is spooled to disk."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._flush(batch)
+
+    def enqueue(self, entries):
+        if self._thread is None:
+            self.start()
+        queued = 0
+        for entry in entries:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                # Never block a request on the audit trail: overflow goes straight to disk
+                self._spool(entries[queued:])
+                break
+            queued += 1
+        with self._lock:
+            self.stats["enqueued"] += queued
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queue.qsize())
+
+    def status(self):
+        with self._lock:
+            return {
+                "mode": AUDIT_MODE,
+                "running": self._thread is not None,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "batch_size": self.batch_size,
+                "flush_seconds": self.flush_seconds,
+                "spool_files": len(self._spool_files()),
+                **self.stats
+            }
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        self._replay_spool()
+        next_replay = time.monotonic() + SPOOL_REPLAY_SECONDS
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                first = None
+            if first is not None:
+                # Give the batch until flush_seconds after its first entry to fill up
+                batch, deadline = [first], time.monotonic() + self.flush_seconds
+                while len(batch) < self.batch_size and not self._stop.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._flush(batch)
+            if time.monotonic() >= next_replay:
+                self._replay_spool()
+                next_replay = time.monotonic() + SPOOL_REPLAY_SECONDS
+
+    def _insert(self, rows):
+        from .models import AuditLog
+        from .database import engine
+        with engine.begin() as conn:
+            # One multi-row INSERT ... VALUES (...), (...) per batch_size rows, all in one transaction
+            for i in range(0, len(rows), self.batch_size):
+                conn.execute(insert(AuditLog.__table__).values(rows[i:i + self.batch_size]))
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            self._insert(batch)
+            written = len(batch)
+        except exc.OperationalError as e:
+            # Database unreachable: keep the batch on disk for a later replay
+            self._note_error(e)
+            self._spool(batch)
+            return
+        except Exception as e:
+            # A row the database rejects mustn't take the rest of its batch down with it
+            self._note_error(e)
+            written = self._insert_one_by_one(batch)
+        with self._lock:
+            self.stats["written"] += written
+            self.stats["batches"] += 1
+            self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _insert_one_by_one(self, batch):
+        written = 0
+        for i, row in enumerate(batch):
+            try:
+                self._insert([row])
+                written += 1
+            except exc.OperationalError as e:
+                self._note_error(e)
+                self._spool(batch[i:])
+                break
+            except Exception as e:
+                print(f"Failed to write audit log: {e}")
+                with self._lock:
+                    self.stats["dropped"] += 1
+        return written
+
+    def _note_error(self, error):
+        with self._lock:
+            self.stats["last_error"] = f"{type(error).__name__}: {error}".splitlines()[0]
+
+    def _spool(self, rows):
+        # Each spill is its own file, written under a temporary name and renamed into place,
+        # so a replaying process (possibly another worker) only ever sees complete files.
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            with self._lock:
+                self._spool_seq += 1
+                name = f"audit-{time.time_ns()}-{os.getpid()}-{self._spool_seq}"
+            path = os.path.join(self.spool_dir, name)
+            with open(path + ".tmp", "w") as f:
+                for row in rows:
+                    f.write(json.dumps(jsonable_encoder(row)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path + ".jsonl")
+        except OSError:
+            traceback.print_exc()
+            print(f"Failed to spool {len(rows)} audit log entries; they are lost.")
+            return
+        with self._lock:
+            self.stats["spooled"] += len(rows)
+
+    def _spool_files(self):
+        return sorted(glob.glob(os.path.join(self.spool_dir, "audit-*.jsonl")))
+
+    def _replay_spool(self):
+        for path in self._spool_files():
+            # Claim the file by renaming it; if another worker got there first, move on
+            claimed = f"{path}.{os.getpid()}.replaying"
+            try:
+                os.replace(path, claimed)
+            except OSError:
+                continue
+            try:
+                with open(claimed) as f:
+                    rows = [json.loads(line) for line in f if line.strip()]
+                for row in rows:
+                    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                self._insert(rows)
+            except exc.OperationalError as e:
+                # Still down; put the file back for the next attempt
+                self._note_error(e)
+                os.replace(claimed, path)
+                return
+            except Exception:
+                traceback.print_exc()
+                os.replace(claimed, path[:-len(".jsonl")] + ".failed")
+                continue
+            os.remove(claimed)
+            with self._lock:
+                self.stats["replayed"] += len(rows)
+
+writer = AuditWriter()
@@ -0,0 +1,114 @@
+import gzip
+import os
+import re
+from datetime import date, datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# audit_logs is RANGE-partitioned by month on timestamp (UTC bounds), one table per month
+# named audit_logs_YYYY_MM, plus audit_logs_default for anything outside them.
+#
+# ensure_partitions() creates the coming months ahead of time. It runs from init_db.py and
+# from the archive job/command, so a monthly cron of `python manage.py archive-audit` keeps
+# both ends of the table in shape. A month that's missing anyway lands in the default
+# partition, and its rows move into the monthly table when that is created.
+#
+# archive_partitions() handles retention: months older than AUDIT_RETENTION_MONTHS are
+# COPYed to gzipped CSV files in AUDIT_ARCHIVE_DIR, then detached and dropped. Dropping a
+# partition is instant and leaves nothing for vacuum, unlike DELETE on one big table.
+
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", 24))  # 0 keeps everything
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "audit-archive")
+MONTHS_AHEAD = 3
+
+# Serialises partition DDL between processes (7301 is posting.LEDGER_LOCK_NAMESPACE)
+PARTITION_LOCK_NAMESPACE = 7303
+
+PARTITION_NAME = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+def _bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+def _this_month() -> date:
+    today = datetime.now(timezone.utc).date()
+    return date(today.year, today.month, 1)
+
+def list_partitions(conn):
+    """Monthly partitions as {first day of month: table name}, oldest first."""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'audit_logs'::regclass"
+    )).scalars()
+    partitions = {}
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return dict(sorted(partitions.items()))
+
+def ensure_partitions(engine: Engine, months_ahead: int = MONTHS_AHEAD, log=print):
+    """Create monthly partitions from this month through `months_ahead` months on. Returns the names created."""
+    created = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:ns, 0)"), {"ns": PARTITION_LOCK_NAMESPACE})
+        conn.execute(text("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"))
+        existing = list_partitions(conn)
+        start = _this_month()
+        for n in range(months_ahead + 1):
+            month = _add_months(start, n)
+            if month in existing:
+                continue
+            name = f"audit_logs_{month:%Y_%m}"
+            lower, upper = _bound(month), _bound(_add_months(month, 1))
+            # Built detached and then attached, so rows that already fell into the default
+            # partition for this month can move across first (ATTACH refuses otherwise).
+            conn.execute(text(f"CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            conn.execute(text(
+                f"WITH moved AS (DELETE FROM audit_logs_default WHERE timestamp >= :lower AND timestamp < :upper RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), {"lower": lower, "upper": upper})
+            conn.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+            created.append(name)
+            log(f"Created audit log partition {name}")
+    return created
+
+def archive_partitions(engine: Engine, retention_months: int = AUDIT_RETENTION_MONTHS,
+                       archive_dir: str = AUDIT_ARCHIVE_DIR, log=print, progress=None):
+    """Export monthly partitions older than the retention window to gzipped CSV, then drop them.
+
+    Returns [{"partition", "rows", "file"}] for each month archived.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = _add_months(_this_month(), -retention_months)
+    with engine.connect() as conn:
+        expired = [(month, name) for month, name in list_partitions(conn).items() if month < cutoff]
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for i, (month, name) in enumerate(expired):
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:ns, 0)"), {"ns": PARTITION_LOCK_NAMESPACE})
+            # Nothing can write to the month while it is exported and dropped
+            conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+            # Write the file completely (and to disk) before the partition goes
+            with open(path + ".tmp", "wb") as raw:
+                with gzip.GzipFile(filename=f"{name}.csv", fileobj=raw, mode="wb") as gz:
+                    cursor = conn.connection.cursor()
+                    cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", gz)
+                    rows = cursor.rowcount
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(path + ".tmp", path)
+            conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        archived.append({"partition": name, "rows": rows, "file": path})
+        log(f"Archived {rows} audit log row(s) from {name} to {path}")
+        if progress:
+            progress(i + 1, len(expired))
+    return archived
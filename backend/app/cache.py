@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from datetime import date
+
+# Small in-process TTL caches.
+# Each uvicorn worker has its own copy, so invalidation only reaches the worker that
+# handled the write; the TTL bounds how stale another worker's copy can get.
+
+_MISSING = object()
+
+class TTLCache:
+    def __init__(self, ttl_seconds: float, maxsize: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                # Drop the entry closest to expiry
+                oldest = min(self._data, key=lambda k: self._data[k][0])
+                del self._data[oldest]
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def get_or_set(self, key, factory):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Dashboard figures: ("period", month, year) for month totals, ("balances",) for outstanding/cash/bank
+dashboard_cache = TTLCache(float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", 60)))
+
+# GST returns of ended periods: (kind, start, end) -> computed return (see gst_returns.py)
+gst_return_cache = TTLCache(float(os.getenv("GST_RETURN_CACHE_TTL_SECONDS", 3600)), maxsize=256)
+
+def invalidate_dashboard(*dates: date):
+    """Drop cached dashboard figures for the months of `dates`, plus the all-time balances,
+    and any cached GST return whose period contains one of `dates`. With no dates, every
+    cached GST return goes.
+
+    Call after the write has committed so a concurrent read can't re-cache the old figures.
+    """
+    for d in dates:
+        if d:
+            dashboard_cache.invalidate(("period", d.month, d.year))
+    dashboard_cache.invalidate(("balances",))
+
+    touched = [d for d in dates if d]
+    if not dates:
+        gst_return_cache.clear()
+    elif touched:
+        gst_return_cache.invalidate_where(lambda key: any(key[1] <= d < key[2] for d in touched))
+
+# Authenticated users by token subject (email), so get_current_user doesn't query users on
+# every request. Writes to users invalidate it on commit (see dependencies.py), but only in
+# the worker that made them: in other workers a deactivation or role change takes effect
+# when the entry expires, so revocation lags by up to AUTH_USER_CACHE_TTL_SECONDS there.
+user_cache = TTLCache(float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", 30)))
@@ -0,0 +1,201 @@
+from datetime import date, datetime
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+from . import models, periods
+from .posting import month_start
+
+# Period close (period_closes, report_snapshots).
+#
+# Closing a month freezes it: write paths call ensure_open() with every date they touch and
+# get a 409 for one in a closed month, so corrections go in as adjustments dated in an open
+# period. Months close in order from the first month with ledger activity and reopen from
+# the latest closed one, so the closed months are always everything up to the latest: the
+# cumulative reports (ledger_summary counts every row before the period's end plus opening
+# balances) and the running balances of a closed month can't be moved by a backdated write
+# or an opening-balance edit (ensure_opening_open). At close every registered report (see snapshot_kind) is computed once for the
+# month, and for its quarter and financial year once those are closed throughout, and
+# stored. Reads of a closed period then fetch one snapshot row instead of aggregating
+# sales, billing and ledger history.
+#
+# close_period() and reopen_period() hold period_closes in EXCLUSIVE mode, and every write
+# touching a past month holds it in SHARE mode from its check to its commit. A close therefore waits for writes in
+# flight, and writes wait for the close, so nothing lands in a month between its check and
+# the snapshot.
+
+SNAPSHOT_KINDS = {}
+
+def snapshot_kind(name: str):
+    """Register fn(db, start, end) -> report for [start, end), to be snapshotted at close."""
+    def register(fn):
+        SNAPSHOT_KINDS[name] = fn
+        return fn
+    return register
+
+def _label(month: date) -> str:
+    return month.strftime("%b %Y")
+
+def _months(start: date, end: date):
+    month = month_start(start)
+    while month < end:
+        yield month
+        month = periods.month_range(month.month, month.year)[1]
+
+def _spans(month: date):
+    # The month, its quarter and its financial year, as (start, end)
+    fy = periods.financial_year_of(month)
+    quarter = (month.month - periods.FY_START_MONTH) % 12 // 3 + 1
+    return [
+        periods.month_range(month.month, month.year),
+        periods.quarter_range(fy, quarter),
+        periods.financial_year_range(fy),
+    ]
+
+def _latest_closed(db: Session):
+    return db.execute(select(func.max(models.PeriodClose.month_start))).scalar()
+
+def closed_months(db: Session, dates):
+    """Month starts among `dates` that are closed: on or before the latest closed month, which
+    includes dates before the first ledger activity.
+
+    Only months before the current one can be closed, so writes dated this month or later
+    return straight away, without the lookup or the lock. Otherwise period_closes is taken
+    in SHARE mode first, so none of the months can close or reopen until the caller's
+    transaction ends.
+    """
+    current = month_start(date.today())
+    months = {month_start(d) for d in dates if d and d < current}
+    if not months:
+        return set()
+    db.execute(text("LOCK TABLE period_closes IN SHARE MODE"))
+    latest = _latest_closed(db)
+    return {month for month in months if latest and month <= latest}
+
+def ensure_open(db: Session, *dates):
+    """Reject a write touching any of `dates` (None allowed) if one falls in a closed month."""
+    closed = closed_months(db, dates)
+    if closed:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Period closed: {', '.join(_label(m) for m in sorted(closed))}. Record the correction as an adjustment in an open period."
+        )
+
+def ensure_opening_open(db: Session):
+    """Reject an opening-balance change once any month is closed: every closed period's
+    balances start from it."""
+    db.execute(text("LOCK TABLE period_closes IN SHARE MODE"))
+    latest = _latest_closed(db)
+    if latest:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Opening balances are part of every closed period (closed up to {_label(latest)}). Record the correction as an adjustment in an open period."
+        )
+
+def list_closed(db: Session):
+    return db.query(models.PeriodClose).order_by(models.PeriodClose.month_start.desc()).all()
+
+def _closed_throughout(db: Session, start: date, end: date) -> bool:
+    closed = db.execute(
+        select(func.count()).select_from(models.PeriodClose)
+        .where(periods.in_range(models.PeriodClose.month_start, start, end))
+    ).scalar()
+    return closed == len(list(_months(start, end)))
+
+def _take_snapshots(db: Session, start: date, end: date):
+    db.execute(insert(models.ReportSnapshot), [
+        {"kind": kind, "period_start": start, "period_end": end, "data": jsonable_encoder(compute(db, start, end))}
+        for kind, compute in SNAPSHOT_KINDS.items()
+    ])
+
+def close_period(db: Session, start: date, end: date, user_id: int):
+    """Close every open month in [start, end) and snapshot its reports, plus those of any quarter
+    or financial year now closed throughout. Returns the months closed. Caller commits.
+
+    Every month from the first with ledger activity up to `start` must already be closed (409).
+
+    Writes to past months wait while this runs, so close a year in a quiet moment.
+    """
+    if end > month_start(date.today()):
+        raise HTTPException(status_code=400, detail="Only months that have ended can be closed")
+
+    db.execute(text("LOCK TABLE period_closes IN EXCLUSIVE MODE"))
+    already = set(db.execute(
+        select(models.PeriodClose.month_start).where(periods.in_range(models.PeriodClose.month_start, start, end))
+    ).scalars())
+    months = [month for month in _months(start, end) if month not in already]
+    if not months:
+        return []
+
+    # Months close in order from the first with ledger activity (or the first already closed)
+    first = min(filter(None, [
+        db.execute(select(func.min(models.Ledger.transaction_date))).scalar(),
+        db.execute(select(func.min(models.PeriodClose.month_start))).scalar(),
+    ]), default=None)
+    first = first and month_start(first)
+    if first and first < months[0]:
+        earlier = set(db.execute(
+            select(models.PeriodClose.month_start).where(periods.in_range(models.PeriodClose.month_start, first, months[0]))
+        ).scalars())
+        still_open = [month for month in _months(first, months[0]) if month not in earlier]
+        if still_open:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Close {_label(still_open[0])} first: months close in order."
+            )
+
+    closed_at = datetime.utcnow()
+    db.execute(insert(models.PeriodClose), [
+        {"month_start": month, "closed_by": user_id, "closed_at": closed_at} for month in months
+    ])
+
+    spans = []
+    for month in months:
+        spans += [span for span in _spans(month) if span not in spans]
+    for span_start, span_end in spans:
+        if _closed_throughout(db, span_start, span_end):
+            _take_snapshots(db, span_start, span_end)
+    return months
+
+def reopen_period(db: Session, start: date, end: date):
+    """Reopen the closed months in [start, end) and drop every snapshot covering one of them.
+    Returns the months reopened. Caller commits.
+
+    No month from `end` on may be closed (409): months reopen from the latest closed one.
+    """
+    db.execute(text("LOCK TABLE period_closes IN EXCLUSIVE MODE"))
+    latest = _latest_closed(db)
+    if latest and latest >= end:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Reopen {_label(latest)} first: months reopen from the latest closed one."
+        )
+    months = db.execute(
+        delete(models.PeriodClose)
+        .where(periods.in_range(models.PeriodClose.month_start, start, end))
+        .returning(models.PeriodClose.month_start)
+    ).scalars().all()
+    for month in months:
+        month_end = periods.month_range(month.month, month.year)[1]
+        db.execute(delete(models.ReportSnapshot).where(
+            models.ReportSnapshot.period_start < month_end,
+            models.ReportSnapshot.period_end > month
+        ))
+    return sorted(months)
+
+def snapshot(db: Session, kind: str, start: date, end: date):
+    """The stored `kind` report for exactly [start, end), or None if the period isn't closed."""
+    if end > month_start(date.today()):
+        return None
+    return db.execute(select(models.ReportSnapshot.data).where(
+        models.ReportSnapshot.kind == kind,
+        models.ReportSnapshot.period_start == start,
+        models.ReportSnapshot.period_end == end
+    )).scalar()
+
+def report(db: Session, kind: str, start: date, end: date):
+    """The `kind` report for [start, end): from its snapshot when closed, computed otherwise."""
+    data = snapshot(db, kind, start, end)
+    if data is None:
+        data = SNAPSHOT_KINDS[kind](db, start, end)
+    return data
@@ -1,13 +1,35 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from . import auth, models, schemas, database
 from .database import get_db
+from .cache import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Drop cached users once a change to them commits. Invalidating at flush time would let a
+# concurrent request re-cache the old row before the commit lands. This reaches only this
+# process's cache; other workers see the change when their entry expires (see cache.py).
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.User):
+            session.info.setdefault("changed_user_emails", set()).add(obj.email)
+            history = inspect(obj).attrs.email.history
+            session.info["changed_user_emails"].update(e for e in history.deleted or () if e)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for email in session.info.pop("changed_user_emails", ()):
+        user_cache.invalidate(email)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_user_emails", None)
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -21,12 +43,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     token_data = schemas.TokenData(email=email, role=payload.get("role"))
     
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    user = user_cache.get(token_data.email)
+    if user is None:
+        # Short-lived session: the connection goes back to the pool before the handler runs,
+        # and the request's own session (get_db) only takes one if the handler queries.
+        # The detached User keeps its loaded columns, which is all handlers read.
+        with database.SessionLocal() as db:
+            user = db.query(models.User).filter(models.User.email == token_data.email).first()
+        if user is not None:
+            user_cache.set(token_data.email, user)
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+def get_current_active_user(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
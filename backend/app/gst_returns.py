@@ -0,0 +1,332 @@
+import json
+import os
+from datetime import date
+from sqlalchemy import func, select, case, and_, or_, cast, tuple_, text, String
+from sqlalchemy.orm import Session
+from . import models, periods, closing, money
+from .cache import gst_return_cache
+from .models import GSTType
+
+# GSTR-1 / GSTR-3B style returns computed from sales and billing.
+#
+# Every section comes out of a handful of grouped queries: outward supplies are classified
+# per invoice in SQL (B2B when the party has a GSTIN, B2CL when unregistered, inter-state
+# and over GST_B2CL_LIMIT, else B2CS) and then aggregated once with GROUPING SETS, giving
+# the B2CS, HSN, rate-wise, state-wise, 3.2 and total rows in a single scan (multi-line
+# invoices contribute a row per line, so the HSN summary goes by line). Invoice-level
+# B2B/B2CL lines are one more query, and input tax credit for 3B one more. Python only
+# reshapes the rows into the return layout (GSTN offline-tool field names).
+#
+# Closed periods are served from the snapshot taken at close (see closing.py). Returns for
+# other periods that have ended are cached in gst_return_cache; writes drop the cached
+# periods they touch through invalidate_dashboard().
+
+B2CL_LIMIT = float(os.getenv("GST_B2CL_LIMIT", 100000))  # invoice value above which B2C inter-state is B2CL
+
+# Process type -> HSN/SAC code for the HSN summary, e.g. {"dyeing": "998821"}; unmapped processes get ""
+HSN_CODES = json.loads(os.getenv("GST_HSN_CODES", "{}"))
+
+STATE_CODES = {
+    "jammu and kashmir": "01", "jammu & kashmir": "01", "himachal pradesh": "02", "punjab": "03",
+    "chandigarh": "04", "uttarakhand": "05", "haryana": "06", "delhi": "07", "rajasthan": "08",
+    "uttar pradesh": "09", "bihar": "10", "sikkim": "11", "arunachal pradesh": "12", "nagaland": "13",
+    "manipur": "14", "mizoram": "15", "tripura": "16", "meghalaya": "17", "assam": "18",
+    "west bengal": "19", "jharkhand": "20", "odisha": "21", "orissa": "21", "chhattisgarh": "22",
+    "madhya pradesh": "23", "gujarat": "24", "dadra and nagar haveli and daman and diu": "26",
+    "daman and diu": "26", "dadra and nagar haveli": "26", "maharashtra": "27", "karnataka": "29",
+    "goa": "30", "lakshadweep": "31", "kerala": "32", "tamil nadu": "33", "puducherry": "34",
+    "pondicherry": "34", "andaman and nicobar islands": "35", "andaman & nicobar islands": "35",
+    "telangana": "36", "andhra pradesh": "37", "ladakh": "38",
+}
+
+B2B = "B2B"
+B2CL = "B2CL"
+B2CS = "B2CS"
+
+# Columns of the classified-line subquery that the summary groups by, in GROUPING() order
+GROUP_COLUMNS = ("category", "gst_type", "pos", "rate", "process_type", "hsn")
+
+# Summary sections and the columns each groups by
+GROUPING_SETS = {
+    "total": (),
+    "b2cs": ("category", "gst_type", "pos", "rate"),
+    "unregistered_by_pos": ("category", "gst_type", "pos"),
+    "hsn": ("hsn", "process_type", "rate"),
+    "rate_wise": ("rate",),
+    "state_wise": ("pos",),
+}
+
+def _grouping_mask(columns) -> int:
+    # GROUPING(a, b, ...) sets the bit of every argument that is *not* grouped, leftmost highest
+    n = len(GROUP_COLUMNS)
+    return sum(1 << (n - 1 - i) for i, name in enumerate(GROUP_COLUMNS) if name not in columns)
+
+SECTION_BY_MASK = {_grouping_mask(columns): name for name, columns in GROUPING_SETS.items()}
+
+def _money(value) -> float:
+    return money.amount(value or 0.0)
+
+def _registered():
+    return and_(models.Company.gst_number.isnot(None), func.btrim(models.Company.gst_number) != "")
+
+def _place_of_supply():
+    # The party's GSTIN starts with its state code; unregistered parties go by their state name
+    by_name = case(STATE_CODES, value=func.lower(func.btrim(models.Company.state)), else_="")
+    return case((_registered(), func.substr(func.btrim(models.Company.gst_number), 1, 2)), else_=by_name)
+
+def _classified_sales(start: date, end: date):
+    """One row per sales invoice in [start, end) with its return category and place of supply."""
+    category = case(
+        (_registered(), B2B),
+        (and_(models.Sales.gst_type == GSTType.INTER_STATE, models.Sales.total_amount > B2CL_LIMIT), B2CL),
+        else_=B2CS
+    )
+    return select(
+        models.Sales.id,
+        models.Sales.invoice_number,
+        models.Sales.invoice_date,
+        models.Company.gst_number.label("gstin"),
+        models.Company.name.label("party_name"),
+        category.label("category"),
+        cast(models.Sales.gst_type, String).label("gst_type"),
+        _place_of_supply().label("pos"),
+        func.coalesce(models.Sales.gst_rate, 0.0).label("rate"),
+        func.coalesce(func.lower(cast(models.Sales.process_type, String)), "").label("process_type"),
+        func.coalesce(models.Sales.quantity, 0.0).label("quantity"),
+        func.coalesce(models.Sales.base_amount, 0.0).label("taxable_value"),
+        func.coalesce(models.Sales.igst_amount, 0.0).label("igst"),
+        func.coalesce(models.Sales.cgst_amount, 0.0).label("cgst"),
+        func.coalesce(models.Sales.sgst_amount, 0.0).label("sgst"),
+        func.coalesce(models.Sales.tcs_amount, 0.0).label("tcs_amount"),
+        func.coalesce(models.Sales.total_amount, 0.0).label("invoice_value"),
+    ).join(
+        models.Company, models.Company.id == models.Sales.company_id
+    ).where(
+        periods.in_range(models.Sales.invoice_date, start, end)
+    ).subquery()
+
+def _classified_lines(start: date, end: date):
+    """_classified_sales() with multi-line invoices split into their lines, so the HSN summary
+    sees each line's process and HSN code. Invoice value goes by line, with TCS on line 1,
+    so every section still adds up to the invoices' totals."""
+    s = _classified_sales(start, end)
+    line = models.InvoiceLine
+    single = line.id.is_(None)
+    line_value = line.total_amount + case((line.line_number == 1, s.c.tcs_amount), else_=0.0)
+    return select(
+        s.c.id, s.c.invoice_number, s.c.category, s.c.gst_type, s.c.pos, s.c.rate,
+        case((single, s.c.process_type), else_=func.coalesce(func.lower(cast(line.process_type, String)), "")).label("process_type"),
+        func.coalesce(line.hsn_code, "").label("hsn"),
+        case((single, s.c.quantity), else_=line.quantity).label("quantity"),
+        case((single, s.c.taxable_value), else_=line.base_amount).label("taxable_value"),
+        case((single, s.c.igst), else_=line.igst_amount).label("igst"),
+        case((single, s.c.cgst), else_=line.cgst_amount).label("cgst"),
+        case((single, s.c.sgst), else_=line.sgst_amount).label("sgst"),
+        case((single, s.c.invoice_value), else_=line_value).label("invoice_value"),
+    ).outerjoin(line, line.sales_id == s.c.id).subquery()
+
+def _outward_summary(db: Session, start: date, end: date):
+    """Every summary section in one scan: {section: [row mappings]}."""
+    s = _classified_lines(start, end)
+    group_columns = [s.c[name] for name in GROUP_COLUMNS]
+    sets = [tuple_(*[s.c[name] for name in columns]) if columns else text("()") for columns in GROUPING_SETS.values()]
+    rows = db.execute(
+        select(
+            func.grouping(*group_columns).label("mask"),
+            *group_columns,
+            func.count(s.c.id.distinct()).label("invoice_count"),
+            func.min(s.c.invoice_number).label("first_number"),
+            func.max(s.c.invoice_number).label("last_number"),
+            func.sum(s.c.quantity).label("quantity"),
+            func.sum(s.c.taxable_value).label("taxable_value"),
+            func.sum(s.c.igst).label("igst"),
+            func.sum(s.c.cgst).label("cgst"),
+            func.sum(s.c.sgst).label("sgst"),
+            func.sum(s.c.invoice_value).label("invoice_value"),
+        ).group_by(func.grouping_sets(*sets))
+    ).mappings().all()
+
+    sections = {name: [] for name in GROUPING_SETS}
+    for row in rows:
+        sections[SECTION_BY_MASK[row["mask"]]].append(row)
+    return sections
+
+def _invoice_lines(db: Session, start: date, end: date):
+    """Invoice-level B2B and B2CL rows, ordered as the return lists them."""
+    s = _classified_sales(start, end)
+    return db.execute(
+        select(s).where(s.c.category.in_([B2B, B2CL])).order_by(s.c.category, s.c.gstin, s.c.pos, s.c.invoice_date, s.c.id)
+    ).mappings().all()
+
+def _inward_totals(db: Session, start: date, end: date):
+    # Billing keeps GST as one amount; its gst_type says whether that was IGST or CGST + SGST
+    gst = func.coalesce(models.Billing.gst_amount, 0.0)
+    intra = models.Billing.gst_type == GSTType.INTRA_STATE
+    cgst, sgst = money.split_gst_sql(gst)
+    return db.execute(
+        select(
+            func.count().label("bill_count"),
+            func.coalesce(func.sum(models.Billing.base_amount), 0.0).label("taxable_value"),
+            func.coalesce(func.sum(case((models.Billing.gst_type == GSTType.INTER_STATE, gst), else_=0.0)), 0.0).label("igst"),
+            func.coalesce(func.sum(case((intra, cgst), else_=0.0)), 0.0).label("cgst"),
+            func.coalesce(func.sum(case((intra, sgst), else_=0.0)), 0.0).label("sgst"),
+        ).where(periods.in_range(models.Billing.bill_date, start, end))
+    ).mappings().one()
+
+def _supply_type(gst_type) -> str:
+    return "INTER" if gst_type == GSTType.INTER_STATE.name else "INTRA"
+
+def _tax(row, prefix=""):
+    return {
+        f"{prefix}txval": _money(row["taxable_value"]),
+        f"{prefix}iamt": _money(row["igst"]),
+        f"{prefix}camt": _money(row["cgst"]),
+        f"{prefix}samt": _money(row["sgst"]),
+        f"{prefix}csamt": 0.0,
+    }
+
+def _filing_period(start: date, end: date):
+    # GSTN's "fp" (MMYYYY) only exists for a single month
+    return start.strftime("%m%Y") if periods.month_range(start.month, start.year) == (start, end) else None
+
+def _has_ended(end: date) -> bool:
+    return end <= date.today().replace(day=1)
+
+def _cached(db: Session, kind: str, start: date, end: date, compute):
+    stored = closing.snapshot(db, kind, start, end)
+    if stored is not None:
+        return stored
+    if not _has_ended(end):
+        return compute()
+    return gst_return_cache.get_or_set((kind, start, end), compute)
+
+# --- GSTR-1 ---
+
+@closing.snapshot_kind("gstr1")
+def _gstr1_sections(db: Session, start: date, end: date):
+    summary = _outward_summary(db, start, end)
+    lines = _invoice_lines(db, start, end)
+
+    b2b = [{
+        "gstin": row["gstin"].strip(), "receiver_name": row["party_name"],
+        "invoice_number": row["invoice_number"], "invoice_date": row["invoice_date"].isoformat(),
+        "invoice_value": _money(row["invoice_value"]), "place_of_supply": row["pos"],
+        "reverse_charge": "N", "rate": row["rate"], "taxable_value": _money(row["taxable_value"]),
+        "igst": _money(row["igst"]), "cgst": _money(row["cgst"]), "sgst": _money(row["sgst"]), "cess": 0.0,
+    } for row in lines if row["category"] == B2B]
+    b2cl = [{
+        "invoice_number": row["invoice_number"], "invoice_date": row["invoice_date"].isoformat(),
+        "invoice_value": _money(row["invoice_value"]), "place_of_supply": row["pos"], "rate": row["rate"],
+        "taxable_value": _money(row["taxable_value"]), "igst": _money(row["igst"]), "cess": 0.0,
+    } for row in lines if row["category"] == B2CL]
+    b2cs = [{
+        "supply_type": _supply_type(row["gst_type"]), "place_of_supply": row["pos"], "rate": row["rate"],
+        "taxable_value": _money(row["taxable_value"]), "igst": _money(row["igst"]),
+        "cgst": _money(row["cgst"]), "sgst": _money(row["sgst"]), "cess": 0.0,
+    } for row in summary["b2cs"] if row["category"] == B2CS]
+    hsn = [{
+        "hsn": row["hsn"] or HSN_CODES.get(row["process_type"], ""), "description": row["process_type"],
+        "quantity": row["quantity"], "rate": row["rate"], "invoice_count": row["invoice_count"],
+        "total_value": _money(row["invoice_value"]), "taxable_value": _money(row["taxable_value"]),
+        "igst": _money(row["igst"]), "cgst": _money(row["cgst"]), "sgst": _money(row["sgst"]), "cess": 0.0,
+    } for row in summary["hsn"]]
+    rate_wise = [{
+        "rate": row["rate"], "invoice_count": row["invoice_count"], "taxable_value": _money(row["taxable_value"]),
+        "igst": _money(row["igst"]), "cgst": _money(row["cgst"]), "sgst": _money(row["sgst"]),
+        "total_value": _money(row["invoice_value"]),
+    } for row in summary["rate_wise"]]
+    state_wise = [{
+        "place_of_supply": row["pos"], "invoice_count": row["invoice_count"],
+        "taxable_value": _money(row["taxable_value"]), "igst": _money(row["igst"]),
+        "cgst": _money(row["cgst"]), "sgst": _money(row["sgst"]), "total_value": _money(row["invoice_value"]),
+    } for row in summary["state_wise"]]
+    documents = [{
+        "invoice_count": row["invoice_count"], "first_number": row["first_number"], "last_number": row["last_number"],
+    } for row in summary["total"] if row["invoice_count"]]
+
+    return {
+        "b2b": b2b, "b2cl": b2cl, "b2cs": b2cs, "hsn": hsn,
+        "rate_wise": rate_wise, "state_wise": state_wise, "documents": documents,
+    }
+
+GSTR1_SECTIONS = ("b2b", "b2cl", "b2cs", "hsn", "rate_wise", "state_wise", "documents")
+
+def gstr1_sections(db: Session, start: date, end: date):
+    """Flat GSTR-1 sections for [start, end): {section: [row dicts]}, for CSV export."""
+    return _cached(db, "gstr1", start, end, lambda: _gstr1_sections(db, start, end))
+
+def _gstn_invoice(row, with_split: bool):
+    item = {"txval": row["taxable_value"], "rt": row["rate"], "iamt": row["igst"], "csamt": 0.0}
+    if with_split:
+        item.update(camt=row["cgst"], samt=row["sgst"])
+    return {
+        "inum": row["invoice_number"],
+        "idt": date.fromisoformat(row["invoice_date"]).strftime("%d-%m-%Y"),
+        "val": row["invoice_value"],
+        "itms": [{"num": 1, "itm_det": item}],
+    }
+
+def gstr1(db: Session, start: date, end: date):
+    """GSTR-1 for [start, end) in the GSTN offline-tool layout, plus rate- and state-wise summaries."""
+    sections = gstr1_sections(db, start, end)
+
+    b2b = {}
+    for row in sections["b2b"]:
+        invoice = _gstn_invoice(row, with_split=True)
+        invoice.update(pos=row["place_of_supply"], rchrg=row["reverse_charge"], inv_typ="R")
+        b2b.setdefault(row["gstin"], []).append(invoice)
+    b2cl = {}
+    for row in sections["b2cl"]:
+        b2cl.setdefault(row["place_of_supply"], []).append(_gstn_invoice(row, with_split=False))
+
+    return {
+        "fp": _filing_period(start, end),
+        "b2b": [{"ctin": gstin, "inv": invoices} for gstin, invoices in b2b.items()],
+        "b2cl": [{"pos": pos, "inv": invoices} for pos, invoices in b2cl.items()],
+        "b2cs": [{
+            "sply_ty": row["supply_type"], "pos": row["place_of_supply"], "typ": "OE", "rt": row["rate"],
+            "txval": row["taxable_value"], "iamt": row["igst"], "camt": row["cgst"], "samt": row["sgst"], "csamt": 0.0,
+        } for row in sections["b2cs"]],
+        "hsn": {"data": [{
+            "num": i, "hsn_sc": row["hsn"], "desc": row["description"], "qty": row["quantity"], "rt": row["rate"],
+            "val": row["total_value"], "txval": row["taxable_value"], "iamt": row["igst"], "camt": row["cgst"],
+            "samt": row["sgst"], "csamt": 0.0,
+        } for i, row in enumerate(sections["hsn"], 1)]},
+        "summary": {
+            "rate_wise": sections["rate_wise"],
+            "state_wise": sections["state_wise"],
+            "documents": sections["documents"],
+        },
+    }
+
+# --- GSTR-3B ---
+
+@closing.snapshot_kind("gstr3b")
+def _gstr3b(db: Session, start: date, end: date):
+    summary = _outward_summary(db, start, end)
+    zero = {"taxable_value": 0.0, "igst": 0.0, "cgst": 0.0, "sgst": 0.0}
+    outward = summary["total"][0] if summary["total"] and summary["total"][0]["invoice_count"] else zero
+    itc = _inward_totals(db, start, end)
+
+    unregistered_inter = [
+        {"pos": row["pos"], "txval": _money(row["taxable_value"]), "iamt": _money(row["igst"])}
+        for row in summary["unregistered_by_pos"]
+        if row["category"] != B2B and row["gst_type"] == GSTType.INTER_STATE.name
+    ]
+    # Output tax less credit, per head; negative means credit carried forward
+    net = {head: _money((outward[head] or 0.0) - (itc[head] or 0.0)) for head in ("igst", "cgst", "sgst")}
+
+    return {
+        "fp": _filing_period(start, end),
+        "sup_details": {"osup_det": _tax(outward)},
+        "inter_sup": {"unreg_details": unregistered_inter},
+        "itc_elg": {
+            "itc_avl": [{"ty": "OTH", **{k: v for k, v in _tax(itc).items() if k != "txval"}}],
+            "itc_net": {k: v for k, v in _tax(itc).items() if k != "txval"},
+        },
+        "net_tax": {"iamt": net["igst"], "camt": net["cgst"], "samt": net["sgst"], "csamt": 0.0},
+    }
+
+def gstr3b(db: Session, start: date, end: date):
+    """GSTR-3B for [start, end): outward supplies (3.1a), inter-state B2C by state (3.2), ITC (4) and net tax."""
+    return _cached(db, "gstr3b", start, end, lambda: _gstr3b(db, start, end))
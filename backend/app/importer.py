@@ -0,0 +1,291 @@
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+import pandas as pd
+from sqlalchemy import insert as sa_insert, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import insert, ARRAY
+from sqlalchemy.orm import Session
+from . import models, audit, posting, rollups, invoice_numbers, closing, money
+from .models import ProcessType, GSTType, PaymentStatus, TransactionType
+
+# Staging and set-based import of spreadsheet data (companies + sales invoices).
+# An upload is parsed straight into import_rows under an import_batches id; confirming
+# the import only sends that id back, and the rows are bulk-loaded from staging.
+# Batches expire after IMPORT_STAGING_TTL_HOURS and are purged on the next upload.
+#
+# Round trips grow with the number of chunks, not rows: one multi-row insert creates the
+# missing companies, then the staged rows are read twice through a server-side cursor, a
+# chunk at a time. The first pass validates (one query per chunk for new company names and
+# one for the invoice numbers already taken); the second inserts the sales that passed as
+# a bulk insert per chunk, with their ledger debit rows and rollups. Only a chunk of rows
+# is in memory at once. Everything runs in the caller's transaction; nothing here commits.
+
+CHUNK_SIZE = 1000
+STAGING_TTL = timedelta(hours=float(os.getenv("IMPORT_STAGING_TTL_HOURS", 24)))
+
+COMPANY_COLUMNS = ['Party', 'party', 'Company', 'company', 'Customer', 'customer', 'Name', 'name']
+SALES_INDICATORS = ['Invoice No', 'invoice_no', 'Quantity', 'quantity', 'Rate', 'rate', 'Amount', 'amount']
+
+def _clean_name(value):
+    if value is None:
+        return None
+    name = str(value).strip()
+    return name or None
+
+def _row_company(row):
+    for col in COMPANY_COLUMNS:
+        if col in row and row[col]:
+            return _clean_name(row[col])
+    return None
+
+def _has_sales_data(row):
+    return any(key in SALES_INDICATORS and row[key] for key in row.keys())
+
+def _sale_values(row, index, company_id, user_id, import_id, default_date: date):
+    date_value = row.get("Date") or row.get("date")
+    quantity = float(row.get("Quantity") or row.get("quantity") or 0)
+    rate = float(row.get("Rate") or row.get("rate") or 0)
+    gst_rate = float(row.get("GST%") or row.get("gst_rate") or 0)
+
+    # Imported invoices are intra-state, so GST splits into CGST + SGST as in create_sale
+    amounts = money.sale_amounts(quantity, rate, gst_rate, GSTType.INTRA_STATE)
+    return {
+        # Rows without a number get the next ones from the invoice sequence at insert time
+        "invoice_number": _clean_name(row.get("Invoice No") or row.get("invoice_no")),
+        "invoice_date": pd.to_datetime(date_value).date() if date_value else default_date,
+        "company_id": company_id,
+        "quantity": quantity,
+        "rate": rate,
+        "gst_rate": gst_rate,
+        "gst_type": GSTType.INTRA_STATE,
+        **amounts,
+        "tcs_amount": 0.0,
+        "amount_paid": 0.0,
+        "payment_status": PaymentStatus.UNPAID,
+        "import_id": import_id,
+        "created_by": user_id,
+    }
+
+def load_company_ids(db: Session, names):
+    if not names:
+        return {}
+    rows = db.query(models.Company.name, models.Company.id).filter(models.Company.name.in_(list(names))).all()
+    return dict(rows)
+
+def create_companies(db: Session, names, user_id: int):
+    """Insert companies that don't exist yet in one statement; returns {name: id} for the new ones."""
+    if not names:
+        return {}
+    stmt = insert(models.Company).values([
+        {"name": name, "process_type": ProcessType.OTHER, "is_active": True}
+        for name in sorted(names)
+    ]).on_conflict_do_nothing(index_elements=["name"]).returning(models.Company.name, models.Company.id)
+    created = dict(db.execute(stmt).all())
+
+    audit.record_many(db, user_id, "create", "companies", [
+        (company_id, {"name": name, "source": "excel_import"}) for name, company_id in created.items()
+    ])
+    return created
+
+def _candidates(db: Session, chunk, first_index: int, company_ids: dict, user_id: int, import_id, default_date: date, errors):
+    """[(index, values)] for the chunk's sales rows that pass the row checks; errors for the
+    rest go on `errors`. Company ids the chunk names are looked up as they turn up."""
+    names = {name for name in (_row_company(row) for row in chunk) if name}
+    company_ids.update(load_company_ids(db, names - set(company_ids)))
+
+    candidates = []
+    for index, row in enumerate(chunk, first_index):
+        company_name = _row_company(row)
+        if not company_name:
+            # Skip rows without company name silently (might be empty rows)
+            continue
+        company_id = company_ids.get(company_name)
+        if company_id is None:
+            errors.append(f"Row {index + 1}: Company '{company_name}' not found")
+            continue
+        # Rows without sales columns are company-only rows
+        if not _has_sales_data(row):
+            continue
+        try:
+            candidates.append((index, _sale_values(row, index, company_id, user_id, import_id, default_date)))
+        except Exception as e:
+            errors.append(f"Row {index + 1}: {str(e)}")
+
+    # Rows dated in a closed month are refused, like any other bad row
+    closed = closing.closed_months(db, [values["invoice_date"] for _, values in candidates])
+    if closed:
+        for index, values in candidates:
+            if posting.month_start(values["invoice_date"]) in closed:
+                errors.append(f"Row {index + 1}: {values['invoice_date'].strftime('%b %Y')} is closed")
+        candidates = [(index, values) for index, values in candidates if posting.month_start(values["invoice_date"]) not in closed]
+    return candidates
+
+def import_data(db: Session, companies, read_rows, user_id: int, chunk_size: int = CHUNK_SIZE, progress=None, import_id=None):
+    """Import confirmed upload data: create the listed companies, then insert the sales rows.
+
+    `read_rows()` returns the rows, in order, as an iterable of chunks. It is called twice,
+    once to validate every row and once to insert the ones that passed, so only a chunk of
+    rows is in memory at a time. `progress(done, total)` is called after each chunk of
+    sales. Sales are tagged with `import_id`, so a bad import can be deleted as a whole.
+    Rows without a date are dated the day the import started, in both passes.
+    Returns counts and per-row errors; rows with errors are skipped, the rest go in together.
+    """
+    errors = []
+    # Taken once, so a job running past midnight validates and inserts undated rows alike
+    default_date = date.today()
+
+    listed = {name for name in (_clean_name(c) for c in companies or []) if name}
+    company_ids = load_company_ids(db, listed)
+    created = create_companies(db, listed - set(company_ids), user_id)
+    company_ids.update(created)
+
+    # First pass: validate. Only the indexes of the rows that go in, their companies and the
+    # invoice numbers they bring are kept.
+    accepted, companies_used, numbers = set(), set(), set()
+    first_index = 0
+    for chunk in read_rows():
+        candidates = _candidates(db, chunk, first_index, company_ids, user_id, import_id, default_date, errors)
+        first_index += len(chunk)
+
+        new_numbers = list({values["invoice_number"] for _, values in candidates if values["invoice_number"]} - numbers)
+        taken = set()
+        if new_numbers:
+            # Passed as one array parameter so the statement stays small however many rows there are
+            taken = {n for (n,) in db.query(models.Sales.invoice_number).filter(
+                models.Sales.invoice_number == any_(bindparam("numbers", new_numbers, type_=ARRAY(String)))
+            )}
+        for index, values in candidates:
+            number = values["invoice_number"]
+            if number is not None and (number in taken or number in numbers):
+                errors.append(f"Row {index + 1}: Duplicate Invoice {number}")
+                continue
+            if number is not None:
+                numbers.add(number)
+            accepted.add(index)
+            companies_used.add(values["company_id"])
+
+    # One lock up front for every company touched, so chunks can't deadlock with other postings
+    posting.lock_companies(db, *companies_used)
+
+    # Numbers are taken last, after validation, because the counter rows stay locked until
+    # the import commits. Counters first move past every number the file brings, so the
+    # bulk reservations made per chunk below for rows without one can't collide with them.
+    invoice_numbers.observe(db, numbers)
+
+    # Second pass: insert the accepted rows chunk by chunk, with their ledger rows and rollups
+    pending = {}
+    done = 0
+    first_index = 0
+    for rows in read_rows():
+        chunk = [
+            _sale_values(row, index, company_ids[_row_company(row)], user_id, import_id, default_date)
+            for index, row in enumerate(rows, first_index) if index in accepted
+        ]
+        first_index += len(rows)
+        if not chunk:
+            continue
+        unnumbered = [values for values in chunk if values["invoice_number"] is None]
+        for values, number in zip(unnumbered, invoice_numbers.reserve_many(db, [v["invoice_date"] for v in unnumbered])):
+            values["invoice_number"] = number
+
+        ids = dict(db.execute(
+            sa_insert(models.Sales).returning(models.Sales.invoice_number, models.Sales.id),
+            chunk
+        ).all())
+
+        posting.insert_entries(db, [
+            {
+                "company_id": values["company_id"],
+                "transaction_date": values["invoice_date"],
+                "transaction_type": TransactionType.SALE,
+                "reference_id": ids[values["invoice_number"]],
+                "reference_model": "Sales",
+                "debit_amount": values["total_amount"],
+                "credit_amount": 0.0,
+                "narration": f"invoice #{values['invoice_number']} - ",
+            }
+            for values in chunk
+        ], pending)
+        rollups.add_many(db, [rollups.sale_entry(models.Sales(**values)) for values in chunk])
+
+        done += len(chunk)
+        if progress:
+            progress(done, len(accepted))
+
+    posting.post_pending(db, pending)
+
+    return {
+        "imported_count": len(accepted),
+        "companies_created": len(created),
+        "errors": errors,
+    }
+
+def purge_expired(db: Session):
+    """Delete expired batches (their rows go with them via ON DELETE CASCADE)."""
+    return db.query(models.ImportBatch).filter(
+        models.ImportBatch.expires_at < datetime.now(timezone.utc)
+    ).delete(synchronize_session=False)
+
+def create_batch(db: Session, filename: str, user_id: int):
+    batch = models.ImportBatch(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        created_by=user_id,
+        expires_at=datetime.now(timezone.utc) + STAGING_TTL
+    )
+    db.add(batch)
+    db.flush()
+    return batch
+
+def stage_rows(db: Session, batch: models.ImportBatch, rows, chunk_size: int = CHUNK_SIZE):
+    """Pass `rows` through unchanged while bulk-inserting them into import_rows in chunks."""
+    buffer = []
+    index = 0
+    for row in rows:
+        buffer.append({"batch_id": batch.id, "row_index": index, "data": jsonable_encoder(row)})
+        index += 1
+        if len(buffer) >= chunk_size:
+            db.execute(sa_insert(models.ImportRow), buffer)
+            buffer = []
+        yield row
+    if buffer:
+        db.execute(sa_insert(models.ImportRow), buffer)
+    batch.row_count = index
+
+def get_batch(db: Session, import_id: str, user_id: int, lock: bool = False):
+    """The caller's unexpired batch, or None. With lock=True a second import of the same
+    batch waits for the first and then finds it gone."""
+    query = db.query(models.ImportBatch).filter(
+        models.ImportBatch.id == import_id,
+        models.ImportBatch.created_by == user_id,
+        models.ImportBatch.expires_at >= datetime.now(timezone.utc)
+    )
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+def _staged_chunks(db: Session, batch_id: str, chunk_size: int):
+    """A batch's staged rows in row_index order, chunk_size at a time, from a server-side cursor."""
+    chunk = []
+    for (data,) in (
+        db.query(models.ImportRow.data)
+        .filter(models.ImportRow.batch_id == batch_id)
+        .order_by(models.ImportRow.row_index)
+        .yield_per(chunk_size)
+    ):
+        chunk.append(data)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_batch(db: Session, batch: models.ImportBatch, user_id: int, chunk_size: int = CHUNK_SIZE, progress=None):
+    """Import a staged batch and drop it from staging, in the caller's transaction."""
+    result = import_data(
+        db, batch.companies, lambda: _staged_chunks(db, batch.id, chunk_size), user_id,
+        chunk_size=chunk_size, progress=progress, import_id=batch.id
+    )
+    db.delete(batch)
+    return result
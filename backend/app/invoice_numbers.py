@@ -0,0 +1,147 @@
+import os
+import re
+import string
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import select, update, func, cast, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import models
+
+# Sales invoice numbers come from per-scope counters in invoice_counters.
+#
+# INVOICE_NUMBER_FORMAT is a str.format template with a {seq} field (any integer format
+# spec, e.g. {seq:04d}) and optionally {year}, {month} (two digits) and {fy}, the Indian
+# financial year April-March written "2024-25". The template minus {seq} is the scope:
+# "SK/{fy}/{seq:05d}" numbers each financial year from 1.
+#
+# Taking a number is a single UPDATE ... RETURNING on the scope's row. That row stays
+# locked until the invoice's transaction commits, so numbers are issued in commit order
+# with no gaps (a rollback hands its number back), concurrent invoices in other scopes
+# don't wait at all, and the cost is the same on day one and after a million invoices.
+# A native sequence would not wait even within a scope, but loses numbers on every
+# rollback, and GST invoice series should be consecutive.
+
+INVOICE_NUMBER_FORMAT = os.getenv("INVOICE_NUMBER_FORMAT", "SK/{year}/{seq:04d}")
+
+FIELD_PATTERNS = {
+    "year": r"\d{4}",
+    "month": r"\d{2}",
+    "fy": r"\d{4}-\d{2}",
+}
+
+def financial_year(d: date) -> str:
+    start = d.year if d.month >= 4 else d.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+class InvoiceFormat:
+    def __init__(self, template: str):
+        self.template = template
+        scope_parts, pattern_parts, seq_fields = [], ["^"], 0
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            scope_parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            pattern_parts.append(re.escape(literal))
+            if field is None:
+                continue
+            if field == "seq":
+                seq_fields += 1
+                scope_parts.append("#")
+                pattern_parts.append(r"(?P<seq>\d+)")
+            elif field in FIELD_PATTERNS and not spec and not conversion:
+                scope_parts.append("{" + field + "}")
+                pattern_parts.append(FIELD_PATTERNS[field])
+            else:
+                raise ValueError(f"Invoice number format {template!r}: unsupported field {{{field}}}")
+        if seq_fields != 1:
+            raise ValueError(f"Invoice number format {template!r} needs exactly one {{seq}} field")
+        self.scope_template = "".join(scope_parts)
+        self.pattern = re.compile("".join(pattern_parts) + "$")
+
+    def _fields(self, d: date):
+        return {"year": d.year, "month": f"{d.month:02d}", "fy": financial_year(d)}
+
+    def scope(self, d: date) -> str:
+        return self.scope_template.format(**self._fields(d))
+
+    def number(self, d: date, seq: int) -> str:
+        return self.template.format(seq=seq, **self._fields(d))
+
+    def parse(self, number: str):
+        """(scope, seq) for a number in this format, else None."""
+        match = self.pattern.match(number or "")
+        if not match:
+            return None
+        return number[:match.start("seq")] + "#" + number[match.end("seq"):], int(match.group("seq"))
+
+default_format = InvoiceFormat(INVOICE_NUMBER_FORMAT)
+
+def _existing_max(db: Session, scope: str) -> int:
+    # Highest number already used in the scope, e.g. by invoices from before the counter existed
+    prefix, suffix = scope.split("#", 1)
+    pattern = "^" + re.escape(prefix) + r"(\d+)" + re.escape(suffix) + "$"
+    return db.execute(
+        select(func.max(cast(func.substring(models.Sales.invoice_number, pattern), Integer)))
+        .where(models.Sales.invoice_number.regexp_match(pattern))
+    ).scalar() or 0
+
+def _ensure_counter(db: Session, scope: str):
+    db.execute(
+        insert(models.InvoiceCounter)
+        .values(scope=scope, last_value=_existing_max(db, scope))
+        .on_conflict_do_nothing(index_elements=["scope"])
+    )
+
+def _advance(db: Session, scope: str, count: int):
+    return db.execute(
+        update(models.InvoiceCounter)
+        .where(models.InvoiceCounter.scope == scope)
+        .values(last_value=models.InvoiceCounter.last_value + count)
+        .returning(models.InvoiceCounter.last_value)
+    ).scalar()
+
+def reserve(db: Session, invoice_date: date, count: int = 1, fmt: InvoiceFormat = default_format):
+    """Take the next `count` consecutive invoice numbers for `invoice_date`'s scope.
+
+    Runs in the caller's transaction; the numbers are only used up if it commits.
+    """
+    scope = fmt.scope(invoice_date)
+    last = _advance(db, scope, count)
+    if last is None:
+        # First invoice in this scope: start after whatever the sales table already has
+        _ensure_counter(db, scope)
+        last = _advance(db, scope, count)
+    return [fmt.number(invoice_date, seq) for seq in range(last - count + 1, last + 1)]
+
+def next_number(db: Session, invoice_date: date, fmt: InvoiceFormat = default_format) -> str:
+    return reserve(db, invoice_date, 1, fmt)[0]
+
+def reserve_many(db: Session, invoice_dates, fmt: InvoiceFormat = default_format):
+    """One number per date, in order, with one counter update per scope rather than per invoice."""
+    by_scope = defaultdict(list)
+    for i, d in enumerate(invoice_dates):
+        by_scope[fmt.scope(d)].append(i)
+    numbers = [None] * len(invoice_dates)
+    # Scopes in a fixed order, so two bulk reservations can't deadlock on each other's rows
+    for scope in sorted(by_scope):
+        positions = by_scope[scope]
+        # Dates that share a scope render identically apart from {seq}
+        reserved = reserve(db, invoice_dates[positions[0]], len(positions), fmt)
+        for position, number in zip(positions, reserved):
+            numbers[position] = number
+    return numbers
+
+def observe(db: Session, numbers, fmt: InvoiceFormat = default_format):
+    """Move counters past numbers that were assigned elsewhere (e.g. imported as-is), so they aren't issued again."""
+    highest = {}
+    for number in numbers:
+        parsed = fmt.parse(number)
+        if parsed:
+            scope, seq = parsed
+            highest[scope] = max(seq, highest.get(scope, 0))
+    for scope in sorted(highest):
+        _ensure_counter(db, scope)
+        db.execute(
+            update(models.InvoiceCounter)
+            .where(models.InvoiceCounter.scope == scope, models.InvoiceCounter.last_value < highest[scope])
+            .values(last_value=highest[scope])
+        )
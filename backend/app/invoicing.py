@@ -0,0 +1,366 @@
+from sqlalchemy import insert, delete, select, union, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from . import models, schemas, audit, posting, rollups, invoice_numbers, closing, money
+from .models import TransactionType
+
+# Amounts for new sales invoices and purchase bills, bulk creation of either
+# (POST /sales/bulk, /billing/bulk), and set-based deletion.
+#
+# A bulk request costs a fixed number of round trips however many documents it holds:
+# one query checks every company, one counter update per scope reserves the invoice
+# numbers, and the documents, invoice lines, auto-payments, ledger rows and audit entries
+# each go in as one multi-row insert. Ledger rows are posted with one balance delta and one set-based
+# repair per company, as in imports. Items that fail validation are reported and
+# skipped; the rest go in together in the caller's transaction. Nothing here commits.
+#
+# A multi-line invoice's lines are priced in one pass (money.invoice_amounts) and its
+# header holds their sums, so everything that reads sales keeps reading one row per invoice.
+#
+# Deletes take a list of document IDs and remove payment ledger rows, document ledger
+# rows, payments, documents (invoice lines go by ON DELETE CASCADE), rollup amounts and write audit entries in a fixed number of
+# statements, whether that's one invoice or a thousand. Larger selections (POST
+# /sales/bulk-delete, /billing/bulk-delete) go through a background job in chunks of
+# DELETE_CHUNK_SIZE.
+
+MAX_BULK_ITEMS = 1000
+DELETE_CHUNK_SIZE = 1000
+
+def sale_values(sale: schemas.SalesCreate, user_id: int):
+    """Column values for a new sales invoice (everything except its number) and for its
+    lines, which are [] for a single-line invoice."""
+    values = sale.dict(exclude={"lines"})
+    lines = []
+    if sale.lines:
+        lines, amounts = line_values([line.dict() for line in sale.lines], sale.gst_rate, sale.gst_type, sale.tcs_amount, sale.amount_paid)
+        values.update(amounts)
+        values["process_type"] = values["process_type"] or lines[0]["process_type"]
+    else:
+        values.update(money.sale_amounts(
+            sale.quantity, sale.rate, sale.gst_rate, sale.gst_type, sale.tcs_amount, sale.amount_paid
+        ))
+    values["created_by"] = user_id
+    return values, lines
+
+def line_values(lines, gst_rate, gst_type, tcs_amount, amount_paid):
+    """Column values for the lines of a multi-line invoice (dicts of InvoiceLineCreate fields,
+    numbered from 1 in order) and the header amounts they add up to."""
+    amounts, header = money.invoice_amounts(
+        [(line["quantity"], line["rate"]) for line in lines], gst_rate, gst_type, tcs_amount, amount_paid
+    )
+    return [
+        {**line, "line_number": number, **line_amounts}
+        for number, (line, line_amounts) in enumerate(zip(lines, amounts), 1)
+    ], header
+
+def insert_lines(db: Session, lines_by_sale):
+    """Insert the lines of any number of invoices, given as [(sales_id, line values)], in one
+    multi-row insert."""
+    rows = [{"sales_id": sales_id, **line} for sales_id, lines in lines_by_sale for line in lines]
+    if rows:
+        db.execute(insert(models.InvoiceLine), rows)
+
+def replace_lines(db: Session, sales_id: int, lines):
+    db.execute(
+        delete(models.InvoiceLine).where(models.InvoiceLine.sales_id == sales_id)
+        .execution_options(synchronize_session=False)
+    )
+    insert_lines(db, [(sales_id, lines)])
+
+def bill_values(bill: schemas.BillingCreate, user_id: int) -> dict:
+    """Column values for a new purchase bill."""
+    values = bill.dict()
+    values.update(money.bill_amounts(
+        bill.quantity, bill.rate, bill.gst_rate, bill.tds_applicable, bill.tds_rate, bill.amount_paid
+    ))
+    values["created_by"] = user_id
+    return values
+
+def move_payments(db: Session, link_field: str, document_id: int, company_id: int):
+    """Move the payments linked to a document (link_field is sales_id or billing_id), and
+    their ledger rows, to the document's new party. Each payment keeps its own date, which
+    must be open."""
+    payments = db.query(models.Payment).filter(
+        getattr(models.Payment, link_field) == document_id,
+        models.Payment.company_id != company_id
+    ).all()
+    if not payments:
+        return
+    closing.ensure_open(db, *[payment.payment_date for payment in payments])
+    ledger_rows = db.query(models.Ledger).filter(
+        models.Ledger.reference_model == "Payment",
+        models.Ledger.reference_id.in_([payment.id for payment in payments])
+    ).all()
+    for payment in payments:
+        payment.company_id = company_id
+    for row in ledger_rows:
+        posting.update_entry(db, row, company_id=company_id)
+
+def _id_array(name: str, ids):
+    # One array parameter, as in the importer, so the statement doesn't grow with the batch
+    return any_(bindparam(name, list(ids), type_=ARRAY(Integer)))
+
+def _existing_companies(db: Session, company_ids):
+    if not company_ids:
+        return set()
+    return {company_id for (company_id,) in db.query(models.Company.id).filter(
+        models.Company.id == _id_array("company_ids", company_ids)
+    )}
+
+def _validate(db: Session, items, company_field: str, date_field: str, not_found: str):
+    """Split items into [(index, item)] to create and per-item error results."""
+    existing = _existing_companies(db, {getattr(item, company_field) for item in items})
+    closed = closing.closed_months(db, [d for item in items for d in (getattr(item, date_field), item.payment_date)])
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        dated = [d for d in (getattr(item, date_field), item.payment_date) if d]
+        if getattr(item, company_field) not in existing:
+            errors.append({"index": index, "success": False, "error": not_found})
+        elif any(posting.month_start(d) in closed for d in dated):
+            errors.append({"index": index, "success": False, "error": "Period closed"})
+        else:
+            valid.append((index, item))
+    return valid, errors
+
+def _insert_returning_ids(db: Session, model, rows):
+    # sort_by_parameter_order keeps RETURNING in step with `rows` under insertmanyvalues
+    if not rows:
+        return []
+    return list(db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows).scalars())
+
+def _auto_payments(db: Session, documents, payment_type: TransactionType, link_field: str, notes: str, user_id: int):
+    """Insert the auto-created payments for documents with amount_paid > 0.
+
+    `documents` is [(document_id, values, company_id, document_date)]; returns
+    [(payment_id, payment_values)].
+    """
+    rows = [
+        {
+            "payment_date": values["payment_date"] or document_date,
+            "payment_type": payment_type,
+            "company_id": company_id,
+            link_field: document_id,
+            "amount": values["amount_paid"],
+            "payment_mode": values["payment_mode"],
+            "notes": notes,
+            "created_by": user_id,
+        }
+        for document_id, values, company_id, document_date in documents
+        if values["amount_paid"] > 0
+    ]
+    return list(zip(_insert_returning_ids(db, models.Payment, rows), rows))
+
+def _result(index, document_id, values, **extra):
+    return {"index": index, "success": True, "id": document_id, "total_amount": values["total_amount"], **extra}
+
+def create_sales(db: Session, items, user_id: int):
+    """Create sales invoices in bulk. Returns one result per item, in request order."""
+    valid, results = _validate(db, items, "company_id", "invoice_date", "Company not found")
+    if not valid:
+        return results
+
+    # Company locks before the counter rows, the same order as create_sale and imports
+    posting.lock_companies(db, *{item.company_id for _, item in valid})
+    numbers = invoice_numbers.reserve_many(db, [item.invoice_date for _, item in valid])
+
+    rows, lines = [], []
+    for (_, item), number in zip(valid, numbers):
+        values, item_lines = sale_values(item, user_id)
+        values["invoice_number"] = number
+        rows.append(values)
+        lines.append(item_lines)
+    ids = _insert_returning_ids(db, models.Sales, rows)
+    insert_lines(db, list(zip(ids, lines)))
+
+    ledger_rows = [
+        {
+            "company_id": values["company_id"],
+            "transaction_date": values["invoice_date"],
+            "transaction_type": TransactionType.SALE,
+            "reference_id": sale_id,
+            "reference_model": "Sales",
+            "debit_amount": values["total_amount"],
+            "credit_amount": 0.0,
+            "narration": f"invoice #{values['invoice_number']} - {values['item_description'] or ''}",
+        }
+        for sale_id, values in zip(ids, rows)
+    ]
+    invoice_for = dict(zip(ids, rows))
+    payments = _auto_payments(
+        db,
+        [(sale_id, values, values["company_id"], values["invoice_date"]) for sale_id, values in zip(ids, rows)],
+        TransactionType.RECEIPT, "sales_id", "Auto-created from Sales bulk entry", user_id
+    )
+    ledger_rows += [
+        {
+            "company_id": payment["company_id"],
+            "transaction_date": payment["payment_date"],
+            "transaction_type": TransactionType.RECEIPT,
+            "reference_id": payment_id,
+            "reference_model": "Payment",
+            "debit_amount": 0.0,
+            "credit_amount": payment["amount"],
+            "narration": f"Payment for Invoice #{invoice_for[payment['sales_id']]['invoice_number']}",
+        }
+        for payment_id, payment in payments
+    ]
+
+    pending = {}
+    posting.insert_entries(db, ledger_rows, pending)
+    posting.post_pending(db, pending)
+    rollups.add_many(db, [rollups.sale_entry(models.Sales(**values)) for values in rows])
+    audit.record_many(db, user_id, "create", "sales", [
+        (sale_id, {**values, "lines": item_lines} if item_lines else values)
+        for sale_id, values, item_lines in zip(ids, rows, lines)
+    ])
+
+    results += [
+        _result(index, sale_id, values, invoice_number=values["invoice_number"])
+        for (index, _), sale_id, values in zip(valid, ids, rows)
+    ]
+    return sorted(results, key=lambda result: result["index"])
+
+def create_bills(db: Session, items, user_id: int):
+    """Create purchase bills in bulk. Returns one result per item, in request order."""
+    valid, results = _validate(db, items, "vendor_id", "bill_date", "Vendor not found")
+    if not valid:
+        return results
+
+    posting.lock_companies(db, *{item.vendor_id for _, item in valid})
+
+    rows = [bill_values(item, user_id) for _, item in valid]
+    ids = _insert_returning_ids(db, models.Billing, rows)
+
+    # A bill is owed to the vendor, so its ledger row is a credit and its payment a debit
+    ledger_rows = [
+        {
+            "company_id": values["vendor_id"],
+            "transaction_date": values["bill_date"],
+            "transaction_type": TransactionType.PURCHASE,
+            "reference_id": bill_id,
+            "reference_model": "Billing",
+            "debit_amount": 0.0,
+            "credit_amount": values["total_amount"],
+            "narration": f"Bill #{values['bill_number']} - {values['item_description'] or ''}",
+        }
+        for bill_id, values in zip(ids, rows)
+    ]
+    bill_for = dict(zip(ids, rows))
+    payments = _auto_payments(
+        db,
+        [(bill_id, values, values["vendor_id"], values["bill_date"]) for bill_id, values in zip(ids, rows)],
+        TransactionType.PAYMENT, "billing_id", "Auto-created from Billing bulk entry", user_id
+    )
+    ledger_rows += [
+        {
+            "company_id": payment["company_id"],
+            "transaction_date": payment["payment_date"],
+            "transaction_type": TransactionType.PAYMENT,
+            "reference_id": payment_id,
+            "reference_model": "Payment",
+            "debit_amount": payment["amount"],
+            "credit_amount": 0.0,
+            "narration": f"Payment for Bill #{bill_for[payment['billing_id']]['bill_number']}",
+        }
+        for payment_id, payment in payments
+    ]
+
+    pending = {}
+    posting.insert_entries(db, ledger_rows, pending)
+    posting.post_pending(db, pending)
+    rollups.add_many(db, [rollups.bill_entry(models.Billing(**values)) for values in rows])
+    audit.record_many(db, user_id, "create", "billing", list(zip(ids, rows)))
+
+    results += [
+        _result(index, bill_id, values, bill_number=values["bill_number"])
+        for (index, _), bill_id, values in zip(valid, ids, rows)
+    ]
+    return sorted(results, key=lambda result: result["index"])
+
+# --- Deletion ---
+
+def sales_criteria(selection: schemas.SalesDeleteFilter):
+    criteria = []
+    if selection.start_date:
+        criteria.append(models.Sales.invoice_date >= selection.start_date)
+    if selection.end_date:
+        criteria.append(models.Sales.invoice_date <= selection.end_date)
+    if selection.company_id:
+        criteria.append(models.Sales.company_id == selection.company_id)
+    if selection.import_id:
+        criteria.append(models.Sales.import_id == selection.import_id)
+    return criteria
+
+def bill_criteria(selection: schemas.BillingDeleteFilter):
+    criteria = []
+    if selection.start_date:
+        criteria.append(models.Billing.bill_date >= selection.start_date)
+    if selection.end_date:
+        criteria.append(models.Billing.bill_date <= selection.end_date)
+    if selection.vendor_id:
+        criteria.append(models.Billing.vendor_id == selection.vendor_id)
+    return criteria
+
+def _delete_documents(db: Session, model, company_column, date_column, link_field: str, reference_model: str, ids):
+    """Delete documents by ID with everything hanging off them. Returns the deleted rows."""
+    if not ids:
+        return []
+    selected = _id_array("document_ids", ids)
+    payment_link = getattr(models.Payment, link_field)
+
+    # Nothing goes if a document or one of its payments is dated in a closed month
+    closing.ensure_open(db, *db.execute(union(
+        select(date_column).where(model.id == selected),
+        select(models.Payment.payment_date).where(payment_link == selected)
+    )).scalars())
+
+    # Every company touched, locked once in sorted order before any ledger row goes
+    companies = db.execute(union(
+        select(company_column).where(model.id == selected),
+        select(models.Payment.company_id).where(payment_link == selected)
+    )).scalars().all()
+    posting.lock_companies(db, *[company_id for company_id in companies if company_id is not None])
+
+    posting.delete_entries(
+        db,
+        models.Ledger.reference_model == "Payment",
+        models.Ledger.reference_id.in_(select(models.Payment.id).where(payment_link == selected))
+    )
+    posting.delete_entries(
+        db,
+        models.Ledger.reference_model == reference_model,
+        models.Ledger.reference_id == selected
+    )
+    db.execute(
+        delete(models.Payment).where(payment_link == selected)
+        .execution_options(synchronize_session=False)
+    )
+    # RETURNING gives the values actually deleted, so the rollups come off exactly what was there
+    return db.execute(
+        delete(model).where(model.id == selected)
+        .returning(*[column for column in model.__table__.columns])
+        .execution_options(synchronize_session=False)
+    ).mappings().all()
+
+def delete_sales(db: Session, sale_ids, user_id: int):
+    """Delete sales invoices with their payments and ledger rows. Returns the deleted invoice dates."""
+    deleted = _delete_documents(db, models.Sales, models.Sales.company_id, models.Sales.invoice_date, "sales_id", "Sales", sale_ids)
+    rollups.remove_many(db, [rollups.sale_entry(models.Sales(**row)) for row in deleted])
+    audit.record_many(db, user_id, "delete", "sales", [(row["id"], None) for row in deleted])
+    return [row["invoice_date"] for row in deleted]
+
+def delete_bills(db: Session, bill_ids, user_id: int):
+    """Delete purchase bills with their payments and ledger rows. Returns the deleted bill dates."""
+    deleted = _delete_documents(db, models.Billing, models.Billing.vendor_id, models.Billing.bill_date, "billing_id", "Billing", bill_ids)
+    rollups.remove_many(db, [rollups.bill_entry(models.Billing(**row)) for row in deleted])
+    audit.record_many(db, user_id, "delete", "billing", [(row["id"], None) for row in deleted])
+    return [row["bill_date"] for row in deleted]
+
+def delete_in_chunks(db: Session, delete_fn, ids, user_id: int, progress=None):
+    """Run delete_fn over `ids` DELETE_CHUNK_SIZE at a time; returns the deleted dates."""
+    dates = []
+    for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+        dates += delete_fn(db, ids[start:start + DELETE_CHUNK_SIZE], user_id)
+        if progress:
+            progress(min(start + DELETE_CHUNK_SIZE, len(ids)), len(ids))
+    return dates
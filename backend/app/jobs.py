@@ -0,0 +1,235 @@
+import os
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, text
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+from .models import JobStatus
+
+# In-process background jobs, queued in the jobs table.
+# Each API process runs a JobRunner: a poller thread claims queued rows with
+# FOR UPDATE SKIP LOCKED (so several uvicorn workers can share one queue with no broker)
+# and hands them to a small thread pool. Handlers get a JobContext with their own
+# session, report progress through short separate transactions, and check for
+# cancellation at those same points. A heartbeat marks a job as alive; running jobs
+# whose heartbeat stops (the process died) are failed by whichever runner notices.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+HEARTBEAT_SECONDS = 30
+STALE_AFTER = timedelta(seconds=HEARTBEAT_SECONDS * 4)
+
+# Files written by export jobs, served by GET /jobs/{id}/download and removed after EXPORT_TTL_HOURS
+EXPORT_DIR = os.getenv("JOB_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "sktexcot-exports"))
+EXPORT_TTL_HOURS = float(os.getenv("JOB_EXPORT_TTL_HOURS", 24))
+
+FINISHED = (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value)
+
+class JobCancelled(Exception):
+    pass
+
+class JobKind:
+    def __init__(self, name, handler, roles):
+        self.name = name
+        self.handler = handler
+        self.roles = roles
+
+# kind name -> JobKind, filled by @job_kind
+KINDS = {}
+
+def job_kind(name, roles):
+    """Register `handler(ctx, params) -> result dict` as a job kind that `roles` may submit."""
+    def decorator(handler):
+        KINDS[name] = JobKind(name, handler, roles)
+        return handler
+    return decorator
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _update(job_id, **values):
+    # Own short transaction so progress is visible while the job's main transaction is open
+    with SessionLocal() as session:
+        session.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+        session.commit()
+
+class JobContext:
+    def __init__(self, job: models.Job, db: Session):
+        self.job_id = job.id
+        self.user_id = job.created_by
+        self.db = db
+
+    def check_cancelled(self):
+        with SessionLocal() as session:
+            requested = session.query(models.Job.cancel_requested).filter(models.Job.id == self.job_id).scalar()
+        if requested:
+            raise JobCancelled()
+
+    def progress(self, done: int, total: int = None):
+        """Record progress, then raise JobCancelled if a cancel was requested meanwhile."""
+        _update(self.job_id, progress_done=done, progress_total=total, heartbeat_at=_now())
+        self.check_cancelled()
+
+def export_path(job_id: int, filename: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{job_id}-{os.path.basename(filename)}")
+
+def new_export_file(job_id: int, filename: str) -> str:
+    """Path for an export job's output file; also clears out expired exports."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    cutoff = time.time() - EXPORT_TTL_HOURS * 3600
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+    return export_path(job_id, filename)
+
+# --- Queue operations (called from request handlers, in their session) ---
+
+def submit(db: Session, kind: str, params: dict, user_id: int):
+    job = models.Job(kind=kind, params=params or {}, created_by=user_id, status=JobStatus.QUEUED.value)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    runner.wake()
+    return job
+
+def cancel(db: Session, job: models.Job):
+    """Cancel a queued job outright; ask a running one to stop at its next progress check."""
+    if job.status == JobStatus.QUEUED.value:
+        db.execute(update(models.Job).where(
+            models.Job.id == job.id, models.Job.status == JobStatus.QUEUED.value
+        ).values(status=JobStatus.CANCELLED.value, cancel_requested=True, finished_at=_now()))
+    elif job.status == JobStatus.RUNNING.value:
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+# --- Runner ---
+
+def _claim_next(session: Session):
+    next_id = select(models.Job.id).where(
+        models.Job.status == JobStatus.QUEUED.value
+    ).order_by(models.Job.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+    claimed = session.execute(
+        update(models.Job).where(models.Job.id == next_id)
+        .values(status=JobStatus.RUNNING.value, started_at=_now(), heartbeat_at=_now())
+        .returning(models.Job.id)
+    ).scalar()
+    session.commit()
+    return claimed
+
+def _fail_stale(session: Session):
+    session.execute(update(models.Job).where(
+        models.Job.status == JobStatus.RUNNING.value,
+        models.Job.heartbeat_at < _now() - STALE_AFTER
+    ).values(status=JobStatus.FAILED.value, error="Interrupted: the server running this job stopped", finished_at=_now()))
+    session.commit()
+
+def run_job(job_id: int):
+    """Run one claimed job to completion and record its outcome."""
+    with SessionLocal() as db:
+        # Jobs exist for long-running work, so DB_STATEMENT_TIMEOUT_MS doesn't apply to them
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        job = db.get(models.Job, job_id)
+        kind = KINDS.get(job.kind)
+        try:
+            if kind is None:
+                raise ValueError(f"Unknown job kind '{job.kind}'")
+            ctx = JobContext(job, db)
+            ctx.check_cancelled()
+            result = kind.handler(ctx, job.params or {})
+        except JobCancelled:
+            db.rollback()
+            _update(job_id, status=JobStatus.CANCELLED.value, finished_at=_now())
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            _update(job_id, status=JobStatus.FAILED.value, error=str(e), finished_at=_now())
+        else:
+            _update(job_id, status=JobStatus.SUCCEEDED.value, result=result, finished_at=_now())
+
+class JobRunner:
+    def __init__(self, workers: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._slots = threading.Semaphore(workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pool = None
+
+    def start(self):
+        if self._pool is not None or self.workers <= 0:
+            return
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._threads = [
+            threading.Thread(target=self._poll_loop, name="job-poller", daemon=True),
+            threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait: bool = True):
+        if self._pool is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._pool.shutdown(wait=wait)
+        self._pool = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self, job_id):
+        try:
+            run_job(job_id)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            self._slots.release()
+            self._wake.set()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            try:
+                with SessionLocal() as session:
+                    _fail_stale(session)
+                    while self._slots.acquire(blocking=False):
+                        job_id = _claim_next(session)
+                        if job_id is None:
+                            self._slots.release()
+                            break
+                        with self._lock:
+                            self._running.add(job_id)
+                        self._pool.submit(self._run, job_id)
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with SessionLocal() as session:
+                    session.execute(update(models.Job).where(models.Job.id.in_(running)).values(heartbeat_at=_now()))
+                    session.commit()
+            except Exception:
+                traceback.print_exc()
+
+runner = JobRunner()
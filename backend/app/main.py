@@ -5,6 +5,7 @@ from fastapi.responses import JSONResponse
 from fastapi import Request
 import os
 from dotenv import load_dotenv
+from . import database
 
 load_dotenv()
 
@@ -38,8 +39,19 @@ def read_root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/health/db")
+def db_pool_health():
+    # Connection pool usage and checkout wait times for this worker process
+    return {"status": "ok", "pool": database.pool_status()}
+
+@app.get("/health/audit")
+def audit_writer_health():
+    # Batched audit writer: queue depth, rows written and anything spooled to disk
+    return {"status": "ok", "audit": audit.writer.status()}
+
 # Import all routers
-from .routers import auth, company, sales, billing, payments, ledger, dashboard, gst, tds, excel
+from .routers import auth, company, sales, billing, payments, ledger, dashboard, gst, tds, excel, jobs as jobs_router, audit as audit_router, closing as closing_router
+from . import jobs, audit
 
 # Register all routers (once each)
 app.include_router(auth.router)
@@ -52,3 +64,25 @@ app.include_router(dashboard.router)
 app.include_router(gst.router)
 app.include_router(tds.router)
 app.include_router(excel.router)
+app.include_router(jobs_router.router)
+app.include_router(audit_router.router)
+app.include_router(closing_router.router)
+
+# Background job workers (JOB_WORKERS=0 turns them off in this process)
+@app.on_event("startup")
+def start_job_runner():
+    jobs.runner.start()
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    jobs.runner.stop()
+
+# AUDIT_MODE=batched: the writer flushes its queue (or spools it to disk) on shutdown
+@app.on_event("startup")
+def start_audit_writer():
+    if audit.AUDIT_MODE == "batched":
+        audit.writer.start()
+
+@app.on_event("shutdown")
+def stop_audit_writer():
+    audit.writer.stop()
@@ -0,0 +1,203 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Schema changes for databases created before a column/index existed.
+# Base.metadata.create_all() only creates missing tables, so anything added to an
+# existing table is listed here, in order, and applied once by init_db.py (or
+# `python manage.py migrate`). Applied names are recorded in schema_migrations.
+#
+# Each entry is (name, statements, transactional). Statements must be idempotent so a
+# fresh database, where create_all already built everything, just records them.
+# Index builds use CONCURRENTLY so they don't block writes on a live table; those
+# can't run inside a transaction, hence transactional=False.
+
+def _to_numeric(table, columns):
+    # One ALTER TABLE per table so it is rewritten once. Skipped when the first column is
+    # already NUMERIC, which makes it a no-op on fresh databases and on reruns.
+    first = next(iter(columns))
+    alters = ",\n                ".join(
+        f"ALTER COLUMN {column} TYPE numeric({precision}, {scale}) USING round({column}::numeric, {scale})"
+        for column, (precision, scale) in columns.items()
+    )
+    return f"""
+        DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = '{table}' AND column_name = '{first}') = 'double precision' THEN
+                ALTER TABLE {table}
+                {alters};
+            END IF;
+        END $$
+        """
+
+MONEY = (18, 2)
+QUANTITY = (18, 3)
+UNIT_RATE = (18, 4)
+PERCENT = (7, 3)
+
+MIGRATIONS = [
+    ("0001_ledger_company_date_id", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ledger_company_date_id ON ledger (company_id, transaction_date, id)",
+    ], False),
+    ("0002_report_date_indexes", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_invoice_date ON sales (invoice_date)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_company_invoice_date ON sales (company_id, invoice_date)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_billing_bill_date ON billing (bill_date)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_billing_vendor_bill_date ON billing (vendor_id, bill_date)",
+    ], False),
+    # audit_logs becomes a monthly RANGE-partitioned table (see models.AuditLog and
+    # audit_partitions.py). Existing rows are copied across in one transaction, so on a
+    # large table run it in a quiet window. Fresh databases already have the partitioned
+    # table from create_all, and the block does nothing.
+    ("0003_partition_audit_logs", [
+        """
+        DO $$
+        DECLARE
+            month date;
+            last_month date;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'audit_logs'::regclass) = 'p' THEN
+                RETURN;
+            END IF;
+
+            ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned;
+            ALTER TABLE audit_logs_unpartitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_unpartitioned_pkey;
+            DROP INDEX IF EXISTS ix_audit_logs_id;
+
+            CREATE TABLE audit_logs (
+                id integer NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+                user_id integer REFERENCES users (id),
+                action varchar NOT NULL,
+                table_name varchar NOT NULL,
+                record_id integer,
+                old_value json,
+                new_value json,
+                ip_address varchar,
+                "timestamp" timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (id, "timestamp")
+            ) PARTITION BY RANGE ("timestamp");
+            ALTER TABLE audit_logs_unpartitioned ALTER COLUMN id DROP DEFAULT;
+            ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id;
+
+            CREATE INDEX ix_audit_logs_table_record ON audit_logs (table_name, record_id, "timestamp");
+            CREATE INDEX ix_audit_logs_user_timestamp ON audit_logs (user_id, "timestamp");
+            CREATE INDEX ix_audit_logs_timestamp ON audit_logs ("timestamp");
+
+            CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+            month := date_trunc('month', coalesce((SELECT min("timestamp") FROM audit_logs_unpartitioned), now()) AT TIME ZONE 'UTC')::date;
+            last_month := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+            WHILE month <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+                    'audit_logs_' || to_char(month, 'YYYY_MM'),
+                    month::text || ' 00:00:00+00',
+                    (month + interval '1 month')::date::text || ' 00:00:00+00'
+                );
+                month := (month + interval '1 month')::date;
+            END LOOP;
+
+            INSERT INTO audit_logs (id, user_id, action, table_name, record_id, old_value, new_value, ip_address, "timestamp")
+            SELECT id, user_id, action, table_name, record_id, old_value, new_value, ip_address, coalesce("timestamp", now())
+            FROM audit_logs_unpartitioned;
+            DROP TABLE audit_logs_unpartitioned;
+        END $$
+        """,
+    ], True),
+    ("0004_sales_import_id", [
+        "ALTER TABLE sales ADD COLUMN IF NOT EXISTS import_id VARCHAR",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_import_id ON sales (import_id) WHERE import_id IS NOT NULL",
+    ], False),
+    # ledger.reference_model becomes a checked discriminator (see models.Ledger). Spelling
+    # variants are normalised first; the constraint is added NOT VALID so it only takes a
+    # brief lock, then validated in 0006 without blocking writes. Rows that still break it
+    # (a model name nobody recognises, or one half of the reference missing) fail the
+    # validation with the constraint named, and need fixing by hand before rerunning.
+    ("0005_ledger_reference_check", [
+        """
+        UPDATE ledger SET reference_model = CASE lower(btrim(reference_model))
+            WHEN 'sales' THEN 'Sales'
+            WHEN 'sale' THEN 'Sales'
+            WHEN 'billing' THEN 'Billing'
+            WHEN 'bill' THEN 'Billing'
+            WHEN 'payment' THEN 'Payment'
+            WHEN 'payments' THEN 'Payment'
+            WHEN '' THEN NULL
+            ELSE reference_model
+        END
+        WHERE reference_model NOT IN ('Sales', 'Billing', 'Payment')
+        """,
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_ledger_reference') THEN
+                ALTER TABLE ledger ADD CONSTRAINT ck_ledger_reference CHECK (
+                    reference_model IN ('Sales', 'Billing', 'Payment') AND reference_id IS NOT NULL
+                    OR reference_model IS NULL AND reference_id IS NULL
+                ) NOT VALID;
+            END IF;
+        END $$
+        """,
+    ], True),
+    ("0006_ledger_reference_index", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ledger_reference ON ledger (reference_model, reference_id)",
+        "ALTER TABLE ledger VALIDATE CONSTRAINT ck_ledger_reference",
+    ], False),
+    # Money columns go from double precision to NUMERIC (see models.Money and money.py),
+    # rounded to the paisa on the way. Every table is rewritten under an exclusive lock, so
+    # run it in a quiet window. Rounding can leave stored running balances, company totals
+    # and rollups a paisa off their parts: follow with `python manage.py recompute-amounts`,
+    # which also brings old invoices in line with the rounding rules.
+    ("0007_numeric_money", [
+        _to_numeric("companies", {"opening_balance": MONEY}),
+        _to_numeric("sales", {
+            "base_amount": MONEY, "quantity": QUANTITY, "rate": UNIT_RATE, "gst_rate": PERCENT,
+            "cgst_amount": MONEY, "sgst_amount": MONEY, "igst_amount": MONEY, "tcs_amount": MONEY,
+            "total_amount": MONEY, "amount_paid": MONEY, "amount_due": MONEY,
+        }),
+        _to_numeric("billing", {
+            "base_amount": MONEY, "quantity": QUANTITY, "rate": UNIT_RATE, "gst_rate": PERCENT,
+            "gst_amount": MONEY, "tds_rate": PERCENT, "tds_amount": MONEY, "total_amount": MONEY,
+            "amount_paid": MONEY, "amount_due": MONEY,
+        }),
+        _to_numeric("payments", {"amount": MONEY}),
+        _to_numeric("ledger", {"debit_amount": MONEY, "credit_amount": MONEY, "balance": MONEY}),
+        _to_numeric("company_balances", {"debit_total": MONEY, "credit_total": MONEY}),
+        _to_numeric("ledger_checkpoints", {"debit_total": MONEY, "credit_total": MONEY}),
+        _to_numeric("monthly_rollups", {
+            "base_amount": MONEY, "cgst_amount": MONEY, "sgst_amount": MONEY, "igst_amount": MONEY,
+            "gst_amount": MONEY, "tcs_amount": MONEY, "tds_amount": MONEY, "tds_base_amount": MONEY,
+            "total_amount": MONEY,
+        }),
+    ], True),
+]
+
+def _ensure_table(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+def pending(engine: Engine):
+    _ensure_table(engine)
+    with engine.connect() as conn:
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+def run_migrations(engine: Engine, log=print):
+    applied = []
+    for name, statements, transactional in pending(engine):
+        log(f"Applying migration {name}...")
+        if transactional:
+            with engine.begin() as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO schema_migrations (name, applied_at) VALUES (:n, :t)"), {"n": name, "t": datetime.utcnow()})
+        else:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO schema_migrations (name, applied_at) VALUES (:n, :t)"), {"n": name, "t": datetime.utcnow()})
+        applied.append(name)
+    return applied
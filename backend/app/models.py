@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Enum, Float, Text, JSON, Date
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Enum, Numeric, Text, JSON, Date, Index, CheckConstraint, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -46,6 +46,13 @@ class TransactionType(str, enum.Enum):
     RECEIPT = "receipt"
     OPENING = "opening"
 
+# Column types for money and the figures it is computed from. Stored exactly as NUMERIC
+# (migration 0007), handed to Python as float; arithmetic on them goes through money.py.
+Money = Numeric(18, 2, asdecimal=False)
+Quantity = Numeric(18, 3, asdecimal=False)
+UnitRate = Numeric(18, 4, asdecimal=False)
+Percent = Numeric(7, 3, asdecimal=False)
+
 # Models
 
 class User(Base):
@@ -74,7 +81,7 @@ class Company(Base):
     phone = Column(String)
     email = Column(String)
     contact_person = Column(String)
-    opening_balance = Column(Float, default=0.0)
+    opening_balance = Column(Money, default=0.0)
     balance_type = Column(Enum(BalanceType), default=BalanceType.CREDIT)
     payment_terms = Column(String)
     bank_account_no = Column(String, nullable=True)
@@ -93,28 +100,60 @@ class Sales(Base):
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
     process_type = Column(Enum(ProcessType))
     item_description = Column(Text, nullable=True)
-    quantity = Column(Float, default=0.0)
-    rate = Column(Float, default=0.0)
-    base_amount = Column(Float, default=0.0) # qty * rate
+    quantity = Column(Quantity, default=0.0)
+    rate = Column(UnitRate, default=0.0)
+    base_amount = Column(Money, default=0.0) # qty * rate
     gst_type = Column(Enum(GSTType))
-    gst_rate = Column(Float, default=0.0) # percentage
-    cgst_amount = Column(Float, default=0.0)
-    sgst_amount = Column(Float, default=0.0)
-    igst_amount = Column(Float, default=0.0)
-    tcs_amount = Column(Float, default=0.0)
-    total_amount = Column(Float, default=0.0)
+    gst_rate = Column(Percent, default=0.0) # percentage
+    cgst_amount = Column(Money, default=0.0)
+    sgst_amount = Column(Money, default=0.0)
+    igst_amount = Column(Money, default=0.0)
+    tcs_amount = Column(Money, default=0.0)
+    total_amount = Column(Money, default=0.0)
     payment_status = Column(Enum(PaymentStatus), default=PaymentStatus.UNPAID)
-    amount_paid = Column(Float, default=0.0)
-    amount_due = Column(Float, default=0.0)
+    amount_paid = Column(Money, default=0.0)
+    amount_due = Column(Money, default=0.0)
     payment_mode = Column(Enum(PaymentMode), nullable=True) # If paid immediately
     payment_date = Column(Date, nullable=True)
     notes = Column(Text, nullable=True)
+    import_id = Column(String, nullable=True)  # import batch the invoice came from, for undoing a bad import
     created_by = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     company = relationship("Company")
     creator = relationship("User")
+    # Empty for a single-line invoice, whose header is its one line
+    lines = relationship("InvoiceLine", order_by="InvoiceLine.line_number", lazy="selectin", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_sales_invoice_date", "invoice_date"),
+        Index("ix_sales_company_invoice_date", "company_id", "invoice_date"),
+        Index("ix_sales_import_id", "import_id", postgresql_where=import_id.isnot(None)),
+    )
+
+class InvoiceLine(Base):
+    # Lines of a multi-line sales invoice. The invoice's GST type and rate apply to every line;
+    # the header carries the sums (see money.invoice_amounts).
+    __tablename__ = "invoice_lines"
+
+    id = Column(Integer, primary_key=True)
+    sales_id = Column(Integer, ForeignKey("sales.id", ondelete="CASCADE"), nullable=False)
+    line_number = Column(Integer, nullable=False)  # from 1
+    process_type = Column(Enum(ProcessType))
+    hsn_code = Column(String, nullable=True)  # falls back to GST_HSN_CODES for the process in GSTR-1
+    item_description = Column(Text, nullable=True)
+    quantity = Column(Quantity, default=0.0)
+    rate = Column(UnitRate, default=0.0)
+    base_amount = Column(Money, default=0.0)
+    cgst_amount = Column(Money, default=0.0)
+    sgst_amount = Column(Money, default=0.0)
+    igst_amount = Column(Money, default=0.0)
+    total_amount = Column(Money, default=0.0)  # base + GST; TCS stays on the header
+
+    __table_args__ = (
+        Index("ix_invoice_lines_sales_line", "sales_id", "line_number", unique=True),
+    )
 
 class Billing(Base):
     __tablename__ = "billing"
@@ -126,20 +165,20 @@ class Billing(Base):
     process_type = Column(String) # Changed from Enum to allow custom values
     customer_name = Column(String, nullable=True) # Added per user design
     item_description = Column(Text)
-    quantity = Column(Float)
-    rate = Column(Float)
-    base_amount = Column(Float)
+    quantity = Column(Quantity)
+    rate = Column(UnitRate)
+    base_amount = Column(Money)
     gst_type = Column(Enum(GSTType))
-    gst_rate = Column(Float)
-    gst_amount = Column(Float) # Total GST
+    gst_rate = Column(Percent)
+    gst_amount = Column(Money) # Total GST
     tds_applicable = Column(Boolean, default=False)
-    tds_rate = Column(Float, default=0.0)
-    tds_amount = Column(Float, default=0.0)
+    tds_rate = Column(Percent, default=0.0)
+    tds_amount = Column(Money, default=0.0)
     tds_file_date = Column(String, nullable=True)  # TDS filing date or period (flexible text field)
-    total_amount = Column(Float) # Base + GST - TDS
+    total_amount = Column(Money) # Base + GST - TDS
     payment_status = Column(Enum(PaymentStatus), default=PaymentStatus.UNPAID)
-    amount_paid = Column(Float, default=0.0)
-    amount_due = Column(Float, default=0.0)
+    amount_paid = Column(Money, default=0.0)
+    amount_due = Column(Money, default=0.0)
     payment_mode = Column(Enum(PaymentMode), nullable=True)
     payment_date = Column(Date, nullable=True)
     notes = Column(Text)
@@ -150,6 +189,11 @@ class Billing(Base):
     vendor = relationship("Company")
     creator = relationship("User")
 
+    __table_args__ = (
+        Index("ix_billing_bill_date", "bill_date"),
+        Index("ix_billing_vendor_bill_date", "vendor_id", "bill_date"),
+    )
+
 class Payment(Base):
     __tablename__ = "payments"
 
@@ -162,7 +206,7 @@ class Payment(Base):
     sales_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
     billing_id = Column(Integer, ForeignKey("billing.id"), nullable=True)
     
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     payment_mode = Column(Enum(PaymentMode))
     transaction_reference = Column(String, nullable=True)
     bank_account = Column(String, nullable=True)
@@ -175,6 +219,9 @@ class Payment(Base):
     bill = relationship("Billing")
     creator = relationship("User")
 
+# Values of Ledger.reference_model: the model whose row reference_id points at
+LEDGER_REFERENCE_MODELS = ("Sales", "Billing", "Payment")
+
 class Ledger(Base):
     __tablename__ = "ledger"
 
@@ -183,19 +230,99 @@ class Ledger(Base):
     transaction_date = Column(Date, nullable=False)
     transaction_type = Column(Enum(TransactionType))
     reference_id = Column(Integer) # ID of sale/purchase/payment
-    reference_model = Column(String) # "Sales", "Billing", "Payment"
-    debit_amount = Column(Float, default=0.0)
-    credit_amount = Column(Float, default=0.0)
-    balance = Column(Float, default=0.0) # Running balance logic is complex, might calculate on fly or store
+    reference_model = Column(String) # one of LEDGER_REFERENCE_MODELS, or NULL with no reference_id
+    debit_amount = Column(Money, default=0.0)
+    credit_amount = Column(Money, default=0.0)
+    balance = Column(Money, default=0.0) # Running (debit - credit) for the company up to this row, ordered by (transaction_date, id); excludes opening balance
     narration = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     company = relationship("Company")
 
+    __table_args__ = (
+        Index("ix_ledger_company_date_id", "company_id", "transaction_date", "id"),
+        # Update/delete paths find a document's ledger rows by (reference_model, reference_id)
+        Index("ix_ledger_reference", "reference_model", "reference_id"),
+        CheckConstraint(
+            f"reference_model IN ({', '.join(repr(m) for m in LEDGER_REFERENCE_MODELS)}) AND reference_id IS NOT NULL"
+            " OR reference_model IS NULL AND reference_id IS NULL",
+            name="ck_ledger_reference"
+        ),
+    )
+
+class CompanyBalance(Base):
+    __tablename__ = "company_balances"
+
+    # Running ledger totals per company, maintained by app.posting on every ledger write.
+    # Opening balance stays on Company since it can be edited independently.
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    debit_total = Column(Money, nullable=False, default=0.0)
+    credit_total = Column(Money, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    company = relationship("Company")
+
+class LedgerCheckpoint(Base):
+    __tablename__ = "ledger_checkpoints"
+
+    # Cumulative ledger totals for a company of all entries dated before month_start.
+    # One row exists for every month in which the company has ledger activity.
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    month_start = Column(Date, primary_key=True)
+    debit_total = Column(Money, nullable=False, default=0.0)
+    credit_total = Column(Money, nullable=False, default=0.0)
+
+class InvoiceCounter(Base):
+    """Last sequence number issued per invoice numbering scope (see invoice_numbers.py)."""
+    __tablename__ = "invoice_counters"
+
+    scope = Column(String, primary_key=True)  # the invoice format minus its sequence, e.g. "SK/2024/#"
+    last_value = Column(Integer, nullable=False, default=0)
+
+class PeriodClose(Base):
+    """A closed month: its sales, bills, payments and ledger rows can no longer change (see closing.py)."""
+    __tablename__ = "period_closes"
+
+    month_start = Column(Date, primary_key=True)
+    closed_by = Column(Integer, ForeignKey("users.id"))
+    closed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ReportSnapshot(Base):
+    """A report computed when its period closed, served instead of recomputing from history."""
+    __tablename__ = "report_snapshots"
+
+    kind = Column(String, primary_key=True)  # a closing.snapshot_kind name, e.g. "gstr1"
+    period_start = Column(Date, primary_key=True)
+    period_end = Column(Date, primary_key=True)  # exclusive, as everywhere in periods.py
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class MonthlyRollup(Base):
+    __tablename__ = "monthly_rollups"
+
+    # Pre-aggregated sales ("sales") and purchase ("purchase") figures per month x company x process type,
+    # maintained by app.rollups on every sales/billing write. Reports read these instead of raw rows.
+    kind = Column(String, primary_key=True)
+    month_start = Column(Date, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    process_type = Column(String, primary_key=True, default="") # "" when not set
+    invoice_count = Column(Integer, nullable=False, default=0)
+    base_amount = Column(Money, nullable=False, default=0.0)
+    cgst_amount = Column(Money, nullable=False, default=0.0)
+    sgst_amount = Column(Money, nullable=False, default=0.0)
+    igst_amount = Column(Money, nullable=False, default=0.0)
+    gst_amount = Column(Money, nullable=False, default=0.0)
+    tcs_amount = Column(Money, nullable=False, default=0.0)
+    tds_amount = Column(Money, nullable=False, default=0.0)
+    tds_base_amount = Column(Money, nullable=False, default=0.0) # base of TDS-applicable bills only
+    tds_bill_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Money, nullable=False, default=0.0)
+
 class AuditLog(Base):
+    """Partitioned by month on timestamp (see audit_partitions.py), so the key includes it."""
     __tablename__ = "audit_logs"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     action = Column(String, nullable=False)
     table_name = Column(String, nullable=False)
@@ -203,6 +330,70 @@ class AuditLog(Base):
     old_value = Column(JSON, nullable=True)
     new_value = Column(JSON, nullable=True)
     ip_address = Column(String, nullable=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
 
     user = relationship("User")
+
+    __table_args__ = (
+        Index("ix_audit_logs_table_record", "table_name", "record_id", "timestamp"),
+        Index("ix_audit_logs_user_timestamp", "user_id", "timestamp"),
+        Index("ix_audit_logs_timestamp", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+# A partitioned table takes no rows until it has a partition. The DEFAULT partition catches
+# anything outside the monthly ones, so inserts never fail for want of a partition.
+event.listen(AuditLog.__table__, "after_create", DDL(
+    "CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"
+))
+
+class ImportBatch(Base):
+    """An uploaded spreadsheet parsed into import_rows, waiting for the user to confirm it."""
+    __tablename__ = "import_batches"
+
+    id = Column(String, primary_key=True)  # uuid4 hex, handed to the client as import_id
+    filename = Column(String)
+    row_count = Column(Integer, default=0)
+    companies = Column(JSON)  # distinct company names found, created on confirm
+    created_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    rows = relationship("ImportRow", cascade="all, delete-orphan", passive_deletes=True)
+
+class ImportRow(Base):
+    __tablename__ = "import_rows"
+
+    batch_id = Column(String, ForeignKey("import_batches.id", ondelete="CASCADE"), primary_key=True)
+    row_index = Column(Integer, primary_key=True)
+    data = Column(JSON, nullable=False)
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class Job(Base):
+    """A background job run by app.jobs; the row is both the queue entry and its status."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default=JobStatus.QUEUED.value)
+    params = Column(JSON)
+    progress_done = Column(Integer, default=0)
+    progress_total = Column(Integer, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_id", "status", "id"),
+    )
@@ -0,0 +1,276 @@
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import func, select, update, case, and_, or_, exists, cast, any_, bindparam, true, Date, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from . import models
+from .models import GSTType, TransactionType
+
+# Money and tax arithmetic for invoices and bills.
+#
+# Amounts are stored as NUMERIC(18, 2) (models.Money). The rules below are written once
+# against a tiny set of operations and evaluated two ways: in Python with Decimal for
+# documents being written (sale_amounts / invoice_amounts / bill_amounts), and as SQL over whole chunks of
+# stored documents for verify_amounts / recompute_amounts, where Postgres does the same
+# NUMERIC arithmetic set-based. Both round half away from zero to the paisa at the same
+# steps, so a document written through the API always verifies.
+#
+# Rounding steps: the base (quantity x rate), then GST on the rounded base, then the
+# CGST half of an intra-state GST (SGST is the remainder, so the halves always add up),
+# then TDS on the rounded base. Totals are sums of rounded parts and need no rounding.
+#
+# Values cross into the rest of the app as float: the columns hand Python floats, and
+# every float here is the nearest one to an exact paisa amount, so it goes back into
+# NUMERIC unchanged.
+
+PAISA = Decimal("0.01")
+
+def to_decimal(value) -> Decimal:
+    # Through str(), so 0.1 is 0.1 and not the binary expansion of the float nearest it
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+def round_money(value) -> Decimal:
+    return to_decimal(value).quantize(PAISA, rounding=ROUND_HALF_UP)
+
+# Quantities, rates and tax rates are rounded to their column's scale (models.Quantity,
+# UnitRate, Percent) before the rules see them, so amounts come from the stored figures
+QUANTITY_STEP = Decimal("0.001")
+RATE_STEP = Decimal("0.0001")
+PERCENT_STEP = Decimal("0.001")
+
+def _stored(value, step: Decimal) -> Decimal:
+    return to_decimal(value).quantize(step, rounding=ROUND_HALF_UP)
+
+def amount(value) -> float:
+    """`value` rounded to the paisa, as the float that stores back exactly."""
+    return float(round_money(value))
+
+def total(*values) -> float:
+    """Exact sum of amounts, rounded to the paisa."""
+    return amount(sum((to_decimal(v) for v in values), Decimal(0)))
+
+class _Python:
+    round = staticmethod(round_money)
+    zero = Decimal(0)
+
+    @staticmethod
+    def when(condition, then, otherwise):
+        return then if condition else otherwise
+
+    @staticmethod
+    def at_least_zero(value):
+        return max(value, Decimal(0))
+
+class _SQL:
+    zero = 0
+
+    @staticmethod
+    def round(value):
+        # round(numeric, 2) rounds half away from zero, like ROUND_HALF_UP
+        return func.round(value, 2)
+
+    @staticmethod
+    def when(condition, then, otherwise):
+        return case((condition, then), else_=otherwise)
+
+    @staticmethod
+    def at_least_zero(value):
+        return func.greatest(value, 0)
+
+def _sale_rules(ops, quantity, rate, gst_rate, intra_state, tcs_amount, amount_paid):
+    base = ops.round(quantity * rate)
+    gst = ops.round(base * gst_rate / 100)
+    cgst = ops.round(gst / 2)
+    total_amount = base + gst + tcs_amount
+    return {
+        "base_amount": base,
+        "cgst_amount": ops.when(intra_state, cgst, ops.zero),
+        "sgst_amount": ops.when(intra_state, gst - cgst, ops.zero),
+        "igst_amount": ops.when(intra_state, ops.zero, gst),
+        "total_amount": total_amount,
+        "amount_due": ops.at_least_zero(total_amount - amount_paid),
+    }
+
+def _bill_rules(ops, quantity, rate, gst_rate, tds_applicable, tds_rate, amount_paid):
+    base = ops.round(quantity * rate)
+    gst = ops.round(base * gst_rate / 100)
+    tds = ops.when(tds_applicable, ops.round(base * tds_rate / 100), ops.zero)
+    total_amount = base + gst - tds
+    return {
+        "base_amount": base,
+        "gst_amount": gst,
+        "tds_amount": tds,
+        "total_amount": total_amount,
+        "amount_due": ops.at_least_zero(total_amount - amount_paid),
+    }
+
+def split_gst(gst):
+    """(CGST, SGST) of an intra-state GST amount: CGST is the rounded half, SGST the rest."""
+    gst = round_money(gst)
+    cgst = round_money(gst / 2)
+    return float(cgst), float(gst - cgst)
+
+def split_gst_sql(gst):
+    """split_gst() as SQL expressions over a NUMERIC GST amount."""
+    cgst = _SQL.round(gst / 2)
+    return cgst, gst - cgst
+
+def sale_amounts(quantity, rate, gst_rate, gst_type, tcs_amount=0.0, amount_paid=0.0) -> dict:
+    """base/CGST/SGST/IGST/total/due for a sales invoice. Anything not intra-state is IGST."""
+    amounts = _sale_rules(
+        _Python, _stored(quantity, QUANTITY_STEP), _stored(rate, RATE_STEP), _stored(gst_rate, PERCENT_STEP),
+        gst_type == GSTType.INTRA_STATE, round_money(tcs_amount), round_money(amount_paid)
+    )
+    return {name: float(value) for name, value in amounts.items()}
+
+def invoice_amounts(lines, gst_rate, gst_type, tcs_amount=0.0, amount_paid=0.0):
+    """Amounts for a multi-line sales invoice, in one pass over `lines` ([(quantity, rate)]).
+
+    Each line is taxed on its own rounded base at the invoice's GST rate. Returns
+    ([base/CGST/SGST/IGST/total per line], header) where the header carries the sums plus
+    TCS, the total quantity and the average rate.
+    """
+    gst_rate = _stored(gst_rate, PERCENT_STEP)
+    intra_state = gst_type == GSTType.INTRA_STATE
+    sums = dict.fromkeys(("base_amount", "cgst_amount", "sgst_amount", "igst_amount"), Decimal(0))
+    quantity_total = Decimal(0)
+    line_amounts = []
+    for quantity, rate in lines:
+        quantity = _stored(quantity, QUANTITY_STEP)
+        amounts = _sale_rules(_Python, quantity, _stored(rate, RATE_STEP), gst_rate, intra_state, Decimal(0), Decimal(0))
+        del amounts["amount_due"]
+        line_amounts.append({name: float(value) for name, value in amounts.items()})
+        quantity_total += quantity
+        for name in sums:
+            sums[name] += amounts[name]
+
+    total_amount = sum(sums.values()) + round_money(tcs_amount)
+    average_rate = _stored(sums["base_amount"] / quantity_total, RATE_STEP) if quantity_total else Decimal(0)
+    header = {
+        "quantity": float(quantity_total),
+        "rate": float(average_rate),
+        **{name: float(value) for name, value in sums.items()},
+        "total_amount": float(total_amount),
+        "amount_due": float(_Python.at_least_zero(total_amount - round_money(amount_paid))),
+    }
+    return line_amounts, header
+
+def bill_amounts(quantity, rate, gst_rate, tds_applicable=False, tds_rate=0.0, amount_paid=0.0) -> dict:
+    """base/GST/TDS/total/due for a purchase bill (total is net of TDS)."""
+    amounts = _bill_rules(
+        _Python, _stored(quantity, QUANTITY_STEP), _stored(rate, RATE_STEP), _stored(gst_rate, PERCENT_STEP),
+        bool(tds_applicable), _stored(tds_rate, PERCENT_STEP), round_money(amount_paid)
+    )
+    return {name: float(value) for name, value in amounts.items()}
+
+# --- Verification / recompute ---
+
+RECOMPUTE_CHUNK_SIZE = 50000
+
+def _zero_if_null(column):
+    return func.coalesce(column, 0)
+
+def _expected_sales():
+    # Single-line invoices only: a multi-line invoice's header is the sum of its lines, written
+    # by invoice_amounts(), and its quantity x average rate needn't give its base exactly
+    s = models.Sales
+    single_line = ~exists().where(models.InvoiceLine.sales_id == s.id)
+    return s, s.invoice_date, single_line, _sale_rules(
+        _SQL, _zero_if_null(s.quantity), _zero_if_null(s.rate), _zero_if_null(s.gst_rate),
+        s.gst_type == GSTType.INTRA_STATE, _zero_if_null(s.tcs_amount), _zero_if_null(s.amount_paid)
+    )
+
+def _expected_bills():
+    b = models.Billing
+    return b, b.bill_date, true(), _bill_rules(
+        _SQL, _zero_if_null(b.quantity), _zero_if_null(b.rate), _zero_if_null(b.gst_rate),
+        b.tds_applicable == True, _zero_if_null(b.tds_rate), _zero_if_null(b.amount_paid)
+    )
+
+DOCUMENTS = {
+    "sales": (_expected_sales, "Sales", TransactionType.SALE, "debit_amount"),
+    "billing": (_expected_bills, "Billing", TransactionType.PURCHASE, "credit_amount"),
+}
+
+def _in_closed_month(date_column):
+    return exists().where(models.PeriodClose.month_start == cast(func.date_trunc("month", date_column), Date))
+
+def _id_chunks(db: Session, model, chunk_size: int):
+    low, high = db.query(func.min(model.id), func.max(model.id)).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, chunk_size):
+        yield start, min(start + chunk_size, high + 1)
+
+def _drifted(model, expected, start: int, end: int):
+    # Stored amount differs from the recomputed one (NULL counts as different)
+    return and_(
+        model.id >= start, model.id < end,
+        or_(*[getattr(model, name).is_distinct_from(value) for name, value in expected.items()])
+    )
+
+def verify_amounts(db: Session, chunk_size: int = RECOMPUTE_CHUNK_SIZE, progress=None):
+    """Documents whose stored amounts differ from the money rules, checked one id range at a time.
+    Multi-line invoices are left out (see _expected_sales).
+
+    Returns {"sales": {"checked", "drifted", "in_closed_periods", "sample"}, "billing": {...}};
+    `sample` holds up to 20 drifted ids.
+    """
+    report = {}
+    for name, (expected_fn, _, _, _) in DOCUMENTS.items():
+        model, date_column, scope, expected = expected_fn()
+        result = {"checked": 0, "drifted": 0, "in_closed_periods": 0, "sample": []}
+        for start, end in _id_chunks(db, model, chunk_size):
+            checked, drifted, closed = db.query(
+                func.count(),
+                func.count().filter(_drifted(model, expected, start, end)),
+                func.count().filter(and_(_drifted(model, expected, start, end), _in_closed_month(date_column)))
+            ).select_from(model).filter(model.id >= start, model.id < end, scope).one()
+            result["checked"] += checked
+            result["drifted"] += drifted
+            result["in_closed_periods"] += closed
+            if drifted and len(result["sample"]) < 20:
+                result["sample"] += db.execute(
+                    select(model.id).where(_drifted(model, expected, start, end), scope)
+                    .order_by(model.id).limit(20 - len(result["sample"]))
+                ).scalars().all()
+            if progress:
+                progress(name, end - 1)
+        report[name] = result
+    return report
+
+def recompute_amounts(db: Session, chunk_size: int = RECOMPUTE_CHUNK_SIZE, progress=None):
+    """Rewrite drifted amounts from the money rules, one set-based UPDATE per id range, and
+    move each document's ledger row to its new total. Documents in closed months are left
+    alone. Returns {"sales": count, "billing": count}.
+
+    Balances, running balances and rollups are not touched here: rebuild them afterwards
+    (manage.py recompute-amounts does). Caller commits.
+    """
+    counts = {}
+    for name, (expected_fn, reference_model, transaction_type, ledger_column) in DOCUMENTS.items():
+        model, date_column, scope, expected = expected_fn()
+        counts[name] = 0
+        for start, end in _id_chunks(db, model, chunk_size):
+            changed = db.execute(
+                update(model)
+                .where(_drifted(model, expected, start, end), scope, ~_in_closed_month(date_column))
+                .values(**expected)
+                .returning(model.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            if changed:
+                db.execute(
+                    update(models.Ledger)
+                    .where(
+                        models.Ledger.reference_model == reference_model,
+                        models.Ledger.transaction_type == transaction_type,
+                        models.Ledger.reference_id == model.id,
+                        model.id == any_(bindparam("changed_ids", changed, type_=ARRAY(Integer)))
+                    )
+                    .values(**{ledger_column: model.total_amount})
+                    .execution_options(synchronize_session=False)
+                )
+            counts[name] += len(changed)
+            if progress:
+                progress(name, end - 1)
+    return counts
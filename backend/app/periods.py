@@ -0,0 +1,55 @@
+from datetime import date
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import and_
+
+# Reporting periods as half-open date ranges [start, end).
+# Filtering with `col >= start AND col < end` keeps the date indexes usable, unlike
+# extract('month', col) == m which forces a scan of the whole table.
+
+FY_START_MONTH = 4  # Indian financial year runs April to March
+
+def month_range(month: int, year: int):
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+def financial_year_of(d: date) -> int:
+    # FY is named by the calendar year it starts in: 2024 -> April 2024 to March 2025
+    return d.year if d.month >= FY_START_MONTH else d.year - 1
+
+def financial_year_range(fy: int):
+    return date(fy, FY_START_MONTH, 1), date(fy + 1, FY_START_MONTH, 1)
+
+def quarter_range(fy: int, quarter: int):
+    # Q1 = Apr-Jun, Q2 = Jul-Sep, Q3 = Oct-Dec, Q4 = Jan-Mar
+    first_month = FY_START_MONTH + (quarter - 1) * 3
+    start_year = fy + (first_month - 1) // 12
+    start_month = (first_month - 1) % 12 + 1
+    end_month = start_month + 3
+    end = date(start_year + 1, end_month - 12, 1) if end_month > 12 else date(start_year, end_month, 1)
+    return date(start_year, start_month, 1), end
+
+def resolve_period(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    fy: Optional[int] = None,
+    quarter: Optional[int] = None
+):
+    """Pick the range for report query params: quarter (needs fy), then fy, then month/year."""
+    if quarter is not None:
+        if fy is None:
+            raise HTTPException(status_code=400, detail="quarter requires fy")
+        if quarter not in (1, 2, 3, 4):
+            raise HTTPException(status_code=400, detail="quarter must be 1-4")
+        return quarter_range(fy, quarter)
+    if fy is not None:
+        return financial_year_range(fy)
+    if month is None or year is None:
+        raise HTTPException(status_code=400, detail="month and year are required")
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="month must be 1-12")
+    return month_range(month, year)
+
+def in_range(column, start: date, end: date):
+    return and_(column >= start, column < end)
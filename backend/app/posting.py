@@ -0,0 +1,404 @@
+from datetime import date
+from sqlalchemy import func, select, update, literal, tuple_, cast, Date
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models
+
+# Ledger posting helpers.
+# Every insert/update/delete of Ledger rows goes through here so that derived
+# per-company data is kept in step with the ledger, inside the caller's
+# transaction (nothing in this module commits):
+#   - company_balances: debit/credit totals per company
+#   - ledger.balance: running (debit - credit) per company, by (transaction_date, id)
+#   - ledger_checkpoints: cumulative totals at the start of every active month
+
+# Namespace for pg_advisory_xact_lock so ledger postings for one company are serialised
+LEDGER_LOCK_NAMESPACE = 7301
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+def _net(debit, credit):
+    return func.coalesce(debit, 0.0) - func.coalesce(credit, 0.0)
+
+def _after(txn_date, entry_id):
+    return tuple_(models.Ledger.transaction_date, models.Ledger.id) > tuple_(literal(txn_date, Date), literal(entry_id))
+
+def _before(txn_date, entry_id):
+    return tuple_(models.Ledger.transaction_date, models.Ledger.id) < tuple_(literal(txn_date, Date), literal(entry_id))
+
+def lock_companies(db: Session, *company_ids):
+    # Held until the transaction ends; sorted so two postings can't deadlock each other
+    for company_id in sorted(set(company_ids)):
+        db.execute(select(func.pg_advisory_xact_lock(LEDGER_LOCK_NAMESPACE, company_id)))
+
+def apply_balance_delta(db: Session, company_id: int, debit: float = 0.0, credit: float = 0.0):
+    if not debit and not credit:
+        return
+
+    stmt = insert(models.CompanyBalance).values(
+        company_id=company_id,
+        debit_total=debit,
+        credit_total=credit
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.CompanyBalance.company_id],
+        set_={
+            "debit_total": models.CompanyBalance.debit_total + stmt.excluded.debit_total,
+            "credit_total": models.CompanyBalance.credit_total + stmt.excluded.credit_total,
+            "updated_at": func.now()
+        }
+    )
+    db.execute(stmt)
+
+# --- Checkpoints ---
+
+def _ensure_checkpoint(db: Session, company_id: int, month: date):
+    cp = models.LedgerCheckpoint
+    exists = db.query(cp.company_id).filter(cp.company_id == company_id, cp.month_start == month).first()
+    if exists:
+        return
+
+    # Every active month has a checkpoint, so only the previous checkpoint's month needs summing
+    prev = db.query(cp).filter(
+        cp.company_id == company_id,
+        cp.month_start < month
+    ).order_by(cp.month_start.desc()).first()
+
+    query = db.query(
+        func.coalesce(func.sum(models.Ledger.debit_amount), 0.0),
+        func.coalesce(func.sum(models.Ledger.credit_amount), 0.0)
+    ).filter(
+        models.Ledger.company_id == company_id,
+        models.Ledger.transaction_date < month
+    )
+    if prev:
+        query = query.filter(models.Ledger.transaction_date >= prev.month_start)
+    debit, credit = query.one()
+
+    db.execute(insert(cp).values(
+        company_id=company_id,
+        month_start=month,
+        debit_total=(prev.debit_total if prev else 0.0) + debit,
+        credit_total=(prev.credit_total if prev else 0.0) + credit
+    ).on_conflict_do_nothing())
+
+def _shift_checkpoints(db: Session, company_id: int, txn_date: date, debit: float, credit: float):
+    if not debit and not credit:
+        return
+    db.query(models.LedgerCheckpoint).filter(
+        models.LedgerCheckpoint.company_id == company_id,
+        models.LedgerCheckpoint.month_start > txn_date
+    ).update({
+        models.LedgerCheckpoint.debit_total: models.LedgerCheckpoint.debit_total + debit,
+        models.LedgerCheckpoint.credit_total: models.LedgerCheckpoint.credit_total + credit
+    }, synchronize_session=False)
+
+def totals_before(db: Session, company_id: int, before: date):
+    """Ledger (debit, credit) totals for a company dated before `before`: one checkpoint plus at most a month of rows."""
+    cp = models.LedgerCheckpoint
+    checkpoint = db.query(cp).filter(
+        cp.company_id == company_id,
+        cp.month_start <= before
+    ).order_by(cp.month_start.desc()).first()
+
+    query = db.query(
+        func.coalesce(func.sum(models.Ledger.debit_amount), 0.0),
+        func.coalesce(func.sum(models.Ledger.credit_amount), 0.0)
+    ).filter(
+        models.Ledger.company_id == company_id,
+        models.Ledger.transaction_date < before
+    )
+    if not checkpoint:
+        return query.one()
+
+    debit, credit = query.filter(models.Ledger.transaction_date >= checkpoint.month_start).one()
+    return checkpoint.debit_total + debit, checkpoint.credit_total + credit
+
+# --- Running balances ---
+
+def _post_running(db: Session, company_id: int, txn_date: date, entry_id: int, debit: float, credit: float):
+    net = debit - credit
+    _ensure_checkpoint(db, company_id, month_start(txn_date))
+    _shift_checkpoints(db, company_id, txn_date, debit, credit)
+
+    # Repair the suffix after this entry, then place the entry on top of its predecessor
+    if net:
+        db.query(models.Ledger).filter(
+            models.Ledger.company_id == company_id,
+            _after(txn_date, entry_id)
+        ).update({models.Ledger.balance: models.Ledger.balance + net}, synchronize_session=False)
+
+    prev_balance = db.query(models.Ledger.balance).filter(
+        models.Ledger.company_id == company_id,
+        _before(txn_date, entry_id)
+    ).order_by(models.Ledger.transaction_date.desc(), models.Ledger.id.desc()).limit(1).scalar()
+
+    balance = (prev_balance or 0.0) + net
+    db.query(models.Ledger).filter(models.Ledger.id == entry_id).update(
+        {models.Ledger.balance: balance}, synchronize_session=False
+    )
+    return balance
+
+def _unpost_running(db: Session, company_id: int, txn_date: date, entry_id: int, debit: float, credit: float):
+    net = debit - credit
+    _shift_checkpoints(db, company_id, txn_date, -debit, -credit)
+    if net:
+        db.query(models.Ledger).filter(
+            models.Ledger.company_id == company_id,
+            models.Ledger.id != entry_id,
+            _after(txn_date, entry_id)
+        ).update({models.Ledger.balance: models.Ledger.balance - net}, synchronize_session=False)
+
+def repair_company(db: Session, company_id: int, from_date: date):
+    """Recompute running balances and checkpoints for a company from `from_date` onward, set-based."""
+    first_month = month_start(from_date)
+    _ensure_checkpoint(db, company_id, first_month)
+
+    # Running balances: predecessor balance + windowed cumulative sum over the suffix
+    prev_balance = db.query(models.Ledger.balance).filter(
+        models.Ledger.company_id == company_id,
+        models.Ledger.transaction_date < from_date
+    ).order_by(models.Ledger.transaction_date.desc(), models.Ledger.id.desc()).limit(1).scalar() or 0.0
+
+    running = select(
+        models.Ledger.id,
+        func.sum(_net(models.Ledger.debit_amount, models.Ledger.credit_amount)).over(
+            order_by=(models.Ledger.transaction_date, models.Ledger.id)
+        ).label("cumulative")
+    ).where(
+        models.Ledger.company_id == company_id,
+        models.Ledger.transaction_date >= from_date
+    ).subquery()
+
+    db.execute(
+        update(models.Ledger)
+        .where(models.Ledger.id == running.c.id)
+        .values(balance=prev_balance + running.c.cumulative)
+        .execution_options(synchronize_session=False)
+    )
+
+    # Checkpoints: the first month's checkpoint is unaffected; rebuild every later one from it
+    cp = models.LedgerCheckpoint
+    base = db.query(cp).filter(cp.company_id == company_id, cp.month_start == first_month).one()
+    db.query(cp).filter(cp.company_id == company_id, cp.month_start > first_month).delete(synchronize_session=False)
+
+    month_col = cast(func.date_trunc("month", models.Ledger.transaction_date), Date)
+    months = select(
+        month_col.label("month_start"),
+        func.coalesce(func.sum(models.Ledger.debit_amount), 0.0).label("debit"),
+        func.coalesce(func.sum(models.Ledger.credit_amount), 0.0).label("credit")
+    ).where(
+        models.Ledger.company_id == company_id,
+        models.Ledger.transaction_date >= first_month
+    ).group_by(month_col).subquery()
+
+    cumulative = select(
+        months.c.month_start,
+        (base.debit_total + func.coalesce(func.sum(months.c.debit).over(order_by=months.c.month_start, rows=(None, -1)), 0.0)).label("debit_total"),
+        (base.credit_total + func.coalesce(func.sum(months.c.credit).over(order_by=months.c.month_start, rows=(None, -1)), 0.0)).label("credit_total")
+    ).subquery()
+
+    db.execute(insert(cp).from_select(
+        ["company_id", "month_start", "debit_total", "credit_total"],
+        select(literal(company_id), cumulative.c.month_start, cumulative.c.debit_total, cumulative.c.credit_total)
+        .where(cumulative.c.month_start > first_month)
+    ))
+
+# --- Entry operations ---
+
+def add_entry(db: Session, entry: models.Ledger):
+    lock_companies(db, entry.company_id)
+    db.add(entry)
+    db.flush()
+
+    debit = entry.debit_amount or 0.0
+    credit = entry.credit_amount or 0.0
+    apply_balance_delta(db, entry.company_id, debit, credit)
+    balance = _post_running(db, entry.company_id, entry.transaction_date, entry.id, debit, credit)
+    set_committed_value(entry, "balance", balance)
+    return entry
+
+def update_entry(db: Session, entry: models.Ledger, **values):
+    old_company = entry.company_id
+    old_date = entry.transaction_date
+    old_debit = entry.debit_amount or 0.0
+    old_credit = entry.credit_amount or 0.0
+
+    for key, value in values.items():
+        setattr(entry, key, value)
+
+    new_debit = entry.debit_amount or 0.0
+    new_credit = entry.credit_amount or 0.0
+
+    if (entry.company_id, entry.transaction_date, new_debit, new_credit) == (old_company, old_date, old_debit, old_credit):
+        return entry
+
+    lock_companies(db, old_company, entry.company_id)
+    db.flush()
+
+    if entry.company_id == old_company:
+        apply_balance_delta(db, old_company, new_debit - old_debit, new_credit - old_credit)
+    else:
+        apply_balance_delta(db, old_company, -old_debit, -old_credit)
+        apply_balance_delta(db, entry.company_id, new_debit, new_credit)
+
+    # A moved or re-valued entry is taken out of its old position and posted at the new one
+    _unpost_running(db, old_company, old_date, entry.id, old_debit, old_credit)
+    balance = _post_running(db, entry.company_id, entry.transaction_date, entry.id, new_debit, new_credit)
+    set_committed_value(entry, "balance", balance)
+    return entry
+
+def insert_entries(db: Session, rows, pending: dict):
+    """Bulk-insert ledger rows (dicts) without posting them.
+
+    Per-company (first date, debit, credit) is accumulated into `pending`; call
+    post_pending() once after the last batch. The caller must already hold
+    lock_companies() for every company in `rows`.
+    """
+    if not rows:
+        return
+    db.execute(insert(models.Ledger), rows)
+    for row in rows:
+        first_date, debit, credit = pending.get(row["company_id"], (row["transaction_date"], 0.0, 0.0))
+        pending[row["company_id"]] = (
+            min(first_date, row["transaction_date"]),
+            debit + (row.get("debit_amount") or 0.0),
+            credit + (row.get("credit_amount") or 0.0)
+        )
+
+def post_pending(db: Session, pending: dict):
+    """Post rows added by insert_entries(): one balance delta and one set-based repair per company."""
+    for company_id, (first_date, debit, credit) in pending.items():
+        apply_balance_delta(db, company_id, debit, credit)
+        repair_company(db, company_id, first_date)
+
+def delete_entries(db: Session, *criteria):
+    # Totals and the earliest affected date per company, one grouped query regardless of row count
+    affected = db.query(
+        models.Ledger.company_id,
+        func.min(models.Ledger.transaction_date),
+        func.sum(models.Ledger.debit_amount),
+        func.sum(models.Ledger.credit_amount)
+    ).filter(*criteria).group_by(models.Ledger.company_id).all()
+
+    if not affected:
+        return 0
+
+    lock_companies(db, *[row[0] for row in affected])
+    deleted = db.query(models.Ledger).filter(*criteria).delete(synchronize_session=False)
+
+    for company_id, first_date, debit, credit in affected:
+        apply_balance_delta(db, company_id, -(debit or 0.0), -(credit or 0.0))
+        repair_company(db, company_id, first_date)
+
+    return deleted
+
+# --- Verification / rebuild ---
+
+def _ledger_totals(db: Session):
+    rows = db.query(
+        models.Ledger.company_id,
+        func.coalesce(func.sum(models.Ledger.debit_amount), 0.0),
+        func.coalesce(func.sum(models.Ledger.credit_amount), 0.0)
+    ).group_by(models.Ledger.company_id).all()
+    return {company_id: (debit, credit) for company_id, debit, credit in rows}
+
+def verify_company_balances(db: Session, tolerance: float = 0.005):
+    """Compare company_balances against a fresh aggregate of ledger. Returns drifted rows."""
+    expected = _ledger_totals(db)
+    stored = {
+        b.company_id: (b.debit_total, b.credit_total)
+        for b in db.query(models.CompanyBalance).all()
+    }
+
+    drift = []
+    for company_id in sorted(set(expected) | set(stored)):
+        exp_debit, exp_credit = expected.get(company_id, (0.0, 0.0))
+        cur_debit, cur_credit = stored.get(company_id, (0.0, 0.0))
+        if abs(exp_debit - cur_debit) > tolerance or abs(exp_credit - cur_credit) > tolerance:
+            drift.append({
+                "company_id": company_id,
+                "stored_debit": cur_debit,
+                "stored_credit": cur_credit,
+                "ledger_debit": exp_debit,
+                "ledger_credit": exp_credit
+            })
+    return drift
+
+def rebuild_company_balances(db: Session):
+    """Recompute company_balances from ledger in one statement. Caller commits."""
+    db.query(models.CompanyBalance).delete(synchronize_session=False)
+    totals = db.query(
+        models.Ledger.company_id,
+        func.coalesce(func.sum(models.Ledger.debit_amount), 0.0),
+        func.coalesce(func.sum(models.Ledger.credit_amount), 0.0)
+    ).group_by(models.Ledger.company_id)
+    db.execute(
+        insert(models.CompanyBalance).from_select(
+            ["company_id", "debit_total", "credit_total"], totals
+        )
+    )
+
+def _expected_running_balances():
+    return select(
+        models.Ledger.id,
+        func.sum(_net(models.Ledger.debit_amount, models.Ledger.credit_amount)).over(
+            partition_by=models.Ledger.company_id,
+            order_by=(models.Ledger.transaction_date, models.Ledger.id)
+        ).label("balance")
+    ).subquery()
+
+def _expected_checkpoints():
+    month_col = cast(func.date_trunc("month", models.Ledger.transaction_date), Date)
+    months = select(
+        models.Ledger.company_id,
+        month_col.label("month_start"),
+        func.coalesce(func.sum(models.Ledger.debit_amount), 0.0).label("debit"),
+        func.coalesce(func.sum(models.Ledger.credit_amount), 0.0).label("credit")
+    ).group_by(models.Ledger.company_id, month_col).subquery()
+
+    window = dict(partition_by=months.c.company_id, order_by=months.c.month_start, rows=(None, -1))
+    return select(
+        months.c.company_id,
+        months.c.month_start,
+        func.coalesce(func.sum(months.c.debit).over(**window), 0.0).label("debit_total"),
+        func.coalesce(func.sum(months.c.credit).over(**window), 0.0).label("credit_total")
+    ).subquery()
+
+def verify_running_balances(db: Session, tolerance: float = 0.005):
+    """Count ledger rows and checkpoints whose stored values differ from a full recompute."""
+    expected = _expected_running_balances()
+    bad_rows = db.query(func.count()).select_from(models.Ledger).join(
+        expected, expected.c.id == models.Ledger.id
+    ).filter(func.abs(func.coalesce(models.Ledger.balance, 0.0) - expected.c.balance) > tolerance).scalar()
+
+    cp = models.LedgerCheckpoint
+    expected_cp = _expected_checkpoints()
+    bad_checkpoints = db.query(func.count()).select_from(expected_cp).outerjoin(
+        cp, (cp.company_id == expected_cp.c.company_id) & (cp.month_start == expected_cp.c.month_start)
+    ).filter(
+        (cp.company_id == None) |
+        (func.abs(cp.debit_total - expected_cp.c.debit_total) > tolerance) |
+        (func.abs(cp.credit_total - expected_cp.c.credit_total) > tolerance)
+    ).scalar()
+
+    return {"ledger_rows": bad_rows, "checkpoints": bad_checkpoints}
+
+def rebuild_running_balances(db: Session):
+    """Recompute ledger.balance and ledger_checkpoints for every company. Caller commits."""
+    expected = _expected_running_balances()
+    db.execute(
+        update(models.Ledger)
+        .where(models.Ledger.id == expected.c.id)
+        .values(balance=expected.c.balance)
+        .execution_options(synchronize_session=False)
+    )
+
+    db.query(models.LedgerCheckpoint).delete(synchronize_session=False)
+    expected_cp = _expected_checkpoints()
+    db.execute(insert(models.LedgerCheckpoint).from_select(
+        ["company_id", "month_start", "debit_total", "credit_total"],
+        select(expected_cp.c.company_id, expected_cp.c.month_start, expected_cp.c.debit_total, expected_cp.c.credit_total)
+    ))
@@ -0,0 +1,197 @@
+from sqlalchemy import func, select, cast, case, literal, String, Date
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import models, money
+from .models import GSTType
+from .posting import month_start
+
+# Monthly rollups of sales and purchases (monthly_rollups).
+# Write paths call add/remove/replace with an entry taken from the Sales/Billing row, in the
+# same transaction as the row itself; rebuild_rollups() backfills from scratch.
+
+SALES = "sales"
+PURCHASE = "purchase"
+
+MEASURES = (
+    "invoice_count",
+    "base_amount",
+    "cgst_amount",
+    "sgst_amount",
+    "igst_amount",
+    "gst_amount",
+    "tcs_amount",
+    "tds_amount",
+    "tds_base_amount",
+    "tds_bill_count",
+    "total_amount",
+)
+
+KEY_COLUMNS = ["kind", "month_start", "company_id", "process_type"]
+
+def _process_key(process_type) -> str:
+    if process_type is None:
+        return ""
+    return getattr(process_type, "value", process_type)
+
+def sale_entry(sale: models.Sales):
+    """(key, measures) for one sales invoice, taken from its current attribute values."""
+    cgst = sale.cgst_amount or 0.0
+    sgst = sale.sgst_amount or 0.0
+    igst = sale.igst_amount or 0.0
+    key = (SALES, month_start(sale.invoice_date), sale.company_id, _process_key(sale.process_type))
+    return key, {
+        "invoice_count": 1,
+        "base_amount": sale.base_amount or 0.0,
+        "cgst_amount": cgst,
+        "sgst_amount": sgst,
+        "igst_amount": igst,
+        "gst_amount": cgst + sgst + igst,
+        "tcs_amount": sale.tcs_amount or 0.0,
+        "tds_amount": 0.0,
+        "tds_base_amount": 0.0,
+        "tds_bill_count": 0,
+        "total_amount": sale.total_amount or 0.0,
+    }
+
+def bill_entry(bill: models.Billing):
+    """(key, measures) for one purchase bill. Billing stores total GST only, so split it by gst_type."""
+    gst = bill.gst_amount or 0.0
+    cgst = sgst = igst = 0.0
+    if bill.gst_type == GSTType.INTRA_STATE:
+        cgst, sgst = money.split_gst(gst)
+    elif bill.gst_type == GSTType.INTER_STATE:
+        igst = gst
+
+    key = (PURCHASE, month_start(bill.bill_date), bill.vendor_id, _process_key(bill.process_type))
+    return key, {
+        "invoice_count": 1,
+        "base_amount": bill.base_amount or 0.0,
+        "cgst_amount": cgst,
+        "sgst_amount": sgst,
+        "igst_amount": igst,
+        "gst_amount": gst,
+        "tcs_amount": 0.0,
+        "tds_amount": bill.tds_amount or 0.0,
+        "tds_base_amount": (bill.base_amount or 0.0) if bill.tds_applicable else 0.0,
+        "tds_bill_count": 1 if bill.tds_applicable else 0,
+        "total_amount": bill.total_amount or 0.0,
+    }
+
+def _upsert(db: Session, values):
+    stmt = insert(models.MonthlyRollup).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={name: getattr(models.MonthlyRollup, name) + stmt.excluded[name] for name in MEASURES}
+    )
+    db.execute(stmt)
+
+def _apply(db: Session, entry, sign: int):
+    key, measures = entry
+    _upsert(db, [dict(zip(KEY_COLUMNS, key), **{name: value * sign for name, value in measures.items()})])
+
+def add(db: Session, entry):
+    _apply(db, entry, 1)
+
+def _apply_many(db: Session, entries, sign: int):
+    merged = {}
+    for key, measures in entries:
+        totals = merged.setdefault(key, dict.fromkeys(MEASURES, 0))
+        for name, value in measures.items():
+            totals[name] += value * sign
+    if merged:
+        _upsert(db, [dict(zip(KEY_COLUMNS, key), **totals) for key, totals in merged.items()])
+
+def add_many(db: Session, entries):
+    """Add a batch of entries with one multi-row upsert (entries sharing a key are summed first,
+    since one INSERT ... ON CONFLICT can't touch the same row twice)."""
+    _apply_many(db, entries, 1)
+
+def remove(db: Session, entry):
+    _apply(db, entry, -1)
+
+def remove_many(db: Session, entries):
+    _apply_many(db, entries, -1)
+
+def replace(db: Session, old_entry, new_entry):
+    if old_entry == new_entry:
+        return
+    remove(db, old_entry)
+    add(db, new_entry)
+
+# --- Backfill / verification ---
+
+def _expected_sales():
+    month = cast(func.date_trunc("month", models.Sales.invoice_date), Date)
+    process = func.coalesce(func.lower(cast(models.Sales.process_type, String)), "")
+    cgst = func.coalesce(models.Sales.cgst_amount, 0.0)
+    sgst = func.coalesce(models.Sales.sgst_amount, 0.0)
+    igst = func.coalesce(models.Sales.igst_amount, 0.0)
+    return select(
+        literal(SALES).label("kind"),
+        month.label("month_start"),
+        models.Sales.company_id.label("company_id"),
+        process.label("process_type"),
+        func.count().label("invoice_count"),
+        func.coalesce(func.sum(models.Sales.base_amount), 0.0).label("base_amount"),
+        func.sum(cgst).label("cgst_amount"),
+        func.sum(sgst).label("sgst_amount"),
+        func.sum(igst).label("igst_amount"),
+        func.sum(cgst + sgst + igst).label("gst_amount"),
+        func.coalesce(func.sum(models.Sales.tcs_amount), 0.0).label("tcs_amount"),
+        literal(0.0).label("tds_amount"),
+        literal(0.0).label("tds_base_amount"),
+        literal(0).label("tds_bill_count"),
+        func.coalesce(func.sum(models.Sales.total_amount), 0.0).label("total_amount"),
+    ).group_by(month, models.Sales.company_id, process)
+
+def _expected_purchases():
+    month = cast(func.date_trunc("month", models.Billing.bill_date), Date)
+    process = func.coalesce(models.Billing.process_type, "")
+    gst = func.coalesce(models.Billing.gst_amount, 0.0)
+    intra = models.Billing.gst_type == GSTType.INTRA_STATE
+    cgst, sgst = money.split_gst_sql(gst)
+    return select(
+        literal(PURCHASE).label("kind"),
+        month.label("month_start"),
+        models.Billing.vendor_id.label("company_id"),
+        process.label("process_type"),
+        func.count().label("invoice_count"),
+        func.coalesce(func.sum(models.Billing.base_amount), 0.0).label("base_amount"),
+        func.sum(case((intra, cgst), else_=0.0)).label("cgst_amount"),
+        func.sum(case((intra, sgst), else_=0.0)).label("sgst_amount"),
+        func.sum(case((models.Billing.gst_type == GSTType.INTER_STATE, gst), else_=0.0)).label("igst_amount"),
+        func.sum(gst).label("gst_amount"),
+        literal(0.0).label("tcs_amount"),
+        func.coalesce(func.sum(models.Billing.tds_amount), 0.0).label("tds_amount"),
+        func.sum(case((models.Billing.tds_applicable == True, func.coalesce(models.Billing.base_amount, 0.0)), else_=0.0)).label("tds_base_amount"),
+        func.sum(case((models.Billing.tds_applicable == True, 1), else_=0)).label("tds_bill_count"),
+        func.coalesce(func.sum(models.Billing.total_amount), 0.0).label("total_amount"),
+    ).group_by(month, models.Billing.vendor_id, process)
+
+def rebuild_rollups(db: Session):
+    """Recompute monthly_rollups from sales and billing. Caller commits."""
+    db.query(models.MonthlyRollup).delete(synchronize_session=False)
+    for query in (_expected_sales(), _expected_purchases()):
+        db.execute(insert(models.MonthlyRollup).from_select(KEY_COLUMNS + list(MEASURES), query))
+
+def verify_rollups(db: Session, tolerance: float = 0.005):
+    """Keys whose stored measures differ from a fresh aggregate (rows that net to zero count as absent)."""
+    def rows_to_dict(rows):
+        return {
+            tuple(row[k] for k in KEY_COLUMNS): {m: row[m] for m in MEASURES}
+            for row in rows
+        }
+
+    expected = {}
+    for query in (_expected_sales(), _expected_purchases()):
+        expected.update(rows_to_dict(db.execute(query).mappings()))
+    stored = rows_to_dict(db.execute(select(models.MonthlyRollup.__table__)).mappings())
+
+    zero = {m: 0 for m in MEASURES}
+    drifted = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        exp = expected.get(key, zero)
+        cur = stored.get(key, zero)
+        if any(abs((exp[m] or 0) - (cur[m] or 0)) > tolerance for m in MEASURES):
+            drifted.append(key)
+    return drifted
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import select, tuple_, literal, DateTime
+from typing import Optional
+from datetime import datetime
+import base64
+from .. import models, jobs, audit_partitions
+from ..database import engine
+from ..dependencies import get_db, RoleChecker
+from ..models import UserRole
+
+router = APIRouter(
+    prefix="/audit",
+    tags=["Audit Log"]
+)
+
+allow_audit = RoleChecker([UserRole.OWNER])
+
+AUDIT_PAGE_SIZE = 100
+AUDIT_MAX_PAGE_SIZE = 500
+
+AUDIT_COLUMNS = (
+    models.AuditLog.id,
+    models.AuditLog.timestamp,
+    models.AuditLog.user_id,
+    models.User.email.label("user_email"),
+    models.AuditLog.action,
+    models.AuditLog.table_name,
+    models.AuditLog.record_id,
+    models.AuditLog.old_value,
+    models.AuditLog.new_value,
+    models.AuditLog.ip_address
+)
+
+def _encode_cursor(timestamp: datetime, entry_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{entry_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(entry_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/")
+def read_audit_log(
+    table_name: Optional[str] = None,
+    record_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_audit)
+):
+    """Audit entries, newest first, in pages keyed on (timestamp, id).
+
+    Filter by `table_name` + `record_id` (one record's history) or `user_id` (one user's
+    actions) to use the matching index; `from_time`/`to_time` also prune whole monthly
+    partitions. Pass the returned `next_cursor` back as `cursor` for the next page.
+    """
+    if record_id is not None and not table_name:
+        raise HTTPException(status_code=400, detail="record_id needs table_name")
+
+    query = select(*AUDIT_COLUMNS).outerjoin(models.User, models.User.id == models.AuditLog.user_id)
+    if table_name:
+        query = query.where(models.AuditLog.table_name == table_name)
+    if record_id is not None:
+        query = query.where(models.AuditLog.record_id == record_id)
+    if user_id is not None:
+        query = query.where(models.AuditLog.user_id == user_id)
+    if action:
+        query = query.where(models.AuditLog.action == action)
+    if from_time:
+        query = query.where(models.AuditLog.timestamp >= from_time)
+    if to_time:
+        query = query.where(models.AuditLog.timestamp < to_time)
+    if cursor:
+        timestamp, entry_id = _decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.AuditLog.timestamp, models.AuditLog.id) < tuple_(literal(timestamp, DateTime(timezone=True)), literal(entry_id))
+        )
+
+    rows = db.execute(
+        query.order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc()).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "success": True,
+        "data": {
+            "entries": [dict(row._mapping) for row in rows],
+            "next_cursor": _encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None
+        },
+        "message": "Audit log page retrieved"
+    }
+
+@jobs.job_kind("audit_archive", roles=[UserRole.OWNER])
+def archive_audit_log(ctx: jobs.JobContext, params: dict):
+    """Job: create upcoming audit_logs partitions and archive the months past retention."""
+    created = audit_partitions.ensure_partitions(engine, log=lambda msg: None)
+    retention = int(params.get("retention_months", audit_partitions.AUDIT_RETENTION_MONTHS))
+    archived = audit_partitions.archive_partitions(engine, retention, log=lambda msg: None, progress=ctx.progress)
+    return {"partitions_created": created, "archived": archived}
@@ -2,16 +2,20 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
+from typing import List
 from .. import auth, models, schemas, database, audit
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_current_user, RoleChecker
+from ..models import UserRole
 
 router = APIRouter(
     prefix="/auth",
     tags=["Authentication"]
 )
 
+allow_manage_users = RoleChecker([UserRole.OWNER])
+
 @router.post("/login", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
     if not user or not auth.verify_password(form_data.password, user.password_hash):
         # Log failed attempt
@@ -46,7 +50,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     }
 
 @router.post("/refresh", response_model=schemas.Token)
-async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
+def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
     payload = auth.decode_refresh_token(refresh_token)
     if payload is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
@@ -74,10 +78,49 @@ async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
     }
 
 @router.get("/me", response_model=schemas.UserOut)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 @router.post("/logout")
-async def logout(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def logout(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     audit.log_action(db, current_user.id, "logout", "users", current_user.id)
     return {"message": "Successfully logged out"}
+
+@router.get("/users", response_model=List[schemas.UserOut])
+def read_users(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_manage_users)
+):
+    return db.query(models.User).order_by(models.User.id).all()
+
+@router.put("/users/{user_id}", response_model=schemas.UserOut)
+def update_user(
+    user_id: int,
+    user_update: schemas.UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_manage_users)
+):
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    old_data = {"full_name": db_user.full_name, "role": db_user.role, "is_active": db_user.is_active}
+    update_data = user_update.dict(exclude_unset=True)
+
+    if db_user.id == current_user.id and (update_data.get("is_active") is False or update_data.get("role", UserRole.OWNER) != UserRole.OWNER):
+        raise HTTPException(status_code=400, detail="You cannot deactivate or demote your own account")
+
+    password = update_data.pop("password", None)
+    if password:
+        db_user.password_hash = auth.get_password_hash(password)
+    for key, value in update_data.items():
+        setattr(db_user, key, value)
+
+    audit.record(db, current_user.id, "update", "users", db_user.id, old_data, {
+        **update_data, **({"password": "changed"} if password else {})
+    })
+    # Committing also drops the user from the auth cache (see dependencies.py)
+    db.commit()
+    db.refresh(db_user)
+
+    return db_user
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime
-from .. import models, schemas, audit
+from .. import models, schemas, audit, posting, rollups, invoicing, jobs, closing, money
+from ..cache import invalidate_dashboard
 from ..dependencies import get_db, get_current_active_user, RoleChecker
 from ..models import UserRole, GSTType, TransactionType
 
@@ -15,7 +18,7 @@ allow_write = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT])
 allow_delete = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT])
 
 @router.post("/", response_model=schemas.BillingOut, status_code=status.HTTP_201_CREATED)
-async def create_bill(
+def create_bill(
     bill: schemas.BillingCreate, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_write)
@@ -23,29 +26,15 @@ async def create_bill(
     vendor = db.query(models.Company).filter(models.Company.id == bill.vendor_id).first()
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
+    closing.ensure_open(db, bill.bill_date, bill.payment_date)
 
-    # Calculate amounts
-    base_amount = bill.quantity * bill.rate
-    gst_amount = base_amount * (bill.gst_rate / 100)
-    
-    tds_amount = 0.0
-    if bill.tds_applicable:
-        tds_amount = base_amount * (bill.tds_rate / 100)
-        
-    total_amount = base_amount + gst_amount - tds_amount
-    
-    bill_data = bill.dict()
-    bill_data["base_amount"] = base_amount
-    bill_data["gst_amount"] = gst_amount
-    bill_data["tds_amount"] = tds_amount
-    bill_data["total_amount"] = total_amount
-    bill_data["amount_due"] = total_amount - bill.amount_paid
-    bill_data["created_by"] = current_user.id
+    bill_data = invoicing.bill_values(bill, current_user.id)
     
     db_bill = models.Billing(**bill_data)
     db.add(db_bill)
-    db.commit()
-    db.refresh(db_bill)
+    rollups.add(db, rollups.bill_entry(db_bill))
+    # One transaction for the whole bill: flush assigns IDs, the single commit is at the end
+    db.flush()
     
     # Ledger Entry (Credit Vendor - Payable)
     # When we license a bill, we OWE money. So Credit the Vendor.
@@ -56,10 +45,10 @@ async def create_bill(
         reference_id=db_bill.id,
         reference_model="Billing",
         debit_amount=0.0,
-        credit_amount=total_amount,
+        credit_amount=bill_data["total_amount"],
         narration=f"Bill #{db_bill.bill_number} - {bill.item_description or ''}"
     )
-    db.add(ledger_entry)
+    posting.add_entry(db, ledger_entry)
     
     # If amount paid > 0, record Payment (Debit Vendor)
     if bill.amount_paid > 0:
@@ -74,9 +63,7 @@ async def create_bill(
             created_by=current_user.id
         )
         db.add(payment)
-        
-        db.commit()
-        db.refresh(payment)
+        db.flush()
         
         ledger_payment = models.Ledger(
             company_id=bill.vendor_id,
@@ -88,16 +75,38 @@ async def create_bill(
             credit_amount=0.0,
             narration=f"Payment for Bill #{db_bill.bill_number}"
         )
-        db.add(ledger_payment)
+        posting.add_entry(db, ledger_payment)
         
+    audit.record(db, current_user.id, "create", "billing", db_bill.id, None, bill_data)
     db.commit()
-    
-    audit.log_action(db, current_user.id, "create", "billing", db_bill.id, None, bill_data)
+    invalidate_dashboard(bill.bill_date)
     
     return db_bill
 
+@router.post("/bulk", response_model=schemas.APIResponse)
+def create_bills_bulk(
+    bills: List[schemas.BillingCreate],
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_write)
+):
+    """Create many bills in one transaction. Items with an unknown vendor are reported
+    in their result and skipped; the rest are created together."""
+    if len(bills) > invoicing.MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {invoicing.MAX_BULK_ITEMS} bills per request")
+
+    results = invoicing.create_bills(db, bills, current_user.id)
+    db.commit()
+    invalidate_dashboard(*{bill.bill_date for bill in bills})
+
+    created = sum(1 for result in results if result["success"])
+    return {
+        "success": created == len(bills),
+        "data": results,
+        "message": f"Created {created} of {len(bills)} bills"
+    }
+
 @router.get("/", response_model=schemas.APIResponse)
-async def read_bills(
+def read_bills(
     skip: int = 0, 
     limit: int = 20, 
     vendor_id: Optional[int] = None,
@@ -118,7 +127,7 @@ async def read_bills(
     }
 
 @router.get("/{bill_id}", response_model=schemas.APIResponse)
-async def read_bill(
+def read_bill(
     bill_id: int, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
@@ -133,7 +142,7 @@ async def read_bill(
     }
 
 @router.delete("/{bill_id}")
-async def delete_bill(
+def delete_bill(
     bill_id: int, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_delete)
@@ -142,33 +151,61 @@ async def delete_bill(
     if not bill:
          raise HTTPException(status_code=404, detail="Bill not found")
     
-    # 1. Delete all payments linked to this bill
-    payments = db.query(models.Payment).filter(models.Payment.billing_id == bill_id).all()
-    for payment in payments:
-        # 1.1 Delete ledger entries for each payment
-        db.query(models.Ledger).filter(
-            models.Ledger.reference_id == payment.id,
-            models.Ledger.reference_model == "Payment"
-        ).delete()
-        # 1.2 Delete the payment itself
-        db.delete(payment)
-         
-    # 2. Delete main ledger entry for the bill
-    db.query(models.Ledger).filter(
-        models.Ledger.reference_id == bill_id,
-        models.Ledger.reference_model == "Billing"
-    ).delete()
-    
-    # 3. Delete the bill
-    db.delete(bill)
+    # Payments, their ledger rows, the bill's ledger rows, rollups and audit in one set-based pass
+    dates = invoicing.delete_bills(db, [bill_id], current_user.id)
     db.commit()
-    
-    audit.log_action(db, current_user.id, "delete", "billing", bill_id)
+    invalidate_dashboard(*dates)
     
     return {"message": "Bill deleted successfully"}
 
+@router.post("/bulk-delete", response_model=schemas.APIResponse)
+def delete_bills_bulk(
+    selection: schemas.BillingDeleteFilter,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_delete)
+):
+    """Delete every bill matching the filter. Up to invoicing.DELETE_CHUNK_SIZE bills go at
+    once; larger selections are queued as a billing_delete job (202, poll GET /jobs/{job_id})."""
+    criteria = invoicing.bill_criteria(selection)
+    if not criteria:
+        raise HTTPException(status_code=400, detail="Give at least one of start_date, end_date or vendor_id")
+
+    count = db.query(func.count(models.Billing.id)).filter(*criteria).scalar()
+    if count > invoicing.DELETE_CHUNK_SIZE:
+        job = jobs.submit(db, "billing_delete", jsonable_encoder(selection), current_user.id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "success": True,
+            "data": {"job_id": job.id, "status": job.status, "matched": count},
+            "message": f"Deletion of {count} bills queued"
+        }
+
+    ids = [bill_id for (bill_id,) in db.query(models.Billing.id).filter(*criteria)]
+    dates = invoicing.delete_bills(db, ids, current_user.id)
+    db.commit()
+    invalidate_dashboard(*dates)
+    return {
+        "success": True,
+        "data": {"deleted_count": len(dates)},
+        "message": f"Deleted {len(dates)} bills"
+    }
+
+@jobs.job_kind("billing_delete", roles=[UserRole.OWNER, UserRole.ACCOUNTANT])
+def run_delete_bills(ctx: jobs.JobContext, params: dict):
+    """Job: delete the bills matching a BillingDeleteFilter in chunks, committing once at the end."""
+    db = ctx.db
+    criteria = invoicing.bill_criteria(schemas.BillingDeleteFilter(**params))
+    if not criteria:
+        raise ValueError("Give at least one of start_date, end_date or vendor_id")
+    ids = [bill_id for (bill_id,) in db.query(models.Billing.id).filter(*criteria).order_by(models.Billing.id)]
+    dates = invoicing.delete_in_chunks(db, invoicing.delete_bills, ids, ctx.user_id, progress=ctx.progress)
+    db.commit()
+    invalidate_dashboard(*set(dates))
+    return {"deleted_count": len(dates)}
+
 @router.put("/{bill_id}", response_model=schemas.BillingOut)
-async def update_bill(
+def update_bill(
     bill_id: int, 
     bill_update: schemas.BillingUpdate, 
     db: Session = Depends(get_db),
@@ -179,7 +216,12 @@ async def update_bill(
         raise HTTPException(status_code=404, detail="Bill not found")
         
     old_data = schemas.BillingOut.from_orm(db_bill).dict()
+    old_rollup = rollups.bill_entry(db_bill)
     update_data = bill_update.dict(exclude_unset=True)
+    closing.ensure_open(
+        db, db_bill.bill_date, db_bill.payment_date,
+        update_data.get("bill_date"), update_data.get("payment_date")
+    )
     
     # Update fields
     for key, value in update_data.items():
@@ -188,31 +230,12 @@ async def update_bill(
     # Recalculate totals if any financial field changed
     recalc_fields = ["quantity", "rate", "gst_rate", "tds_applicable", "tds_rate", "amount_paid"]
     if any(field in update_data for field in recalc_fields):
-        base_amount = db_bill.quantity * db_bill.rate
-        gst_amount = base_amount * (db_bill.gst_rate / 100)
-        tds_amount = 0.0
-        if db_bill.tds_applicable:
-            tds_amount = base_amount * (db_bill.tds_rate / 100)
-            
-        total_amount = base_amount + gst_amount - tds_amount
-        
-        db_bill.base_amount = base_amount
-        db_bill.gst_amount = gst_amount
-        db_bill.tds_amount = tds_amount
-        db_bill.total_amount = total_amount
-        db_bill.amount_due = total_amount - db_bill.amount_paid
-        
-        # Update Ledger for Bill (Purchase)
-        ledger_entry = db.query(models.Ledger).filter(
-            models.Ledger.reference_id == bill_id,
-            models.Ledger.reference_model == "Billing",
-            models.Ledger.transaction_type == TransactionType.PURCHASE
-        ).first()
-        
-        if ledger_entry:
-            ledger_entry.credit_amount = total_amount
-            ledger_entry.transaction_date = db_bill.bill_date
-            ledger_entry.narration = f"Bill #{db_bill.bill_number} (Updated) - {db_bill.item_description or ''}"
+        amounts = money.bill_amounts(
+            db_bill.quantity, db_bill.rate, db_bill.gst_rate,
+            db_bill.tds_applicable, db_bill.tds_rate, db_bill.amount_paid
+        )
+        for key, value in amounts.items():
+            setattr(db_bill, key, value)
 
         # Update Payment Ledger if amount_paid changed
         # Note: If there are multiple separate payments, this single 'amount_paid' field model is limiting.
@@ -232,8 +255,11 @@ async def update_bill(
                         models.Ledger.reference_model == "Payment"
                     ).first()
                     if ledger_pay:
-                        ledger_pay.debit_amount = db_bill.amount_paid
-                        ledger_pay.transaction_date = payment.payment_date
+                        posting.update_entry(
+                            db, ledger_pay,
+                            debit_amount=db_bill.amount_paid,
+                            transaction_date=payment.payment_date
+                        )
                 else:
                     # If changed to 0, maybe delete payment? Or keep as 0? 
                     # Simpler to set to 0.
@@ -243,7 +269,7 @@ async def update_bill(
                         models.Ledger.reference_model == "Payment"
                     ).first()
                     if ledger_pay:
-                        ledger_pay.debit_amount = 0
+                        posting.update_entry(db, ledger_pay, debit_amount=0)
             
             # If no existing payment but now paid > 0, create it (complexity: duplicate payments? handling simplistically)
             elif db_bill.amount_paid > 0:
@@ -258,8 +284,7 @@ async def update_bill(
                     created_by=current_user.id
                 )
                 db.add(payment)
-                db.commit() # Need ID
-                db.refresh(payment)
+                db.flush() # Need ID
                 
                 ledger_payment = models.Ledger(
                     company_id=db_bill.vendor_id,
@@ -271,11 +296,33 @@ async def update_bill(
                     credit_amount=0.0,
                     narration=f"Payment for Bill #{db_bill.bill_number}"
                 )
-                db.add(ledger_payment)
+                posting.add_entry(db, ledger_payment)
+
+    # The bill's ledger row follows its amount, and its vendor and date as its rollup does;
+    # payments linked to it move to the new vendor too
+    moved = "vendor_id" in update_data or "bill_date" in update_data
+    if moved or any(field in update_data for field in recalc_fields):
+        ledger_entry = db.query(models.Ledger).filter(
+            models.Ledger.reference_id == bill_id,
+            models.Ledger.reference_model == "Billing",
+            models.Ledger.transaction_type == TransactionType.PURCHASE
+        ).first()
+        
+        if ledger_entry:
+            posting.update_entry(
+                db, ledger_entry,
+                company_id=db_bill.vendor_id,
+                credit_amount=db_bill.total_amount,
+                transaction_date=db_bill.bill_date,
+                narration=f"Bill #{db_bill.bill_number} (Updated) - {db_bill.item_description or ''}"
+            )
+    if "vendor_id" in update_data:
+        invoicing.move_payments(db, "billing_id", bill_id, db_bill.vendor_id)
 
+    rollups.replace(db, old_rollup, rollups.bill_entry(db_bill))
+    audit.record(db, current_user.id, "update", "billing", bill_id, old_data, update_data)
     db.commit()
     db.refresh(db_bill)
-    
-    audit.log_action(db, current_user.id, "update", "billing", bill_id, old_data, update_data)
+    invalidate_dashboard(old_data["bill_date"], db_bill.bill_date)
     
     return db_bill
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import List
+from .. import models, schemas, audit, periods, closing
+from ..cache import invalidate_dashboard
+from ..dependencies import get_db, get_current_active_user, RoleChecker
+from ..models import UserRole
+
+router = APIRouter(
+    prefix="/periods",
+    tags=["Period Close"]
+)
+
+allow_close = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT])
+allow_reopen = RoleChecker([UserRole.OWNER])
+
+@router.get("/closed", response_model=List[schemas.PeriodCloseOut])
+def read_closed_periods(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    return closing.list_closed(db)
+
+@router.post("/close", response_model=schemas.APIResponse)
+def close_period(
+    selection: schemas.PeriodSelection,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_close)
+):
+    """Close a month, quarter or financial year that has ended. Its sales, bills, payments and
+    ledger rows can no longer change, and its reports are snapshotted."""
+    start, end = periods.resolve_period(selection.month, selection.year, selection.fy, selection.quarter)
+    months = closing.close_period(db, start, end, current_user.id)
+    audit.record(db, current_user.id, "close", "period_closes", None, None, {"start": start, "end": end, "months": months})
+    db.commit()
+
+    return {
+        "success": True,
+        "data": {"closed": months},
+        "message": f"Closed {len(months)} months"
+    }
+
+@router.post("/reopen", response_model=schemas.APIResponse)
+def reopen_period(
+    selection: schemas.PeriodSelection,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_reopen)
+):
+    """Reopen closed months so they can be edited again; their snapshots are dropped."""
+    start, end = periods.resolve_period(selection.month, selection.year, selection.fy, selection.quarter)
+    months = closing.reopen_period(db, start, end)
+    audit.record(db, current_user.id, "reopen", "period_closes", None, None, {"start": start, "end": end, "months": months})
+    db.commit()
+    # Reports of the reopened months are computed live again
+    invalidate_dashboard(*months)
+
+    return {
+        "success": True,
+        "data": {"reopened": months},
+        "message": f"Reopened {len(months)} months"
+    }
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from .. import models, schemas, audit
+from .. import models, schemas, audit, closing
+from ..cache import gst_return_cache
 from ..dependencies import get_db, get_current_user, get_current_active_user, RoleChecker
 from ..models import UserRole
 
@@ -15,7 +16,7 @@ allow_create_edit = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT])
 allow_delete = RoleChecker([UserRole.OWNER])
 
 @router.post("/", response_model=schemas.CompanyOut, status_code=status.HTTP_201_CREATED)
-async def create_company(
+def create_company(
     company: schemas.CompanyCreate, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_create_edit)
@@ -34,15 +35,15 @@ async def create_company(
     
     db_company = models.Company(**company.dict())
     db.add(db_company)
+    db.flush()
+    audit.record(db, current_user.id, "create", "companies", db_company.id, None, company.dict())
     db.commit()
     db.refresh(db_company)
     
-    audit.log_action(db, current_user.id, "create", "companies", db_company.id, None, company.dict())
-    
     return db_company
 
 @router.get("/", response_model=schemas.APIResponse)
-async def read_companies(
+def read_companies(
     skip: int = 0, 
     limit: int = 100, 
     q: Optional[str] = None,
@@ -73,7 +74,7 @@ async def read_companies(
     }
 
 @router.get("/{company_id}", response_model=schemas.APIResponse)
-async def read_company(
+def read_company(
     company_id: int, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
@@ -88,7 +89,7 @@ async def read_company(
     }
 
 @router.put("/{company_id}", response_model=schemas.CompanyOut)
-async def update_company(
+def update_company(
     company_id: int, 
     company_update: schemas.CompanyUpdate, 
     db: Session = Depends(get_db),
@@ -117,19 +118,25 @@ async def update_company(
         existing = db.query(models.Company).filter(models.Company.gst_number == update_data["gst_number"]).first()
         if existing and existing.id != company_id:
             raise HTTPException(status_code=400, detail="Company with this GST already exists")
+
+    # Every closed period's balances start from the opening balance
+    if any(update_data[key] != old_data[key] for key in ("opening_balance", "balance_type") if key in update_data):
+        closing.ensure_opening_open(db)
             
     for key, value in update_data.items():
         setattr(db_company, key, value)
     
+    audit.record(db, current_user.id, "update", "companies", company_id, old_data, update_data)
     db.commit()
     db.refresh(db_company)
-    
-    audit.log_action(db, current_user.id, "update", "companies", company_id, old_data, update_data)
+    # GSTIN, state and name decide how a party's invoices appear in every GST return
+    if {"gst_number", "state", "name"} & update_data.keys():
+        gst_return_cache.clear()
     
     return db_company
 
 @router.delete("/{company_id}")
-async def delete_company(
+def delete_company(
     company_id: int, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_delete)
@@ -140,8 +147,7 @@ async def delete_company(
     
     # Soft delete
     db_company.is_active = False
+    audit.record(db, current_user.id, "delete", "companies", company_id)
     db.commit()
     
-    audit.log_action(db, current_user.id, "delete", "companies", company_id)
-    
     return {"message": "Company deleted successfully (soft delete)"}
@@ -1,169 +1,137 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func, select, case, and_, true
 from typing import List, Optional
 from datetime import datetime, date
-from .. import models, schemas
+from .. import models, schemas, periods, rollups, closing
+from ..cache import dashboard_cache
 from ..dependencies import get_db, get_current_active_user
-from ..models import UserRole, TransactionType, PaymentMode
+from ..models import UserRole, TransactionType, PaymentMode, PaymentStatus
 
 router = APIRouter(
     prefix="/dashboard",
     tags=["Dashboard"]
 )
 
+@closing.snapshot_kind("dashboard")
+def _period_figures(db: Session, start: date, end: date):
+    # Period totals for sales and purchases from the monthly rollups, in one round trip
+    r = models.MonthlyRollup
+
+    def measure(kind, column):
+        return func.coalesce(func.sum(case((r.kind == kind, column), else_=0.0)), 0.0)
+
+    row = db.execute(
+        select(
+            measure(rollups.SALES, r.total_amount).label("sales_total"),
+            measure(rollups.SALES, r.gst_amount).label("gst_output"),
+            measure(rollups.PURCHASE, r.total_amount).label("purchase_total"),
+            measure(rollups.PURCHASE, r.gst_amount).label("gst_input"),
+            measure(rollups.PURCHASE, r.tds_amount).label("tds_deducted")
+        ).where(periods.in_range(r.month_start, start, end))
+    ).one()
+    return dict(row._mapping)
+
+def _balance_figures(db: Session):
+    # Outstanding receivables/payables and cash/bank movement, all-time, in one round trip
+    bank_modes = [PaymentMode.BANK, PaymentMode.UPI, PaymentMode.CHEQUE, PaymentMode.NEFT, PaymentMode.RTGS]
+
+    def payment_sum(payment_type, mode_filter):
+        return func.coalesce(func.sum(case(
+            (and_(models.Payment.payment_type == payment_type, mode_filter), models.Payment.amount),
+            else_=0.0
+        )), 0.0)
+
+    receivables = select(
+        func.coalesce(func.sum(models.Sales.amount_due), 0.0).label("receivables")
+    ).where(models.Sales.payment_status != PaymentStatus.PAID).subquery()
+
+    payables = select(
+        func.coalesce(func.sum(models.Billing.amount_due), 0.0).label("payables")
+    ).where(models.Billing.payment_status != PaymentStatus.PAID).subquery()
+
+    payments = select(
+        payment_sum(TransactionType.RECEIPT, models.Payment.payment_mode == PaymentMode.CASH).label("cash_receipts"),
+        payment_sum(TransactionType.PAYMENT, models.Payment.payment_mode == PaymentMode.CASH).label("cash_payments"),
+        payment_sum(TransactionType.RECEIPT, models.Payment.payment_mode.in_(bank_modes)).label("bank_receipts"),
+        payment_sum(TransactionType.PAYMENT, models.Payment.payment_mode.in_(bank_modes)).label("bank_payments")
+    ).subquery()
+
+    row = db.execute(
+        select(receivables, payables, payments).select_from(
+            receivables.join(payables, true()).join(payments, true())
+        )
+    ).one()
+    return {
+        "receivables": row.receivables,
+        "payables": row.payables,
+        # Cash/Bank Balance = receipts - payments; all non-cash modes count as bank
+        "cash_balance": row.cash_receipts - row.cash_payments,
+        "bank_balance": row.bank_receipts - row.bank_payments
+    }
+
 @router.get("/summary", response_model=schemas.APIResponse)
-async def dashboard_summary(
+def dashboard_summary(
     month: int = Query(datetime.now().month),
     year: int = Query(datetime.now().year),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    # Function to calculate totals
-    def get_total_sales(m, y):
-        return db.query(func.sum(models.Sales.total_amount)).filter(
-            extract('month', models.Sales.invoice_date) == m,
-            extract('year', models.Sales.invoice_date) == y
-        ).scalar() or 0.0
-
-    def get_total_purchases(m, y):
-        return db.query(func.sum(models.Billing.total_amount)).filter(
-            extract('month', models.Billing.bill_date) == m,
-            extract('year', models.Billing.bill_date) == y
-        ).scalar() or 0.0
-
-    total_sales = get_total_sales(month, year)
-    total_purchases = get_total_purchases(month, year)
-    
-    # Receivables / Payables (Outstanding) -> calculated from Ledger Summary logic generally, 
-    # but for speed we can sum amount_due from Sales/Billing tables directly
-    receivables = db.query(func.sum(models.Sales.amount_due)).filter(models.Sales.payment_status != 'paid').scalar() or 0.0
-    payables = db.query(func.sum(models.Billing.amount_due)).filter(models.Billing.payment_status != 'paid').scalar() or 0.0
-    
-    # Cash Balance (Total Cash Receipts - Total Cash Payments)
-    # Simple approx:
-    cash_receipts = db.query(func.sum(models.Payment.amount)).filter(
-        models.Payment.payment_type == TransactionType.RECEIPT,
-        models.Payment.payment_mode == PaymentMode.CASH
-    ).scalar() or 0.0
-    
-    cash_payments = db.query(func.sum(models.Payment.amount)).filter(
-        models.Payment.payment_type == TransactionType.PAYMENT,
-        models.Payment.payment_mode == PaymentMode.CASH
-    ).scalar() or 0.0
-    
-    cash_balance = cash_receipts - cash_payments
-    
-    # Bank Balance (Total Bank Receipts - Total Bank Payments)
-    # This assumes all non-cash are "Bank" for simplicity or filters specific modes
-    bank_modes = [PaymentMode.BANK, PaymentMode.UPI, PaymentMode.CHEQUE, PaymentMode.NEFT, PaymentMode.RTGS]
-    bank_receipts = db.query(func.sum(models.Payment.amount)).filter(
-        models.Payment.payment_type == TransactionType.RECEIPT,
-        models.Payment.payment_mode.in_(bank_modes)
-    ).scalar() or 0.0
-    
-    bank_payments = db.query(func.sum(models.Payment.amount)).filter(
-        models.Payment.payment_type == TransactionType.PAYMENT,
-        models.Payment.payment_mode.in_(bank_modes)
-    ).scalar() or 0.0
-    
-    bank_balance = bank_receipts - bank_payments
-    
-    # GST Output (Sales)
-    gst_output = db.query(
-        func.sum(models.Sales.cgst_amount) + 
-        func.sum(models.Sales.sgst_amount) + 
-        func.sum(models.Sales.igst_amount)
-    ).filter(
-        extract('month', models.Sales.invoice_date) == month,
-        extract('year', models.Sales.invoice_date) == year
-    ).scalar() or 0.0
-    
-    # GST Input (Purchases)
-    gst_input = db.query(func.sum(models.Billing.gst_amount)).filter(
-        extract('month', models.Billing.bill_date) == month,
-        extract('year', models.Billing.bill_date) == year
-    ).scalar() or 0.0
-    
-    # TDS Deducted
-    tds_deducted = db.query(func.sum(models.Billing.tds_amount)).filter(
-        extract('month', models.Billing.bill_date) == month,
-        extract('year', models.Billing.bill_date) == year
-    ).scalar() or 0.0
+    # Two aggregate queries, each cached until a write touches it (see cache.invalidate_dashboard).
+    # A closed month's figures come from its snapshot.
+    start, end = periods.resolve_period(month, year)
+    period = dashboard_cache.get_or_set(("period", month, year), lambda: closing.report(db, "dashboard", start, end))
+    balances = dashboard_cache.get_or_set(("balances",), lambda: _balance_figures(db))
 
     return {
         "success": True,
         "data": {
-            "sales_total": total_sales,
-            "purchase_total": total_purchases,
-            "receivables": receivables,
-            "payables": payables,
-            "cash_balance": cash_balance,
-            "bank_balance": bank_balance,
-            "gst_payable": gst_output - gst_input,
-            "tds_deducted": tds_deducted,
-            "profit_loss": total_sales - total_purchases # Rough P&L
+            "sales_total": period["sales_total"],
+            "purchase_total": period["purchase_total"],
+            "receivables": balances["receivables"],
+            "payables": balances["payables"],
+            "cash_balance": balances["cash_balance"],
+            "bank_balance": balances["bank_balance"],
+            "gst_payable": period["gst_output"] - period["gst_input"],
+            "tds_deducted": period["tds_deducted"],
+            "profit_loss": period["sales_total"] - period["purchase_total"] # Rough P&L
         },
         "message": "Dashboard summary"
     }
 
 @router.get("/charts", response_model=schemas.APIResponse)
-async def dashboard_charts(
+def dashboard_charts(
     period: str = "12months",
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    # Sales vs Purchase Trend (Last 12 months)
-    # This requires complex SQL grouping by month.
-    
-    # Simplified approach: fetch raw data aggregated by month for last year
-    # We will just return 2 arrays: sales, purchases for last 12 months?
-    # Or simplified logic: Just dummy logic or basic group by?
-    
-    # Correct Group By for Sales
-    sales_trend = db.query(
-        extract('month', models.Sales.invoice_date).label('month'),
-        extract('year', models.Sales.invoice_date).label('year'),
-        func.sum(models.Sales.total_amount).label('total')
-    ).group_by(
-        extract('year', models.Sales.invoice_date),
-        extract('month', models.Sales.invoice_date)
-    ).order_by(
-        extract('year', models.Sales.invoice_date).desc(),
-        extract('month', models.Sales.invoice_date).desc()
-    ).limit(12).all()
-    
-    # Convert to friendly format
-    sales_data = {}
-    for entry in sales_trend:
-        key = f"{int(entry.month)}/{int(entry.year)}"
-        sales_data[key] = entry.total
-        
-    purchase_trend = db.query(
-        extract('month', models.Billing.bill_date).label('month'),
-        extract('year', models.Billing.bill_date).label('year'),
-        func.sum(models.Billing.total_amount).label('total')
-    ).group_by(
-        extract('year', models.Billing.bill_date),
-        extract('month', models.Billing.bill_date)
-    ).order_by(
-        extract('year', models.Billing.bill_date).desc(),
-        extract('month', models.Billing.bill_date).desc()
-    ).limit(12).all()
-    
-    purchase_data = {}
-    for entry in purchase_trend:
-        key = f"{int(entry.month)}/{int(entry.year)}"
-        purchase_data[key] = entry.total
+    # Sales vs Purchase Trend (Last 12 months with activity), read from the monthly rollups
+    def trend(kind):
+        rows = db.query(
+            models.MonthlyRollup.month_start,
+            func.sum(models.MonthlyRollup.total_amount).label('total')
+        ).filter(
+            models.MonthlyRollup.kind == kind,
+            models.MonthlyRollup.invoice_count > 0
+        ).group_by(
+            models.MonthlyRollup.month_start
+        ).order_by(
+            models.MonthlyRollup.month_start.desc()
+        ).limit(12).all()
+        return {f"{entry.month_start.month}/{entry.month_start.year}": entry.total for entry in rows}
+
+    sales_data = trend(rollups.SALES)
+    purchase_data = trend(rollups.PURCHASE)
 
     # Merge labels
     labels = sorted(list(set(list(sales_data.keys()) + list(purchase_data.keys()))), 
                    key=lambda x: (int(x.split('/')[1]), int(x.split('/')[0])))
     
     # Credit vs Debit (Receivables vs Payables)
-    # Re-using logic from summary for consistent chart data
-    receivables = db.query(func.sum(models.Sales.amount_due)).filter(models.Sales.payment_status != 'paid').scalar() or 0.0
-    payables = db.query(func.sum(models.Billing.amount_due)).filter(models.Billing.payment_status != 'paid').scalar() or 0.0
+    # Re-using the (cached) summary figures for consistent chart data
+    balances = dashboard_cache.get_or_set(("balances",), lambda: _balance_figures(db))
+    receivables = balances["receivables"]
+    payables = balances["payables"]
 
     chart_data = {
         "labels": labels,
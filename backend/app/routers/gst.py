@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func
 from typing import Optional
 from datetime import datetime
-from .. import models, schemas
+import csv
+import io
+from .. import models, schemas, periods, rollups, gst_returns
 from ..dependencies import get_db, get_current_active_user
 
 router = APIRouter(
@@ -12,53 +15,45 @@ router = APIRouter(
 )
 
 @router.get("/summary", response_model=schemas.APIResponse)
-async def gst_summary(
+def gst_summary(
     month: int = Query(datetime.now().month),
     year: int = Query(datetime.now().year),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    # Output GST components
-    sales_gst = db.query(
-        func.sum(models.Sales.cgst_amount).label('cgst'),
-        func.sum(models.Sales.sgst_amount).label('sgst'),
-        func.sum(models.Sales.igst_amount).label('igst')
-    ).filter(
-        extract('month', models.Sales.invoice_date) == month,
-        extract('year', models.Sales.invoice_date) == year
-    ).first()
+    start, end = periods.resolve_period(month, year)
+
+    # GST components from the monthly rollups (purchase GST is split by gst_type when rolled up)
+    r = models.MonthlyRollup
+    gst_rows = {
+        row.kind: row for row in db.query(
+            r.kind,
+            func.sum(r.cgst_amount).label('cgst'),
+            func.sum(r.sgst_amount).label('sgst'),
+            func.sum(r.igst_amount).label('igst')
+        ).filter(
+            periods.in_range(r.month_start, start, end)
+        ).group_by(r.kind).all()
+    }
+    sales_gst = gst_rows.get(rollups.SALES)
+    purchase_gst = gst_rows.get(rollups.PURCHASE)
+
+    def component(row, name):
+        return (getattr(row, name) or 0.0) if row else 0.0
 
-    # Input GST components (Billing table stores total gst_amount, if split needed we need type)
-    # Billing model has gst_type and gst_amount. We can derive split.
-    # Logic:
-    # If gst_type == INTRA_STATE: cgst = gst/2, sgst = gst/2
-    # If gst_type == INTER_STATE: igst = gst
-    
-    input_intra = db.query(func.sum(models.Billing.gst_amount)).filter(
-        extract('month', models.Billing.bill_date) == month,
-        extract('year', models.Billing.bill_date) == year,
-        models.Billing.gst_type == models.GSTType.INTRA_STATE
-    ).scalar() or 0.0
-    
-    input_inter = db.query(func.sum(models.Billing.gst_amount)).filter(
-        extract('month', models.Billing.bill_date) == month,
-        extract('year', models.Billing.bill_date) == year,
-        models.Billing.gst_type == models.GSTType.INTER_STATE
-    ).scalar() or 0.0
-    
     output_data = {
-        "cgst": sales_gst.cgst or 0.0,
-        "sgst": sales_gst.sgst or 0.0,
-        "igst": sales_gst.igst or 0.0,
-        "total": (sales_gst.cgst or 0.0) + (sales_gst.sgst or 0.0) + (sales_gst.igst or 0.0)
+        "cgst": component(sales_gst, "cgst"),
+        "sgst": component(sales_gst, "sgst"),
+        "igst": component(sales_gst, "igst"),
     }
+    output_data["total"] = output_data["cgst"] + output_data["sgst"] + output_data["igst"]
     
     input_data = {
-        "cgst": input_intra / 2,
-        "sgst": input_intra / 2,
-        "igst": input_inter,
-        "total": input_intra + input_inter
+        "cgst": component(purchase_gst, "cgst"),
+        "sgst": component(purchase_gst, "sgst"),
+        "igst": component(purchase_gst, "igst"),
     }
+    input_data["total"] = input_data["cgst"] + input_data["sgst"] + input_data["igst"]
     
     return {
         "success": True,
@@ -69,3 +64,62 @@ async def gst_summary(
         },
         "message": "GST Summary"
     }
+
+@router.get("/gstr1")
+def read_gstr1(
+    month: int = Query(datetime.now().month),
+    year: int = Query(datetime.now().year),
+    fy: Optional[int] = None,
+    quarter: Optional[int] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|csv)$"),
+    section: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """GSTR-1 for a month (or a quarter with `fy` and `quarter`).
+
+    JSON follows the GSTN offline-tool layout (b2b, b2cl, b2cs, hsn) with rate- and
+    state-wise summaries. `format=csv&section=b2b` returns one section as a flat CSV;
+    sections: b2b, b2cl, b2cs, hsn, rate_wise, state_wise, documents.
+    """
+    start, end = periods.resolve_period(month, year, fy, quarter)
+    if response_format == "csv":
+        if section not in gst_returns.GSTR1_SECTIONS:
+            raise HTTPException(status_code=400, detail=f"section must be one of {', '.join(gst_returns.GSTR1_SECTIONS)}")
+        rows = gst_returns.gstr1_sections(db, start, end)[section]
+        return _csv_response(rows, f"gstr1-{section}-{start.isoformat()}.csv")
+
+    return {
+        "success": True,
+        "data": {"period": {"start": start, "end": end}, **gst_returns.gstr1(db, start, end)},
+        "message": "GSTR-1"
+    }
+
+@router.get("/gstr3b", response_model=schemas.APIResponse)
+def read_gstr3b(
+    month: int = Query(datetime.now().month),
+    year: int = Query(datetime.now().year),
+    fy: Optional[int] = None,
+    quarter: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """GSTR-3B for a month (or a quarter with `fy` and `quarter`): 3.1(a), 3.2, ITC and net tax."""
+    start, end = periods.resolve_period(month, year, fy, quarter)
+    return {
+        "success": True,
+        "data": {"period": {"start": start, "end": end}, **gst_returns.gstr3b(db, start, end)},
+        "message": "GSTR-3B"
+    }
+
+def _csv_response(rows, filename: str):
+    buffer = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    return StreamingResponse(
+        iter([buffer.getvalue()]),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from typing import List
+import os
+from .. import models, schemas, jobs
+from ..dependencies import get_db, get_current_active_user
+from ..models import UserRole
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Background Jobs"]
+)
+
+def _get_job(db: Session, job_id: int, user: models.User) -> models.Job:
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    # Users see their own jobs; the owner sees everyone's
+    if not job or (job.created_by != user.id and user.role != UserRole.OWNER):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    job_in: schemas.JobCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    kind = jobs.KINDS.get(job_in.kind)
+    if not kind:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind. Available: {', '.join(sorted(jobs.KINDS))}")
+    if current_user.role not in kind.roles:
+        raise HTTPException(status_code=403, detail="Operation not permitted")
+    return jobs.submit(db, job_in.kind, job_in.params, current_user.id)
+
+@router.get("/", response_model=List[schemas.JobOut])
+def read_jobs(
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    query = db.query(models.Job)
+    if current_user.role != UserRole.OWNER:
+        query = query.filter(models.Job.created_by == current_user.id)
+    return query.order_by(models.Job.id.desc()).limit(min(limit, 100)).all()
+
+@router.get("/{job_id}", response_model=schemas.JobOut)
+def read_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    return _get_job(db, job_id, current_user)
+
+@router.post("/{job_id}/cancel", response_model=schemas.JobOut)
+def cancel_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    job = _get_job(db, job_id, current_user)
+    if job.status in jobs.FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return jobs.cancel(db, job)
+
+@router.get("/{job_id}/download")
+def download_job_file(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    job = _get_job(db, job_id, current_user)
+    filename = (job.result or {}).get("file")
+    if job.status != models.JobStatus.SUCCEEDED.value or not filename:
+        raise HTTPException(status_code=404, detail="Job has no file to download")
+    path = jobs.export_path(job.id, filename)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Export file has expired. Please run the export again.")
+    return FileResponse(path, filename=filename)
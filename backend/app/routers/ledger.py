@@ -1,9 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, tuple_, literal, Date
 from typing import List, Optional
 from datetime import date
-from .. import models, schemas, audit
+import base64
+import csv
+import json
+from .. import models, schemas, audit, posting, jobs, periods, closing, money
+from ..cache import invalidate_dashboard
+from ..database import SessionLocal
 from ..dependencies import get_db, get_current_active_user, RoleChecker
 from ..models import UserRole, BalanceType
 
@@ -12,8 +19,66 @@ router = APIRouter(
     tags=["Ledger"]
 )
 
+STATEMENT_PAGE_SIZE = 200
+STATEMENT_MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+STATEMENT_COLUMNS = (
+    models.Ledger.id,
+    models.Ledger.transaction_date,
+    models.Ledger.transaction_type,
+    models.Ledger.reference_id,
+    models.Ledger.reference_model,
+    models.Ledger.debit_amount,
+    models.Ledger.credit_amount,
+    models.Ledger.narration,
+    models.Ledger.balance
+)
+
+def _company_opening(company: models.Company):
+    # Opening balance as (debit, credit)
+    if company.balance_type == BalanceType.DEBIT:
+        return company.opening_balance or 0.0, 0.0
+    return 0.0, company.opening_balance or 0.0
+
+def _encode_cursor(txn_date: date, entry_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{txn_date.isoformat()}:{entry_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        txn_date, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return date.fromisoformat(txn_date), int(entry_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _statement_query(company_id: int, from_date: Optional[date], to_date: Optional[date], after=None):
+    query = select(*STATEMENT_COLUMNS).where(models.Ledger.company_id == company_id)
+    if from_date:
+        query = query.where(models.Ledger.transaction_date >= from_date)
+    if to_date:
+        query = query.where(models.Ledger.transaction_date <= to_date)
+    if after:
+        # Keyset on (transaction_date, id), served by ix_ledger_company_date_id
+        query = query.where(
+            tuple_(models.Ledger.transaction_date, models.Ledger.id) > tuple_(literal(after[0], Date), literal(after[1]))
+        )
+    return query.order_by(models.Ledger.transaction_date.asc(), models.Ledger.id.asc())
+
+def _statement_entry(row, company_opening_net: float) -> dict:
+    return {
+        "id": row.id,
+        "transaction_date": row.transaction_date.isoformat(),
+        "transaction_type": row.transaction_type.value if row.transaction_type else None,
+        "reference_id": row.reference_id,
+        "reference_model": row.reference_model,
+        "debit_amount": row.debit_amount or 0.0,
+        "credit_amount": row.credit_amount or 0.0,
+        "narration": row.narration,
+        "running_balance": company_opening_net + (row.balance or 0.0)
+    }
+
 @router.get("/company/{company_id}", response_model=schemas.APIResponse)
-async def read_ledger(
+def read_ledger(
     company_id: int,
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
@@ -25,53 +90,33 @@ async def read_ledger(
         raise HTTPException(status_code=404, detail="Company not found")
 
     # Get Opening Balance
-    opening_debit = 0.0
-    opening_credit = 0.0
-    
-    if company.balance_type == BalanceType.DEBIT:
-        opening_debit = company.opening_balance
-    else:
-        opening_credit = company.opening_balance
+    opening_debit, opening_credit = _company_opening(company)
 
     # Query Ledger Entries
     query = db.query(models.Ledger).filter(models.Ledger.company_id == company_id)
     
     if from_date:
         query = query.filter(models.Ledger.transaction_date >= from_date)
-        # We need to calculate balance BEFORE from_date to provide "Brought Forward"
-        # Logic: Sum all transactions BEFORE from_date
-        bf_query = db.query(
-            func.sum(models.Ledger.debit_amount), 
-            func.sum(models.Ledger.credit_amount)
-        ).filter(
-            models.Ledger.company_id == company_id,
-            models.Ledger.transaction_date < from_date
-        )
-        bf_debit, bf_credit = bf_query.first()
-        opening_debit += (bf_debit or 0.0)
-        opening_credit += (bf_credit or 0.0)
+        # "Brought Forward" = nearest monthly checkpoint + the rows between it and from_date
+        bf_debit, bf_credit = posting.totals_before(db, company_id, from_date)
+        opening_debit += bf_debit
+        opening_credit += bf_credit
 
     if to_date:
         query = query.filter(models.Ledger.transaction_date <= to_date)
         
     entries = query.order_by(models.Ledger.transaction_date.asc(), models.Ledger.id.asc()).all()
     
-    # Calculate Running Balance
-    formatted_entries = []
+    # Ledger.balance is the stored running (debit - credit) from the company's first entry,
+    # so each row's running balance is just the company opening balance plus that.
+    company_debit, company_credit = _company_opening(company)
+    company_opening = company_debit - company_credit
     
-    # Initial running balance
-    # Net Balance = Debit - Credit
     current_balance = opening_debit - opening_credit
-    
-    # Add Opening Entry row if from_date is not set or we want to show it
-    # Ideally frontend handles "Opening Balance" row, but we can return it as first item or separate field.
-    # Let's return it as a list of entries including a virtual "Opening" row if filtered?
-    # Or just return current_balance as starting point.
-    
-    # Let's iterate and populate running_balance
+    formatted_entries = []
     
     for entry in entries:
-        current_balance += (entry.debit_amount - entry.credit_amount)
+        current_balance = company_opening + (entry.balance or 0.0)
         
         entry_dict = schemas.LedgerOut.from_orm(entry).dict()
         entry_dict["running_balance"] = current_balance
@@ -92,54 +137,269 @@ async def read_ledger(
         "message": "Ledger retrieved successfully"
     }
 
-@router.get("/summary", response_model=schemas.APIResponse)
-async def read_ledger_summary(
+def _brought_forward(db: Session, company: models.Company, from_date: Optional[date], after=None):
+    # Returns (opening balance dict for a first page or None, running balance before the page)
+    company_debit, company_credit = _company_opening(company)
+
+    if after:
+        after_date, after_id = after
+        # Running balance of the last row of the previous page
+        row_balance = db.query(models.Ledger.balance).filter(
+            models.Ledger.id == after_id,
+            models.Ledger.company_id == company.id,
+            models.Ledger.transaction_date == after_date
+        ).scalar()
+        if row_balance is None:
+            # That row has since been deleted or redated, or the cursor is another company's:
+            # total this company's rows up to the cursor's (transaction_date, id) instead
+            debit, credit = posting.totals_before(db, company.id, after_date)
+            day_debit, day_credit = db.query(
+                func.coalesce(func.sum(models.Ledger.debit_amount), 0.0),
+                func.coalesce(func.sum(models.Ledger.credit_amount), 0.0)
+            ).filter(
+                models.Ledger.company_id == company.id,
+                models.Ledger.transaction_date == after_date,
+                models.Ledger.id <= after_id
+            ).one()
+            row_balance = money.total(debit, day_debit, -credit, -day_credit)
+        return None, company_debit - company_credit + row_balance
+
+    opening_debit, opening_credit = company_debit, company_credit
+    if from_date:
+        bf_debit, bf_credit = posting.totals_before(db, company.id, from_date)
+        opening_debit += bf_debit
+        opening_credit += bf_credit
+    net = opening_debit - opening_credit
+    return {"debit": opening_debit, "credit": opening_credit, "net": net}, net
+
+def _stream_statement(company_id: int, from_date: Optional[date], to_date: Optional[date], after=None):
+    # Runs after the request's session is gone, so it owns its session.
+    # yield_per streams rows through a server-side cursor instead of loading the whole history.
+    db = SessionLocal()
+    try:
+        company = db.query(models.Company).filter(models.Company.id == company_id).first()
+        company_debit, company_credit = _company_opening(company)
+        company_opening = company_debit - company_credit
+        opening, brought_forward = _brought_forward(db, company, from_date, after)
+
+        yield json.dumps({
+            "type": "header",
+            "company": jsonable_encoder(schemas.CompanyOut.from_orm(company)),
+            "opening_balance": opening,
+            "balance_brought_forward": brought_forward
+        }) + "\n"
+
+        rows = db.execute(
+            _statement_query(company_id, from_date, to_date, after).execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+
+        count = 0
+        closing = brought_forward
+        batch = []
+        for row in rows:
+            entry = _statement_entry(row, company_opening)
+            closing = entry["running_balance"]
+            batch.append(json.dumps({"type": "entry", **entry}))
+            count += 1
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield "\n".join(batch) + "\n"
+                batch = []
+        if batch:
+            yield "\n".join(batch) + "\n"
+
+        yield json.dumps({"type": "footer", "count": count, "closing_balance": closing}) + "\n"
+    finally:
+        db.close()
+
+@router.get("/company/{company_id}/statement")
+def read_ledger_statement(
+    company_id: int,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(STATEMENT_PAGE_SIZE, ge=1, le=STATEMENT_MAX_PAGE_SIZE),
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    # Summary of all companies: Total Receivable, Total Payable
-    companies = db.query(models.Company).filter(models.Company.is_active == True).all()
-    
+    """Ledger statement in fixed-size pages keyed on (transaction_date, id).
+
+    Pass the returned `next_cursor` back as `cursor` for the next page. Every page carries the
+    running balance brought forward, so pages can be rendered independently. With
+    `format=ndjson` the remaining statement is streamed as one JSON object per line
+    (header, entries, footer) instead of being paged.
+    """
+    company = db.query(models.Company).filter(models.Company.id == company_id).first()
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+
+    after = _decode_cursor(cursor) if cursor else None
+
+    if response_format == "ndjson":
+        return StreamingResponse(
+            _stream_statement(company_id, from_date, to_date, after),
+            media_type="application/x-ndjson"
+        )
+
+    company_debit, company_credit = _company_opening(company)
+    company_opening = company_debit - company_credit
+    opening, brought_forward = _brought_forward(db, company, from_date, after)
+
+    rows = db.execute(_statement_query(company_id, from_date, to_date, after).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    entries = [_statement_entry(row, company_opening) for row in rows]
+    carried_forward = entries[-1]["running_balance"] if entries else brought_forward
+    next_cursor = _encode_cursor(rows[-1].transaction_date, rows[-1].id) if has_more else None
+
+    return {
+        "success": True,
+        "data": {
+            "company": schemas.CompanyOut.from_orm(company),
+            "opening_balance": opening,
+            "balance_brought_forward": brought_forward,
+            "entries": entries,
+            "balance_carried_forward": carried_forward,
+            "next_cursor": next_cursor
+        },
+        "message": "Ledger statement page retrieved"
+    }
+
+@jobs.job_kind("ledger_export", roles=[UserRole.OWNER, UserRole.ACCOUNTANT, UserRole.MERCHANDISER])
+def export_statement(ctx: jobs.JobContext, params: dict):
+    """Job: write a company's ledger statement to CSV, streamed from a server-side cursor."""
+    db = ctx.db
+    company = db.query(models.Company).filter(models.Company.id == params.get("company_id")).first()
+    if not company:
+        raise ValueError("Company not found")
+    from_date = date.fromisoformat(params["from_date"]) if params.get("from_date") else None
+    to_date = date.fromisoformat(params["to_date"]) if params.get("to_date") else None
+
+    company_debit, company_credit = _company_opening(company)
+    company_opening = company_debit - company_credit
+    opening, _ = _brought_forward(db, company, from_date)
+
+    query = _statement_query(company.id, from_date, to_date)
+    total = db.execute(select(func.count()).select_from(query.subquery())).scalar()
+    filename = f"ledger-{company.id}.csv"
+    path = jobs.new_export_file(ctx.job_id, filename)
+
+    count = 0
+    closing = opening["net"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Type", "Reference", "Narration", "Debit", "Credit", "Balance"])
+        writer.writerow([from_date.isoformat() if from_date else "", "", "", "Opening Balance", opening["debit"], opening["credit"], opening["net"]])
+        for row in db.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+            entry = _statement_entry(row, company_opening)
+            closing = entry["running_balance"]
+            writer.writerow([
+                entry["transaction_date"], entry["transaction_type"],
+                f"{entry['reference_model'] or ''} {entry['reference_id'] or ''}".strip(),
+                entry["narration"], entry["debit_amount"], entry["credit_amount"], closing
+            ])
+            count += 1
+            if count % STREAM_BATCH_SIZE == 0:
+                ctx.progress(count, total)
+
+    return {"file": filename, "rows": count, "closing_balance": closing}
+
+@jobs.job_kind("ledger_rebuild", roles=[UserRole.OWNER])
+def rebuild_ledger(ctx: jobs.JobContext, params: dict):
+    """Job: recompute company_balances, running balances and checkpoints from the ledger."""
+    db = ctx.db
+    drift = posting.verify_company_balances(db)
+    posting.rebuild_company_balances(db)
+    ctx.progress(1, 2)
+    posting.rebuild_running_balances(db)
+    db.commit()
+    invalidate_dashboard()
+    return {"balances_corrected": len(drift)}
+
+def _summarize(rows):
     summary_data = []
+    receivables = []
+    payables = []
     
-    total_receivable = 0.0
-    total_payable = 0.0
-    
-    for comp in companies:
-        # Calculate balance
-        # Optimization: group by query if dataset large, but loop ok for small
-        
+    for row in rows:
         # Opening
-        balance = comp.opening_balance if comp.balance_type == BalanceType.DEBIT else -comp.opening_balance
-        
-        # Transactions
-        sums = db.query(
-            func.sum(models.Ledger.debit_amount),
-            func.sum(models.Ledger.credit_amount)
-        ).filter(models.Ledger.company_id == comp.id).first()
+        opening = row.opening_balance or 0.0
+        opening = opening if row.balance_type == BalanceType.DEBIT else -opening
         
-        debits = sums[0] or 0.0
-        credits = sums[1] or 0.0
-        
-        balance += (debits - credits)
+        # Transactions, summed exactly (see money.py)
+        balance = money.total(opening, row.debits, -row.credits)
         
         if balance > 0:
-            total_receivable += balance
+            receivables.append(balance)
         else:
-            total_payable += abs(balance)
+            payables.append(-balance)
             
         summary_data.append({
-            "company_name": comp.name,
+            "company_name": row.name,
             "balance": balance,
             "status": "Receivable" if balance > 0 else "Payable"
         })
+
+    return {
+        "total_receivable": money.total(*receivables),
+        "total_payable": money.total(*payables),
+        "details": summary_data
+    }
+
+@closing.snapshot_kind("ledger_summary")
+def _summary_as_of(db: Session, start: date, end: date):
+    # Balances at the end of the period: ledger totals of every row dated before `end`
+    totals = select(
+        models.Ledger.company_id,
+        func.sum(models.Ledger.debit_amount).label("debits"),
+        func.sum(models.Ledger.credit_amount).label("credits")
+    ).where(models.Ledger.transaction_date < end).group_by(models.Ledger.company_id).subquery()
+
+    rows = db.query(
+        models.Company.name,
+        models.Company.opening_balance,
+        models.Company.balance_type,
+        func.coalesce(totals.c.debits, 0.0).label("debits"),
+        func.coalesce(totals.c.credits, 0.0).label("credits")
+    ).outerjoin(
+        totals, totals.c.company_id == models.Company.id
+    ).filter(models.Company.is_active == True).all()
+    return _summarize(rows)
+
+@router.get("/summary", response_model=schemas.APIResponse)
+def read_ledger_summary(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    fy: Optional[int] = None,
+    quarter: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Receivable/payable per company, now or, given a period (month/year, fy, or fy and
+    quarter), as at its end. A closed period's balances come from its snapshot."""
+    # Summary of all companies: Total Receivable, Total Payable
+    if month is not None or fy is not None:
+        start, end = periods.resolve_period(month, year, fy, quarter)
+        return {
+            "success": True,
+            "data": {"period": {"start": start, "end": end}, **closing.report(db, "ledger_summary", start, end)},
+            "message": "Ledger summary retrieved"
+        }
+
+    # Ledger totals come from the company_balances aggregate, so this is a single read
+    rows = db.query(
+        models.Company.name,
+        models.Company.opening_balance,
+        models.Company.balance_type,
+        func.coalesce(models.CompanyBalance.debit_total, 0.0).label("debits"),
+        func.coalesce(models.CompanyBalance.credit_total, 0.0).label("credits")
+    ).outerjoin(
+        models.CompanyBalance, models.CompanyBalance.company_id == models.Company.id
+    ).filter(models.Company.is_active == True).all()
         
     return {
         "success": True,
-        "data": {
-            "total_receivable": total_receivable,
-            "total_payable": total_payable,
-            "details": summary_data
-        },
+        "data": _summarize(rows),
         "message": "Ledger summary retrieved"
     }
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-from .. import models, schemas, audit
+from .. import models, schemas, audit, posting, closing, money
+from ..cache import invalidate_dashboard
 from ..dependencies import get_db, get_current_active_user, RoleChecker
 from ..models import UserRole, TransactionType, PaymentStatus
 
@@ -15,7 +16,7 @@ allow_write = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT])
 allow_delete = RoleChecker([UserRole.OWNER])
 
 @router.post("/", response_model=schemas.PaymentOut, status_code=status.HTTP_201_CREATED)
-async def create_payment(
+def create_payment(
     payment: schemas.PaymentCreate, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_write)
@@ -24,6 +25,8 @@ async def create_payment(
     company = db.query(models.Company).filter(models.Company.id == payment.company_id).first()
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
+    # Payments against an invoice from a closed month are fine, as long as they're dated in an open one
+    closing.ensure_open(db, payment.payment_date)
 
     # Save payment record
     payment_data = payment.dict()
@@ -31,8 +34,8 @@ async def create_payment(
     
     db_payment = models.Payment(**payment_data)
     db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
+    # One transaction for the payment, its ledger entry and the linked invoice: flush for the ID
+    db.flush()
     
     # Update Ledger
     ledger_debit = 0.0
@@ -60,14 +63,14 @@ async def create_payment(
         credit_amount=ledger_credit,
         narration=narration
     )
-    db.add(ledger_entry)
+    posting.add_entry(db, ledger_entry)
     
     # Handle Invoice Linking (Sales)
     if payment.sales_id:
         sale = db.query(models.Sales).filter(models.Sales.id == payment.sales_id).first()
         if sale:
-            sale.amount_paid += payment.amount
-            sale.amount_due = sale.total_amount - sale.amount_paid
+            sale.amount_paid = money.total(sale.amount_paid, payment.amount)
+            sale.amount_due = money.total(sale.total_amount, -sale.amount_paid)
             if sale.amount_due <= 0:
                 sale.payment_status = PaymentStatus.PAID
                 sale.amount_due = 0 # Prevent negative
@@ -87,8 +90,8 @@ async def create_payment(
     if payment.billing_id:
         bill = db.query(models.Billing).filter(models.Billing.id == payment.billing_id).first()
         if bill:
-            bill.amount_paid += payment.amount
-            bill.amount_due = bill.total_amount - bill.amount_paid
+            bill.amount_paid = money.total(bill.amount_paid, payment.amount)
+            bill.amount_due = money.total(bill.total_amount, -bill.amount_paid)
             if bill.amount_due <= 0:
                 bill.payment_status = PaymentStatus.PAID
                 bill.amount_due = 0
@@ -101,14 +104,15 @@ async def create_payment(
             bill.payment_mode = payment.payment_mode
             db.add(bill)
             
+    audit.record(db, current_user.id, "create", "payments", db_payment.id, None, payment_data)
     db.commit()
-    
-    audit.log_action(db, current_user.id, "create", "payments", db_payment.id, None, payment_data)
+    # Payments move cash/bank and outstanding totals, which aren't month-scoped
+    invalidate_dashboard()
     
     return db_payment
 
 @router.get("/", response_model=schemas.APIResponse)
-async def read_payments(
+def read_payments(
     skip: int = 0, 
     limit: int = 20, 
     company_id: Optional[int] = None,
@@ -132,7 +136,7 @@ async def read_payments(
     }
 
 @router.put("/{payment_id}", response_model=schemas.PaymentOut)
-async def update_payment(
+def update_payment(
     payment_id: int,
     payment_update: schemas.PaymentCreate, # reusing create schema for simplicity
     db: Session = Depends(get_db),
@@ -150,19 +154,20 @@ async def update_payment(
     db_payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
     if not db_payment:
         raise HTTPException(status_code=404, detail="Payment not found")
+    closing.ensure_open(db, db_payment.payment_date, payment_update.payment_date)
         
     old_amount = db_payment.amount
     new_amount = payment_update.amount
     
-    diff = new_amount - old_amount
+    diff = money.total(new_amount, -old_amount)
     
     if diff != 0:
         # Update Sales if linked
         if db_payment.sales_id:
             sale = db.query(models.Sales).filter(models.Sales.id == db_payment.sales_id).first()
             if sale:
-                sale.amount_paid += diff
-                sale.amount_due = sale.total_amount - sale.amount_paid
+                sale.amount_paid = money.total(sale.amount_paid, diff)
+                sale.amount_due = money.total(sale.total_amount, -sale.amount_paid)
                 # recalculate status
                 if sale.amount_due <= 0:
                     sale.payment_status = PaymentStatus.PAID
@@ -176,8 +181,8 @@ async def update_payment(
         if db_payment.billing_id:
              bill = db.query(models.Billing).filter(models.Billing.id == db_payment.billing_id).first()
              if bill:
-                bill.amount_paid += diff
-                bill.amount_due = bill.total_amount - bill.amount_paid
+                bill.amount_paid = money.total(bill.amount_paid, diff)
+                bill.amount_due = money.total(bill.total_amount, -bill.amount_paid)
                 if bill.amount_due <= 0:
                     bill.payment_status = PaymentStatus.PAID
                     bill.amount_due = 0
@@ -194,20 +199,24 @@ async def update_payment(
         
         if ledger:
             if db_payment.payment_type == TransactionType.RECEIPT:
-                ledger.credit_amount = new_amount
+                amount_field = "credit_amount"
             else:
-                ledger.debit_amount = new_amount
+                amount_field = "debit_amount"
             
-            ledger.transaction_date = payment_update.payment_date
+            posting.update_entry(
+                db, ledger,
+                transaction_date=payment_update.payment_date,
+                **{amount_field: new_amount}
+            )
             # update narration if needed for date/mode
             
     # Update payment record
     for key, value in payment_update.dict().items():
         setattr(db_payment, key, value)
         
+    audit.record(db, current_user.id, "update", "payments", payment_id, {"amount": old_amount}, payment_update.dict())
     db.commit()
     db.refresh(db_payment)
-    
-    audit.log_action(db, current_user.id, "update", "payments", payment_id, {"amount": old_amount}, payment_update.dict())
+    invalidate_dashboard()
     
     return db_payment
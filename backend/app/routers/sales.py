@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime
-from .. import models, schemas, audit
+from .. import models, schemas, audit, posting, rollups, invoice_numbers, invoicing, jobs, closing, money
+from ..cache import invalidate_dashboard
 from ..dependencies import get_db, get_current_active_user, RoleChecker
 from ..models import UserRole, GSTType, TransactionType
 
@@ -15,26 +17,8 @@ router = APIRouter(
 allow_write = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT, UserRole.MERCHANDISER])
 allow_delete = RoleChecker([UserRole.OWNER, UserRole.ACCOUNTANT])
 
-def generate_invoice_number(db: Session, date_obj):
-    year = date_obj.year
-    # Find last invoice for this year
-    # Pattern SK/YYYY/XXXX
-    prefix = f"SK/{year}/"
-    last_sale = db.query(models.Sales).filter(models.Sales.invoice_number.like(f"{prefix}%")).order_by(models.Sales.id.desc()).first()
-    
-    if last_sale:
-        try:
-            last_seq = int(last_sale.invoice_number.split("/")[-1])
-            new_seq = last_seq + 1
-        except:
-            new_seq = 1
-    else:
-        new_seq = 1
-        
-    return f"{prefix}{new_seq:04d}"
-
 @router.post("/", response_model=schemas.SalesOut, status_code=status.HTTP_201_CREATED)
-async def create_sale(
+def create_sale(
     sale: schemas.SalesCreate, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_write)
@@ -43,35 +27,22 @@ async def create_sale(
     company = db.query(models.Company).filter(models.Company.id == sale.company_id).first()
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
+    closing.ensure_open(db, sale.invoice_date, sale.payment_date)
 
-    # Calculate amounts
-    base_amount = sale.quantity * sale.rate
-    gst_amount = base_amount * (sale.gst_rate / 100)
-    
-    sale_data = sale.dict()
-    sale_data["base_amount"] = base_amount
-    
-    if sale.gst_type == GSTType.INTRA_STATE:
-        sale_data["cgst_amount"] = gst_amount / 2
-        sale_data["sgst_amount"] = gst_amount / 2
-        sale_data["igst_amount"] = 0.0
-    else:
-        sale_data["cgst_amount"] = 0.0
-        sale_data["sgst_amount"] = 0.0
-        sale_data["igst_amount"] = gst_amount
-        
-    total_amount = base_amount + gst_amount + sale.tcs_amount
-    sale_data["total_amount"] = total_amount
-    sale_data["amount_due"] = total_amount - sale.amount_paid
-    
-    # Generate Invoice Number
-    sale_data["invoice_number"] = generate_invoice_number(db, sale.invoice_date)
-    sale_data["created_by"] = current_user.id
+    sale_data, lines = invoicing.sale_values(sale, current_user.id)
+
+    # Generate Invoice Number. The company lock comes first, as in imports, so the two
+    # never wait on each other's counter row and ledger lock in opposite orders.
+    posting.lock_companies(db, sale.company_id)
+    sale_data["invoice_number"] = invoice_numbers.next_number(db, sale.invoice_date)
     
     db_sale = models.Sales(**sale_data)
     db.add(db_sale)
-    db.commit()
-    db.refresh(db_sale)
+    rollups.add(db, rollups.sale_entry(db_sale))
+    # One transaction for the whole invoice: flush assigns IDs, the single commit is at the end
+    db.flush()
+    # Every line in one multi-row insert, however many the invoice has
+    invoicing.insert_lines(db, [(db_sale.id, lines)])
     
     # Ledger Entry (Debit Customer)
     ledger_entry = models.Ledger(
@@ -80,11 +51,11 @@ async def create_sale(
         transaction_type=TransactionType.SALE,
         reference_id=db_sale.id,
         reference_model="Sales",
-        debit_amount=total_amount,
+        debit_amount=sale_data["total_amount"],
         credit_amount=0.0,
         narration=f"invoice #{db_sale.invoice_number} - {sale.item_description or ''}"
     )
-    db.add(ledger_entry)
+    posting.add_entry(db, ledger_entry)
 
     # If amount paid > 0, we should record a receipt in ledger too?
     # For simplicity, if they enter amount paid here, we treat it as a receipt
@@ -115,22 +86,43 @@ async def create_sale(
             narration=f"Payment for Invoice #{db_sale.invoice_number}"
         )
         # We need payment ID.
-        db.commit()
-        db.refresh(payment)
+        db.flush()
         ledger_payment.reference_id = payment.id
-        db.add(ledger_payment)
-    
-    db.commit()
+        posting.add_entry(db, ledger_payment)
     
     # Update company opening balance? No, opening balance is static.
     # Current balance is calculated from ledger.
     
-    audit.log_action(db, current_user.id, "create", "sales", db_sale.id, None, sale_data)
+    audit.record(db, current_user.id, "create", "sales", db_sale.id, None, {**sale_data, "lines": lines} if lines else sale_data)
+    db.commit()
+    invalidate_dashboard(sale.invoice_date)
     
     return db_sale
 
+@router.post("/bulk", response_model=schemas.APIResponse)
+def create_sales_bulk(
+    sales: List[schemas.SalesCreate],
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_write)
+):
+    """Create many invoices in one transaction. Items with an unknown company are reported
+    in their result and skipped; the rest are created together."""
+    if len(sales) > invoicing.MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {invoicing.MAX_BULK_ITEMS} invoices per request")
+
+    results = invoicing.create_sales(db, sales, current_user.id)
+    db.commit()
+    invalidate_dashboard(*{sale.invoice_date for sale in sales})
+
+    created = sum(1 for result in results if result["success"])
+    return {
+        "success": created == len(sales),
+        "data": results,
+        "message": f"Created {created} of {len(sales)} invoices"
+    }
+
 @router.get("/", response_model=schemas.APIResponse)
-async def read_sales(
+def read_sales(
     skip: int = 0, 
     limit: int = 20, 
     company_id: Optional[int] = None,
@@ -160,7 +152,7 @@ async def read_sales(
     }
 
 @router.get("/{sales_id}", response_model=schemas.APIResponse)
-async def read_sale(
+def read_sale(
     sales_id: int, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
@@ -175,7 +167,7 @@ async def read_sale(
     }
 
 @router.put("/{sales_id}", response_model=schemas.SalesOut)
-async def update_sale(
+def update_sale(
     sales_id: int, 
     sale_update: schemas.SalesUpdate, 
     db: Session = Depends(get_db),
@@ -186,45 +178,47 @@ async def update_sale(
         raise HTTPException(status_code=404, detail="Invoice not found")
         
     old_data = schemas.SalesOut.from_orm(db_sale).dict()
+    old_rollup = rollups.sale_entry(db_sale)
     update_data = sale_update.dict(exclude_unset=True)
+    # Neither where the invoice (or its payment) is dated now nor where it moves to may be closed
+    closing.ensure_open(
+        db, db_sale.invoice_date, db_sale.payment_date,
+        update_data.get("invoice_date"), update_data.get("payment_date")
+    )
     
+    # New lines replace all of the invoice's lines; a multi-line invoice's quantity and
+    # rate come from its lines, so they're changed through them
+    new_lines = update_data.get("lines")
+    if db_sale.lines and new_lines is None and ("quantity" in update_data or "rate" in update_data):
+        raise HTTPException(status_code=400, detail="This invoice has lines: send lines to change its quantities or rates")
+
     # Update fields
     for key, value in update_data.items():
-        setattr(db_sale, key, value)
+        if key != "lines":
+            setattr(db_sale, key, value)
         
     # Recalculate totals if financial fields changed
-    recalc_fields = ["quantity", "rate", "gst_rate", "gst_type", "tcs_amount", "amount_paid"]
+    recalc_fields = ["quantity", "rate", "gst_rate", "gst_type", "tcs_amount", "amount_paid", "lines"]
     if any(field in update_data for field in recalc_fields):
-        base_amount = db_sale.quantity * db_sale.rate
-        gst_amount = base_amount * (db_sale.gst_rate / 100)
-        
-        db_sale.base_amount = base_amount
-        
-        if db_sale.gst_type == GSTType.INTRA_STATE:
-            db_sale.cgst_amount = gst_amount / 2
-            db_sale.sgst_amount = gst_amount / 2
-            db_sale.igst_amount = 0.0
+        if new_lines is None and db_sale.lines:
+            # GST, TCS or the amount paid changed: reprice the lines the invoice has
+            new_lines = [
+                {field: getattr(line, field) for field in schemas.InvoiceLineCreate.model_fields}
+                for line in db_sale.lines
+            ]
+        if new_lines is not None:
+            lines, amounts = invoicing.line_values(
+                new_lines, db_sale.gst_rate, db_sale.gst_type, db_sale.tcs_amount, db_sale.amount_paid
+            )
+            invoicing.replace_lines(db, sales_id, lines)
         else:
-            db_sale.cgst_amount = 0.0
-            db_sale.sgst_amount = 0.0
-            db_sale.igst_amount = gst_amount
-            
-        total_amount = base_amount + gst_amount + (db_sale.tcs_amount or 0)
-        db_sale.total_amount = total_amount
-        db_sale.amount_due = total_amount - (db_sale.amount_paid or 0)
-        
-        # Update Ledger for Sale
-        ledger_entry = db.query(models.Ledger).filter(
-            models.Ledger.reference_id == sales_id,
-            models.Ledger.reference_model == "Sales",
-            models.Ledger.transaction_type == TransactionType.SALE
-        ).first()
-        
-        if ledger_entry:
-            ledger_entry.debit_amount = total_amount
-            ledger_entry.transaction_date = db_sale.invoice_date
-            ledger_entry.narration = f"Invoice #{db_sale.invoice_number} (Updated) - {db_sale.item_description or ''}"
-            
+            amounts = money.sale_amounts(
+                db_sale.quantity, db_sale.rate, db_sale.gst_rate, db_sale.gst_type,
+                db_sale.tcs_amount, db_sale.amount_paid
+            )
+        for key, value in amounts.items():
+            setattr(db_sale, key, value)
+
         # Update Payment & Payment Ledger if amount_paid changed
         if "amount_paid" in update_data:
             payment = db.query(models.Payment).filter(models.Payment.sales_id == sales_id).first()
@@ -240,8 +234,11 @@ async def update_sale(
                         models.Ledger.reference_model == "Payment"
                     ).first()
                     if ledger_pay:
-                        ledger_pay.credit_amount = db_sale.amount_paid
-                        ledger_pay.transaction_date = payment.payment_date
+                        posting.update_entry(
+                            db, ledger_pay,
+                            credit_amount=db_sale.amount_paid,
+                            transaction_date=payment.payment_date
+                        )
                 else:
                     # Set to 0 if removed
                     payment.amount = 0
@@ -250,7 +247,7 @@ async def update_sale(
                         models.Ledger.reference_model == "Payment"
                     ).first()
                     if ledger_pay:
-                        ledger_pay.credit_amount = 0
+                        posting.update_entry(db, ledger_pay, credit_amount=0)
 
             elif (db_sale.amount_paid or 0) > 0:
                 # Create new payment if didn't exist
@@ -265,8 +262,7 @@ async def update_sale(
                     created_by=current_user.id
                 )
                 db.add(payment)
-                db.commit()
-                db.refresh(payment)
+                db.flush()
                 
                 ledger_payment = models.Ledger(
                     company_id=db_sale.company_id,
@@ -278,16 +274,39 @@ async def update_sale(
                     credit_amount=db_sale.amount_paid,
                     narration=f"Payment for Invoice #{db_sale.invoice_number}"
                 )
-                db.add(ledger_payment)
+                posting.add_entry(db, ledger_payment)
+
+    # The invoice's ledger row follows its amount, and its company and date as its rollup
+    # does; payments linked to it move to the new party too
+    moved = "company_id" in update_data or "invoice_date" in update_data
+    if moved or any(field in update_data for field in recalc_fields):
+        ledger_entry = db.query(models.Ledger).filter(
+            models.Ledger.reference_id == sales_id,
+            models.Ledger.reference_model == "Sales",
+            models.Ledger.transaction_type == TransactionType.SALE
+        ).first()
+        
+        if ledger_entry:
+            posting.update_entry(
+                db, ledger_entry,
+                company_id=db_sale.company_id,
+                debit_amount=db_sale.total_amount,
+                transaction_date=db_sale.invoice_date,
+                narration=f"Invoice #{db_sale.invoice_number} (Updated) - {db_sale.item_description or ''}"
+            )
+    if "company_id" in update_data:
+        invoicing.move_payments(db, "sales_id", sales_id, db_sale.company_id)
 
+    rollups.replace(db, old_rollup, rollups.sale_entry(db_sale))
+    audit.record(db, current_user.id, "update", "sales", sales_id, old_data, update_data)
     db.commit()
     db.refresh(db_sale)
-    audit.log_action(db, current_user.id, "update", "sales", sales_id, old_data, update_data)
+    invalidate_dashboard(old_data["invoice_date"], db_sale.invoice_date)
     
     return db_sale
 
 @router.delete("/{sales_id}")
-async def delete_sale(
+def delete_sale(
     sales_id: int, 
     db: Session = Depends(get_db),
     current_user: models.User = Depends(allow_delete)
@@ -295,28 +314,56 @@ async def delete_sale(
     sale = db.query(models.Sales).filter(models.Sales.id == sales_id).first()
     if not sale:
         raise HTTPException(status_code=404, detail="Invoice not found")
-        
-    # 1. Delete all payments linked to this sale
-    payments = db.query(models.Payment).filter(models.Payment.sales_id == sales_id).all()
-    for payment in payments:
-        # 1.1 Delete ledger entries for each payment
-        db.query(models.Ledger).filter(
-            models.Ledger.reference_id == payment.id,
-            models.Ledger.reference_model == "Payment"
-        ).delete()
-        # 1.2 Delete the payment itself
-        db.delete(payment)
-        
-    # 2. Delete main ledger entries for the sale
-    db.query(models.Ledger).filter(
-        models.Ledger.reference_id == sales_id, 
-        models.Ledger.reference_model == "Sales"
-    ).delete()
-    
-    # 3. Delete the sale
-    db.delete(sale)
+
+    # Payments, their ledger rows, the sale's ledger rows, rollups and audit in one set-based pass
+    dates = invoicing.delete_sales(db, [sales_id], current_user.id)
     db.commit()
-    
-    audit.log_action(db, current_user.id, "delete", "sales", sales_id)
+    invalidate_dashboard(*dates)
     
     return {"message": "Invoice deleted successfully"}
+
+@router.post("/bulk-delete", response_model=schemas.APIResponse)
+def delete_sales_bulk(
+    selection: schemas.SalesDeleteFilter,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(allow_delete)
+):
+    """Delete every invoice matching the filter. Up to invoicing.DELETE_CHUNK_SIZE invoices
+    go at once; larger selections are queued as a sales_delete job (202, poll GET /jobs/{job_id})."""
+    criteria = invoicing.sales_criteria(selection)
+    if not criteria:
+        raise HTTPException(status_code=400, detail="Give at least one of start_date, end_date, company_id or import_id")
+
+    count = db.query(func.count(models.Sales.id)).filter(*criteria).scalar()
+    if count > invoicing.DELETE_CHUNK_SIZE:
+        job = jobs.submit(db, "sales_delete", jsonable_encoder(selection), current_user.id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "success": True,
+            "data": {"job_id": job.id, "status": job.status, "matched": count},
+            "message": f"Deletion of {count} invoices queued"
+        }
+
+    ids = [sale_id for (sale_id,) in db.query(models.Sales.id).filter(*criteria)]
+    dates = invoicing.delete_sales(db, ids, current_user.id)
+    db.commit()
+    invalidate_dashboard(*dates)
+    return {
+        "success": True,
+        "data": {"deleted_count": len(dates)},
+        "message": f"Deleted {len(dates)} invoices"
+    }
+
+@jobs.job_kind("sales_delete", roles=[UserRole.OWNER, UserRole.ACCOUNTANT])
+def run_delete_sales(ctx: jobs.JobContext, params: dict):
+    """Job: delete the invoices matching a SalesDeleteFilter in chunks, committing once at the end."""
+    db = ctx.db
+    criteria = invoicing.sales_criteria(schemas.SalesDeleteFilter(**params))
+    if not criteria:
+        raise ValueError("Give at least one of start_date, end_date, company_id or import_id")
+    ids = [sale_id for (sale_id,) in db.query(models.Sales.id).filter(*criteria).order_by(models.Sales.id)]
+    dates = invoicing.delete_in_chunks(db, invoicing.delete_sales, ids, ctx.user_id, progress=ctx.progress)
+    db.commit()
+    invalidate_dashboard(*set(dates))
+    return {"deleted_count": len(dates)}
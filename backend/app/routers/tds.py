@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func, select
 from typing import Optional
-from datetime import datetime
-from .. import models, schemas
+from datetime import datetime, date
+import csv
+import io
+from .. import models, schemas, periods, rollups, closing
+from ..database import SessionLocal
 from ..dependencies import get_db, get_current_active_user
 
 router = APIRouter(
@@ -11,43 +15,130 @@ router = APIRouter(
     tags=["TDS Reports"]
 )
 
-@router.get("/summary", response_model=schemas.APIResponse)
-async def tds_summary(
-    month: int = Query(datetime.now().month),
-    year: int = Query(datetime.now().year),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
-):
-    # TDS Deducted on Purchases
+STREAM_BATCH_SIZE = 500
+
+# Deductee-level detail for a 26Q-style quarterly return: one line per bill with TDS
+DEDUCTEE_COLUMNS = [
+    "Deductee PAN", "Deductee Name", "Bill No", "Date of Credit", "Amount Credited",
+    "TDS Rate %", "TDS Deducted", "Bill Total", "TDS Filed",
+]
+
+@closing.snapshot_kind("tds_summary")
+def _tds_figures(db: Session, start: date, end: date):
+    # TDS Deducted on Purchases, from the monthly rollups, with vendor name and PAN joined in
+    r = models.MonthlyRollup
     tds_data = db.query(
-        models.Billing.vendor_id,
-        func.sum(models.Billing.tds_amount).label('total_tds'),
-        func.sum(models.Billing.base_amount).label('total_base')
+        r.company_id.label('vendor_id'),
+        models.Company.name.label('vendor_name'),
+        models.Company.pan_number.label('pan'),
+        func.sum(r.tds_amount).label('total_tds'),
+        func.sum(r.tds_base_amount).label('total_base')
+    ).outerjoin(
+        models.Company, models.Company.id == r.company_id
     ).filter(
-        extract('month', models.Billing.bill_date) == month,
-        extract('year', models.Billing.bill_date) == year,
-        models.Billing.tds_applicable == True
-    ).group_by(models.Billing.vendor_id).all()
-    
-    # Resolve vendor names
+        r.kind == rollups.PURCHASE,
+        periods.in_range(r.month_start, start, end)
+    ).group_by(
+        r.company_id, models.Company.name, models.Company.pan_number
+    ).having(func.sum(r.tds_bill_count) > 0).all()
+
     result = []
     total_liability = 0.0
-    
+
     for row in tds_data:
-        vendor = db.query(models.Company).filter(models.Company.id == row.vendor_id).first()
         result.append({
-            "vendor_name": vendor.name if vendor else "Unknown",
-            "pan": vendor.pan_number if vendor else None,
+            "vendor_name": row.vendor_name or "Unknown",
+            "pan": row.pan,
             "base_amount": row.total_base,
             "tds_deducted": row.total_tds
         })
         total_liability += row.total_tds
-        
+
+    return {"liability": total_liability, "details": result}
+
+@router.get("/summary", response_model=schemas.APIResponse)
+def tds_summary(
+    month: int = Query(datetime.now().month),
+    year: int = Query(datetime.now().year),
+    fy: Optional[int] = None,
+    quarter: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """TDS deducted per vendor for a month, or a quarter of a financial year with `fy` and `quarter`."""
+    start, end = periods.resolve_period(month, year, fy, quarter)
+    # A closed period's figures come from its snapshot
+    figures = closing.report(db, "tds_summary", start, end)
+
     return {
         "success": True,
         "data": {
-            "liability": total_liability,
-            "details": result
+            "period": {"start": start, "end": end},  # half-open: end is the first day after
+            **figures
         },
         "message": "TDS Summary"
     }
+
+def _deductee_query(start: date, end: date):
+    return select(
+        models.Company.pan_number,
+        models.Company.name,
+        models.Billing.bill_number,
+        models.Billing.bill_date,
+        models.Billing.base_amount,
+        models.Billing.tds_rate,
+        models.Billing.tds_amount,
+        models.Billing.total_amount,
+        models.Billing.tds_file_date
+    ).join(
+        models.Company, models.Company.id == models.Billing.vendor_id
+    ).where(
+        models.Billing.tds_applicable == True,
+        periods.in_range(models.Billing.bill_date, start, end)
+    ).order_by(models.Company.name, models.Billing.bill_date, models.Billing.id)
+
+def _stream_deductees(start: date, end: date):
+    # Runs after the request's session is gone, so it owns its session.
+    # yield_per streams rows through a server-side cursor instead of loading the quarter.
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(DEDUCTEE_COLUMNS)
+        rows = db.execute(_deductee_query(start, end).execution_options(yield_per=STREAM_BATCH_SIZE))
+        count = 0
+        for row in rows:
+            writer.writerow([
+                row.pan_number or "", row.name, row.bill_number, row.bill_date.isoformat(),
+                row.base_amount or 0.0, row.tds_rate or 0.0, row.tds_amount or 0.0,
+                row.total_amount or 0.0, row.tds_file_date or "",
+            ])
+            count += 1
+            if count % STREAM_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        db.close()
+
+@router.get("/export")
+def tds_export(
+    month: int = Query(datetime.now().month),
+    year: int = Query(datetime.now().year),
+    fy: Optional[int] = None,
+    quarter: Optional[int] = None,
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Deductee-level TDS detail as CSV, streamed: one line per bill with TDS in the period.
+
+    For a quarterly return pass `fy` (the year the financial year starts in) and `quarter`
+    (1 = Apr-Jun ... 4 = Jan-Mar).
+    """
+    start, end = periods.resolve_period(month, year, fy, quarter)
+    label = f"FY{fy}-Q{quarter}" if quarter is not None else f"{start.isoformat()}_{end.isoformat()}"
+    return StreamingResponse(
+        _stream_deductees(start, end),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="tds-{label}.csv"'}
+    )
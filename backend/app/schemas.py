@@ -1,8 +1,13 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, AfterValidator, model_validator
+from typing import Annotated, Optional, List
 from datetime import date, datetime
 from enum import Enum
 from .models import UserRole, ProcessType, GSTType, PaymentStatus, PaymentMode, BalanceType, TransactionType
+from . import money
+
+# A money amount given in a request, rounded to the paisa on the way in: balances, running
+# balances and checkpoints are posted from it and must add up what NUMERIC(18, 2) stores
+Amount = Annotated[float, AfterValidator(money.amount)]
 
 # Auth Schemas
 class Token(BaseModel):
@@ -53,7 +58,7 @@ class CompanyBase(BaseModel):
     phone: Optional[str] = None
     email: Optional[EmailStr] = None
     contact_person: Optional[str] = None
-    opening_balance: Optional[float] = 0.0
+    opening_balance: Optional[Amount] = 0.0
     balance_type: BalanceType = BalanceType.CREDIT
     payment_terms: Optional[str] = None
     bank_account_no: Optional[str] = None
@@ -77,6 +82,29 @@ class CompanyOut(CompanyBase):
         from_attributes = True
 
 # Sales Schemas
+MAX_INVOICE_LINES = 500
+
+class InvoiceLineBase(BaseModel):
+    process_type: Optional[ProcessType] = None
+    hsn_code: Optional[str] = None
+    item_description: Optional[str] = None
+    quantity: float
+    rate: float
+
+class InvoiceLineCreate(InvoiceLineBase):
+    pass
+
+class InvoiceLineOut(InvoiceLineBase):
+    line_number: int
+    base_amount: float
+    cgst_amount: float
+    sgst_amount: float
+    igst_amount: float
+    total_amount: float
+
+    class Config:
+        from_attributes = True
+
 class SalesBase(BaseModel):
     invoice_date: date
     company_id: int
@@ -86,15 +114,25 @@ class SalesBase(BaseModel):
     rate: float
     gst_type: GSTType
     gst_rate: float
-    tcs_amount: Optional[float] = 0.0
+    tcs_amount: Optional[Amount] = 0.0
     payment_status: PaymentStatus = PaymentStatus.UNPAID
-    amount_paid: Optional[float] = 0.0
+    amount_paid: Optional[Amount] = 0.0
     payment_mode: Optional[PaymentMode] = None
     payment_date: Optional[date] = None
     notes: Optional[str] = None
 
 class SalesCreate(SalesBase):
-    pass
+    # A single-line invoice gives quantity and rate; a multi-line one gives lines instead,
+    # and its quantity, rate and amounts are worked out from them
+    quantity: Optional[float] = None
+    rate: Optional[float] = None
+    lines: List[InvoiceLineCreate] = Field(default_factory=list, max_length=MAX_INVOICE_LINES)
+
+    @model_validator(mode="after")
+    def _quantity_or_lines(self):
+        if not self.lines and (self.quantity is None or self.rate is None):
+            raise ValueError("Give quantity and rate, or lines")
+        return self
 
 class SalesUpdate(BaseModel):
     invoice_date: Optional[date] = None
@@ -105,15 +143,17 @@ class SalesUpdate(BaseModel):
     rate: Optional[float] = None
     gst_type: Optional[GSTType] = None
     gst_rate: Optional[float] = None
-    tcs_amount: Optional[float] = None
-    amount_paid: Optional[float] = None
+    tcs_amount: Optional[Amount] = None
+    amount_paid: Optional[Amount] = None
     payment_mode: Optional[PaymentMode] = None
     payment_date: Optional[date] = None
     notes: Optional[str] = None
+    lines: Optional[List[InvoiceLineCreate]] = Field(None, min_length=1, max_length=MAX_INVOICE_LINES)  # replaces all lines
 
 class SalesOut(SalesBase):
     id: int
     invoice_number: str
+    import_id: Optional[str] = None
     base_amount: float
     cgst_amount: float
     sgst_amount: float
@@ -125,10 +165,17 @@ class SalesOut(SalesBase):
     updated_at: Optional[datetime] = None
     
     company: Optional[CompanyOut] = None
+    lines: List[InvoiceLineOut] = []
 
     class Config:
         from_attributes = True
 
+class SalesDeleteFilter(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    company_id: Optional[int] = None
+    import_id: Optional[str] = None  # the import_id an Excel upload was confirmed with
+
 # Billing Schemas
 class BillingBase(BaseModel):
     bill_number: str
@@ -144,7 +191,7 @@ class BillingBase(BaseModel):
     tds_applicable: bool = False
     tds_rate: Optional[float] = 0.0
     payment_status: PaymentStatus = PaymentStatus.UNPAID
-    amount_paid: Optional[float] = 0.0
+    amount_paid: Optional[Amount] = 0.0
     payment_mode: Optional[PaymentMode] = None
     payment_date: Optional[date] = None
     tds_file_date: Optional[str] = None
@@ -166,7 +213,7 @@ class BillingUpdate(BaseModel):
     gst_rate: Optional[float] = None
     tds_applicable: Optional[bool] = None
     tds_rate: Optional[float] = None
-    amount_paid: Optional[float] = None
+    amount_paid: Optional[Amount] = None
     payment_mode: Optional[PaymentMode] = None
     payment_date: Optional[date] = None
     tds_file_date: Optional[str] = None
@@ -188,12 +235,17 @@ class BillingOut(BillingBase):
     class Config:
         from_attributes = True
 
+class BillingDeleteFilter(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    vendor_id: Optional[int] = None
+
 # Payment Schemas
 class PaymentBase(BaseModel):
     payment_date: date
     payment_type: TransactionType
     company_id: int
-    amount: float
+    amount: Amount
     payment_mode: PaymentMode
     transaction_reference: Optional[str] = None
     bank_account: Optional[str] = None
@@ -233,6 +285,48 @@ class LedgerOut(BaseModel):
     class Config:
         from_attributes = True
 
+# Excel Import
+class ExcelImportRequest(BaseModel):
+    import_id: str  # from /excel/upload
+
+# Background Jobs
+class JobCreate(BaseModel):
+    kind: str
+    params: dict = {}
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    params: Optional[dict] = None
+    progress_done: Optional[int] = 0
+    progress_total: Optional[int] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Period Close
+class PeriodSelection(BaseModel):
+    # One month (month + year), a quarter (fy + quarter) or a financial year (fy)
+    month: Optional[int] = None
+    year: Optional[int] = None
+    fy: Optional[int] = None
+    quarter: Optional[int] = None
+
+class PeriodCloseOut(BaseModel):
+    month_start: date
+    closed_by: Optional[int] = None
+    closed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Common Response
 class APIResponse(BaseModel):
     success: bool
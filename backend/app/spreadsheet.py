@@ -0,0 +1,102 @@
+import math
+import tempfile
+import pandas as pd
+from openpyxl import load_workbook
+
+# Streaming readers for uploaded spreadsheets.
+# Uploads are read from the request's spooled temp file (UploadFile.file, which rolls
+# over to disk past 1 MB) rather than into one bytes object. For .xlsx only the sales
+# sheet is opened, in openpyxl's read-only mode, which streams rows off the zip;
+# CSVs are read in chunks. Either way rows come out one dict at a time.
+
+SALES_SHEET_NAMES = ['Sales', 'sales', 'Sheet1']
+COMPANY_COLUMNS = ['party', 'company', 'customer', 'vendor', 'name', 'company name', 'party name']
+CSV_CHUNK_ROWS = 5000
+PREVIEW_ROWS = 50
+
+class SpreadsheetError(Exception):
+    pass
+
+def _clean(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+def _headers(first_row):
+    return [
+        str(value) if value is not None else f"Unnamed: {i}"
+        for i, value in enumerate(first_row)
+    ]
+
+def _iter_xlsx(fileobj, sheet_names):
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        sheet_name = next((name for name in sheet_names if name in workbook.sheetnames), None)
+        if sheet_name is None:
+            return
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        headers = _headers(next(rows, ()))
+        for values in rows:
+            if all(v is None for v in values):
+                continue
+            yield dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+def _iter_csv(fileobj, chunk_rows):
+    # Pandas decodes the binary stream and leaves a file it didn't open for its owner
+    for chunk in pd.read_csv(fileobj, encoding="utf-8-sig", chunksize=chunk_rows):
+        for record in chunk.to_dict(orient="records"):
+            row = {key: _clean(value) for key, value in record.items()}
+            if all(v is None for v in row.values()):
+                continue
+            yield row
+
+def iter_sales_rows(fileobj, filename: str, sheet_names=SALES_SHEET_NAMES, chunk_rows: int = CSV_CHUNK_ROWS):
+    """Yield the sales rows of an uploaded .xlsx/.csv as dicts keyed by header.
+
+    Raises SpreadsheetError if the file can't be parsed.
+    """
+    if isinstance(fileobj, tempfile.SpooledTemporaryFile):
+        # Before Python 3.11 it has no readable()/seekable(), which zipfile and text
+        # wrappers need; the BytesIO or disk file underneath has them on every version
+        fileobj = fileobj._file
+    fileobj.seek(0)
+    try:
+        if filename.endswith('.csv'):
+            yield from _iter_csv(fileobj, chunk_rows)
+        else:
+            yield from _iter_xlsx(fileobj, sheet_names)
+    except SpreadsheetError:
+        raise
+    except Exception as e:
+        raise SpreadsheetError(str(e)) from e
+
+def company_column(headers):
+    for col in headers:
+        if str(col).lower() in COMPANY_COLUMNS:
+            return col
+    return None
+
+def scan(rows, preview_rows: int = PREVIEW_ROWS):
+    """One pass over `rows`: the first `preview_rows` rows, the distinct company names and the row count.
+
+    Memory is bounded by the preview size and the number of distinct companies.
+    """
+    preview = []
+    companies = {}
+    count = 0
+    company_col = None
+    for row in rows:
+        if count == 0:
+            company_col = company_column(row.keys())
+        count += 1
+        if len(preview) < preview_rows:
+            preview.append(row)
+        if company_col:
+            name = row.get(company_col)
+            if name is not None and str(name).strip():
+                companies.setdefault(str(name), None)
+    return preview, list(companies), count
@@ -0,0 +1,133 @@
+"""SQL statements per request for cheap endpoints, with and without the auth user cache.
+
+Serves the app in-process under uvicorn and counts every statement the engine sends
+while `--requests` requests hit each endpoint, first with the user cache off
+(AUTH_USER_CACHE_TTL_SECONDS=0 behaviour) and then on.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.auth_queries
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import date
+import uvicorn
+from sqlalchemy import event
+
+# The job poller would add its own queries to the count
+os.environ["JOB_WORKERS"] = "0"
+
+from .common import engine, reset_schema, print_table
+from app.database import SessionLocal
+from app.main import app
+from app.cache import user_cache, dashboard_cache
+from app import models, auth
+
+BENCH_USER = "bench@sktexcot.com"
+BENCH_PASSWORD = "bench-password"
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+
+def seed():
+    reset_schema()
+    db = SessionLocal()
+    try:
+        user = models.User(
+            email=BENCH_USER,
+            password_hash=auth.get_password_hash(BENCH_PASSWORD),
+            full_name="Benchmark",
+            role=models.UserRole.OWNER
+        )
+        db.add(user)
+        company = models.Company(name="Bench Party")
+        db.add(company)
+        db.flush()
+        db.add(models.Sales(
+            invoice_number="BENCH/1", invoice_date=date(2024, 4, 1), company_id=company.id,
+            quantity=1, rate=100, base_amount=100, total_amount=100, amount_due=100,
+            gst_type=models.GSTType.INTRA_STATE, payment_status=models.PaymentStatus.UNPAID, created_by=user.id
+        ))
+        db.commit()
+        return company.id
+    finally:
+        db.close()
+
+def serve(port: int):
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+def call(base: str, path: str, headers: dict):
+    request = urllib.request.Request(base + path, headers=headers)
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and phase")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    company_id = seed()
+    sale_id = 1
+    endpoints = [
+        ("GET /auth/me", "/auth/me"),
+        ("GET /sales/{id}", f"/sales/{sale_id}"),
+        ("GET /company/{id}", f"/company/{company_id}"),
+        ("GET /dashboard/summary (cached)", "/dashboard/summary?month=4&year=2024"),
+    ]
+
+    server, thread = serve(args.port)
+    base = f"http://127.0.0.1:{args.port}"
+    body = urllib.parse.urlencode({"username": BENCH_USER, "password": BENCH_PASSWORD}).encode()
+    with urllib.request.urlopen(base + "/auth/login", data=body) as response:
+        headers = {"Authorization": "Bearer " + json.load(response)["access_token"]}
+
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    configured_ttl = user_cache.ttl_seconds
+    results = {}
+    try:
+        for phase, ttl in (("no cache", 0), ("user cache", configured_ttl or 30)):
+            user_cache.ttl_seconds = ttl
+            user_cache.clear()
+            for label, path in endpoints:
+                dashboard_cache.clear()
+                call(base, path, headers)  # warm-up fills the caches under test
+                counter.count = 0
+                started = time.perf_counter()
+                for _ in range(args.requests):
+                    call(base, path, headers)
+                elapsed = time.perf_counter() - started
+                results[(label, phase)] = (counter.count / args.requests, elapsed * 1000 / args.requests)
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+        user_cache.ttl_seconds = configured_ttl
+        server.should_exit = True
+        thread.join()
+
+    rows = []
+    for label, _ in endpoints:
+        before_q, before_ms = results[(label, "no cache")]
+        after_q, after_ms = results[(label, "user cache")]
+        rows.append([label, f"{before_q:.1f}", f"{after_q:.1f}", f"{before_ms:.2f}", f"{after_ms:.2f}"])
+    print()
+    print(f"Per request, mean of {args.requests}")
+    print_table(["endpoint", "queries (no cache)", "queries (cache)", "ms (no cache)", "ms (cache)"], rows)
+
+if __name__ == "__main__":
+    main()
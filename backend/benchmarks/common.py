@@ -0,0 +1,87 @@
+import os
+import statistics
+import sys
+import time
+
+# Shared setup for the benchmark scripts.
+# Benchmarks seed and drop data, so they only ever run against BENCH_DATABASE_URL,
+# never the application's DATABASE_URL.
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+if not BENCH_DATABASE_URL:
+    sys.exit("Set BENCH_DATABASE_URL to a scratch PostgreSQL database; benchmarks drop and reseed it.")
+
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from sqlalchemy import text
+from app.database import Base, engine
+from app import models, migrations
+
+def reset_schema():
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public;"))
+    Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine, log=lambda msg: None)
+
+def seed_companies(conn, count: int):
+    conn.execute(text("""
+        INSERT INTO companies (name, process_type, state, balance_type, opening_balance, is_active)
+        SELECT 'Party ' || g,
+               (ARRAY['KNITTING','DYEING','PATTERN','STITCHING','FINISHING','OTHER'])[1 + g % 6]::processtype,
+               (ARRAY['Tamil Nadu','Karnataka','Kerala','Maharashtra'])[1 + g % 4],
+               'CREDIT', 0, true
+        FROM generate_series(1, :n) g
+    """), {"n": count})
+
+def seed_sales(conn, count: int, companies: int, days: int = 2190):
+    # Invoices spread evenly over `days` days starting 2019-01-01
+    conn.execute(text("""
+        INSERT INTO sales (invoice_number, invoice_date, company_id, process_type, quantity, rate,
+                           base_amount, gst_type, gst_rate, cgst_amount, sgst_amount, igst_amount,
+                           tcs_amount, total_amount, payment_status, amount_paid, amount_due)
+        SELECT 'BENCH/' || g, DATE '2019-01-01' + (g % :days), 1 + g % :companies, 'DYEING',
+               q, 100, q * 100, 'INTRA_STATE', 5, q * 2.5, q * 2.5, 0, 0, q * 105,
+               'UNPAID', 0, q * 105
+        FROM (SELECT g, 1 + (g % 50) AS q FROM generate_series(1, :n) g) s
+    """), {"n": count, "companies": companies, "days": days})
+
+def seed_billing(conn, count: int, companies: int, days: int = 2190):
+    conn.execute(text("""
+        INSERT INTO billing (bill_number, bill_date, vendor_id, process_type, quantity, rate, base_amount,
+                             gst_type, gst_rate, gst_amount, tds_applicable, tds_rate, tds_amount,
+                             total_amount, payment_status, amount_paid, amount_due)
+        SELECT 'VB/' || g, DATE '2019-01-01' + (g % :days), 1 + g % :companies, 'knitting',
+               q, 80, q * 80, 'INTRA_STATE', 5, q * 4, (g % 3 = 0), 1,
+               CASE WHEN g % 3 = 0 THEN q * 0.8 ELSE 0 END,
+               q * 84 - CASE WHEN g % 3 = 0 THEN q * 0.8 ELSE 0 END, 'UNPAID', 0, q * 84
+        FROM (SELECT g, 1 + (g % 40) AS q FROM generate_series(1, :n) g) s
+    """), {"n": count, "companies": companies, "days": days})
+
+def seed_ledger_from_documents(conn):
+    conn.execute(text("""
+        INSERT INTO ledger (company_id, transaction_date, transaction_type, reference_id, reference_model,
+                            debit_amount, credit_amount, balance, narration)
+        SELECT company_id, invoice_date, 'SALE'::transactiontype, id, 'Sales', total_amount, 0, 0, 'Invoice #' || invoice_number FROM sales
+        UNION ALL
+        SELECT vendor_id, bill_date, 'PURCHASE'::transactiontype, id, 'Billing', 0, total_amount, 0, 'Bill #' || bill_number FROM billing
+    """))
+
+def analyze(conn):
+    conn.execute(text("ANALYZE"))
+
+def time_query(conn, sql: str, params=None, repeat: int = 5):
+    """Median wall time in ms of `repeat` runs, after one warm-up run."""
+    conn.execute(text(sql), params or {}).fetchall()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(text(sql), params or {}).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(c).ljust(w) for c, w in zip(row, widths)))
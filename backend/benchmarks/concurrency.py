@@ -0,0 +1,181 @@
+"""Throughput and latency of the API under a mixed read/write load.
+
+Starts the app under uvicorn against the benchmark database, then runs `--clients`
+concurrent clients for `--seconds`, each picking requests from a fixed mix of
+ledger statement pages, full ledgers, dashboard summaries and new sales invoices.
+Run it on two revisions to compare them, e.g. before and after a handler change.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.concurrency --clients 32 --seconds 30
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from .common import BENCH_DATABASE_URL, engine, reset_schema, seed_companies, seed_sales, seed_billing, seed_ledger_from_documents, analyze, print_table
+from app.database import SessionLocal
+from app import models, auth, posting, rollups
+
+BENCH_USER = "bench@sktexcot.com"
+BENCH_PASSWORD = "bench-password"
+
+# (label, weight)
+MIX = [
+    ("statement page", 40),
+    ("full ledger", 15),
+    ("dashboard", 20),
+    ("create sale", 25),
+]
+
+def seed(rows: int, companies: int):
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, companies)
+        seed_sales(conn, rows, companies)
+        seed_billing(conn, rows // 2, companies)
+        seed_ledger_from_documents(conn)
+
+    db = SessionLocal()
+    try:
+        posting.rebuild_company_balances(db)
+        posting.rebuild_running_balances(db)
+        rollups.rebuild_rollups(db)
+        db.add(models.User(
+            email=BENCH_USER,
+            password_hash=auth.get_password_hash(BENCH_PASSWORD),
+            full_name="Benchmark",
+            role=models.UserRole.OWNER
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    with engine.begin() as conn:
+        analyze(conn)
+
+def start_server(port: int):
+    env = dict(os.environ, DATABASE_URL=BENCH_DATABASE_URL, JOB_WORKERS="0", DASHBOARD_CACHE_TTL_SECONDS="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + "/health", timeout=1)
+            return server, base
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit("uvicorn did not start")
+
+def login(base: str) -> dict:
+    body = urllib.parse.urlencode({"username": BENCH_USER, "password": BENCH_PASSWORD}).encode()
+    with urllib.request.urlopen(base + "/auth/login", data=body) as response:
+        token = json.load(response)["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def make_request(label: str, base: str, companies: int, rng: random.Random):
+    company_id = rng.randint(1, companies)
+    if label == "statement page":
+        return urllib.request.Request(f"{base}/ledger/company/{company_id}/statement?limit=50")
+    if label == "full ledger":
+        return urllib.request.Request(f"{base}/ledger/company/{company_id}")
+    if label == "dashboard":
+        return urllib.request.Request(f"{base}/dashboard/summary?month={rng.randint(1, 12)}&year={rng.randint(2019, 2024)}")
+    body = json.dumps({
+        "invoice_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "company_id": company_id,
+        "quantity": rng.randint(1, 50),
+        "rate": 100,
+        "gst_type": "intra_state",
+        "gst_rate": 5
+    }).encode()
+    return urllib.request.Request(f"{base}/sales/", data=body, headers={"Content-Type": "application/json"})
+
+def client(base, headers, companies, deadline, seed_value, samples, errors, lock):
+    rng = random.Random(seed_value)
+    labels = [label for label, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    while time.perf_counter() < deadline:
+        label = rng.choices(labels, weights)[0]
+        request = make_request(label, base, companies, rng)
+        for key, value in headers.items():
+            request.add_header(key, value)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+        except Exception:
+            with lock:
+                errors[label] = errors.get(label, 0) + 1
+            continue
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            samples.setdefault(label, []).append(elapsed)
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="sales rows (billing gets half)")
+    parser.add_argument("--companies", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data from a previous run")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        print(f"Seeding {args.rows} sales, {args.rows // 2} bills, {args.companies} companies...")
+        seed(args.rows, args.companies)
+
+    server, base = start_server(args.port)
+    try:
+        headers = login(base)
+        samples, errors, lock = {}, {}, threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+        threads = [
+            threading.Thread(target=client, args=(base, headers, args.companies, deadline, i, samples, errors, lock))
+            for i in range(args.clients)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(len(v) for v in samples.values())
+    rows = []
+    for label, _ in MIX:
+        values = samples.get(label, [])
+        if not values:
+            rows.append([label, 0, "-", "-", "-", errors.get(label, 0)])
+            continue
+        rows.append([
+            label,
+            len(values),
+            f"{statistics.median(values):.1f}",
+            f"{percentile(values, 95):.1f}",
+            f"{percentile(values, 99):.1f}",
+            errors.get(label, 0),
+        ])
+    print()
+    print(f"{args.clients} clients, {elapsed:.1f} s: {total} requests, {total / elapsed:.1f} req/s")
+    print_table(["request", "count", "p50 ms", "p95 ms", "p99 ms", "errors"], rows)
+
+if __name__ == "__main__":
+    main()
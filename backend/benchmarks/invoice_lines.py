@@ -0,0 +1,106 @@
+"""A fabric lot invoiced as one multi-line invoice vs one single-line invoice per process.
+
+Creates `--lots` lots of `--lines` processes each through the create_sale handler, first
+as separate invoices (the only way before invoice lines) and then as one invoice with a
+line per process, and prints the time per lot and the ledger and audit rows written.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.invoice_lines --lines 5
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+from sqlalchemy import text
+
+from .common import engine, reset_schema, seed_companies, analyze, print_table
+from app.database import SessionLocal
+from app import models, schemas, auth
+from app.routers import sales
+
+PROCESSES = [p for p in models.ProcessType if p != models.ProcessType.OTHER]
+
+def seed(companies: int):
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, companies)
+        analyze(conn)
+    db = SessionLocal()
+    try:
+        db.add(models.User(
+            email="bench@sktexcot.com",
+            password_hash=auth.get_password_hash("bench-password"),
+            full_name="Benchmark",
+            role=models.UserRole.OWNER
+        ))
+        db.commit()
+        user = db.query(models.User).first()
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+def lot_lines(lines: int):
+    return [
+        {"process_type": PROCESSES[i % len(PROCESSES)], "quantity": 100 + i, "rate": 12.5 + i}
+        for i in range(lines)
+    ]
+
+def single_line_invoices(lot, company_id: int):
+    return [
+        schemas.SalesCreate(
+            invoice_date=date.today(), company_id=company_id, gst_type=models.GSTType.INTRA_STATE, gst_rate=5, **line
+        )
+        for line in lot
+    ]
+
+def multi_line_invoice(lot, company_id: int):
+    return [schemas.SalesCreate(
+        invoice_date=date.today(), company_id=company_id, gst_type=models.GSTType.INTRA_STATE, gst_rate=5, lines=lot
+    )]
+
+def counts():
+    with engine.connect() as conn:
+        return {
+            table: conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+            for table in ("sales", "invoice_lines", "ledger", "audit_logs")
+        }
+
+def run(user, build, lots: int, lines: int, companies: int):
+    before = counts()
+    samples = []
+    for lot_number in range(lots):
+        invoices = build(lot_lines(lines), 1 + lot_number % companies)
+        started = time.perf_counter()
+        for invoice in invoices:
+            db = SessionLocal()
+            try:
+                sales.create_sale(invoice, db, user)
+            finally:
+                db.close()
+        samples.append((time.perf_counter() - started) * 1000)
+    after = counts()
+    return statistics.median(samples), {table: (after[table] - before[table]) / lots for table in after}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lots", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=5, help="processes per lot")
+    parser.add_argument("--companies", type=int, default=100)
+    args = parser.parse_args()
+
+    user = seed(args.companies)
+    rows = []
+    for label, build in (("invoice per process", single_line_invoices), ("one multi-line invoice", multi_line_invoice)):
+        median, written = run(user, build, args.lots, args.lines, args.companies)
+        rows.append([
+            label, f"{median:.1f}", f"{written['sales']:.0f}", f"{written['invoice_lines']:.0f}",
+            f"{written['ledger']:.0f}", f"{written['audit_logs']:.0f}",
+        ])
+
+    print()
+    print(f"{args.lots} lots of {args.lines} processes, per lot")
+    print_table(["entered as", "median ms", "invoices", "lines", "ledger rows", "audit rows"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Stress test for the invoice number sequence: parallel creates, bulk reservations and rollbacks.
+
+`--workers` threads create sales invoices through the route handler, spread over two
+numbering scopes (years), while every tenth operation instead bulk-reserves a block of
+numbers for an import and every fifteenth rolls its transaction back. Afterwards every
+scope must hold each number from 1 up exactly once: no duplicates and no gaps.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.invoice_numbers --workers 16 --operations 200
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date
+from sqlalchemy import text
+
+from .common import engine, reset_schema, seed_companies, print_table
+from app.database import SessionLocal
+from app import models, schemas, auth, invoice_numbers
+from app.routers import sales
+
+BULK_SIZE = 25
+
+def seed(companies: int):
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, companies)
+    db = SessionLocal()
+    try:
+        db.add(models.User(
+            email="bench@sktexcot.com",
+            password_hash=auth.get_password_hash("bench-password"),
+            full_name="Benchmark",
+            role=models.UserRole.OWNER
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+def load_user():
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).first()
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+def worker(user, companies, operations, seed_value, reserved, timings, errors, lock):
+    rng = random.Random(seed_value)
+    for i in range(operations):
+        invoice_date = date(rng.choice([2023, 2024]), rng.randint(1, 12), rng.randint(1, 28))
+        db = SessionLocal()
+        started = time.perf_counter()
+        try:
+            if i % 10 == 9:
+                numbers = invoice_numbers.reserve_many(db, [invoice_date] * BULK_SIZE)
+                db.commit()
+                kind = "bulk reserve"
+                with lock:
+                    reserved.extend(numbers)
+            elif i % 15 == 14:
+                invoice_numbers.next_number(db, invoice_date)
+                db.rollback()
+                kind = "rolled back"
+            else:
+                sales.create_sale(schemas.SalesCreate(
+                    invoice_date=invoice_date,
+                    company_id=rng.randint(1, companies),
+                    quantity=1,
+                    rate=100,
+                    gst_type=models.GSTType.INTRA_STATE,
+                    gst_rate=5
+                ), db, user)
+                kind = "create sale"
+        except Exception as e:
+            db.rollback()
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}".splitlines()[0])
+            continue
+        finally:
+            db.close()
+        with lock:
+            timings.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+
+def check(reserved):
+    with engine.connect() as conn:
+        numbers = list(conn.execute(text("SELECT invoice_number FROM sales")).scalars()) + reserved
+    duplicates = [n for n, count in Counter(numbers).items() if count > 1]
+    by_scope = {}
+    for number in numbers:
+        scope, seq = invoice_numbers.default_format.parse(number)
+        by_scope.setdefault(scope, []).append(seq)
+    gaps = {scope: sorted(set(range(1, max(seqs) + 1)) - set(seqs)) for scope, seqs in by_scope.items()}
+    return numbers, duplicates, by_scope, gaps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=200, help="operations per worker")
+    parser.add_argument("--companies", type=int, default=50)
+    args = parser.parse_args()
+
+    seed(args.companies)
+    user = load_user()
+    reserved, timings, errors, lock = [], {}, [], threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(user, args.companies, args.operations, i, reserved, timings, errors, lock))
+        for i in range(args.workers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    numbers, duplicates, by_scope, gaps = check(reserved)
+    print()
+    print(f"{args.workers} workers, {elapsed:.1f} s")
+    print_table(["operation", "count", "median ms", "max ms"], [
+        [kind, len(values), f"{sorted(values)[len(values) // 2]:.1f}", f"{max(values):.1f}"]
+        for kind, values in sorted(timings.items())
+    ])
+    print()
+    print_table(["scope", "numbers", "highest", "gaps"], [
+        [scope, len(seqs), max(seqs), len(gaps[scope])] for scope, seqs in sorted(by_scope.items())
+    ])
+    print()
+    print(f"{len(numbers)} numbers issued, {len(duplicates)} duplicate(s), {sum(len(g) for g in gaps.values())} gap(s), {len(errors)} error(s)")
+    for error in sorted(set(errors))[:10]:
+        print("  " + error)
+    if duplicates or any(gaps.values()) or errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
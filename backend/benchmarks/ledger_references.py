@@ -0,0 +1,97 @@
+"""update_sale latency with and without the ledger (reference_model, reference_id) index.
+
+Seeds a ledger of `--ledger-rows` rows (one per sale or bill), then edits random
+invoices through the update_sale handler, which looks up the sale's ledger row and its
+payment's by reference. Runs once with ix_ledger_reference dropped and once with it,
+and prints the plan of the lookup for each.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.ledger_references --ledger-rows 5000000
+"""
+import argparse
+import random
+import statistics
+import time
+from sqlalchemy import text
+
+from .common import engine, reset_schema, seed_companies, seed_sales, seed_billing, seed_ledger_from_documents, analyze, print_table
+from app.database import SessionLocal
+from app import models, schemas, auth
+from app.routers import sales
+
+INDEX = "ix_ledger_reference"
+LOOKUP = "SELECT id FROM ledger WHERE reference_id = :id AND reference_model = 'Sales' AND transaction_type = 'SALE'"
+
+def seed(ledger_rows: int, companies: int):
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, companies)
+        seed_sales(conn, ledger_rows // 2, companies)
+        seed_billing(conn, ledger_rows - ledger_rows // 2, companies)
+        seed_ledger_from_documents(conn)
+        analyze(conn)
+    db = SessionLocal()
+    try:
+        db.add(models.User(
+            email="bench@sktexcot.com",
+            password_hash=auth.get_password_hash("bench-password"),
+            full_name="Benchmark",
+            role=models.UserRole.OWNER
+        ))
+        db.commit()
+        user = db.query(models.User).first()
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+def plan(sale_id: int) -> str:
+    with engine.connect() as conn:
+        lines = conn.execute(text("EXPLAIN " + LOOKUP), {"id": sale_id}).scalars().all()
+    scan = next(line for line in lines if "Scan" in line)
+    return scan.strip().lstrip("-> ").split("  (")[0]
+
+def run(user, sale_count: int, updates: int, rng: random.Random):
+    samples = []
+    for _ in range(updates):
+        sale_id = rng.randint(1, sale_count)
+        db = SessionLocal()
+        started = time.perf_counter()
+        try:
+            sales.update_sale(sale_id, schemas.SalesUpdate(rate=rng.choice([90, 100, 110])), db, user)
+        finally:
+            db.close()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], samples[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ledger-rows", type=int, default=5_000_000)
+    parser.add_argument("--companies", type=int, default=5000)
+    parser.add_argument("--updates", type=int, default=50, help="update_sale calls per phase")
+    args = parser.parse_args()
+
+    print(f"Seeding {args.ledger_rows} ledger rows over {args.companies} companies...")
+    user = seed(args.ledger_rows, args.companies)
+    sale_count = args.ledger_rows // 2
+    with engine.connect() as conn:
+        index_def = conn.execute(text("SELECT indexdef FROM pg_indexes WHERE indexname = :n"), {"n": INDEX}).scalar()
+
+    rows = []
+    for phase in ("without index", "with index"):
+        with engine.begin() as conn:
+            if phase == "without index":
+                conn.execute(text(f"DROP INDEX IF EXISTS {INDEX}"))
+            else:
+                conn.execute(text(index_def))
+            analyze(conn)
+        median, p95, worst = run(user, sale_count, args.updates, random.Random(1))
+        rows.append([phase, f"{median:.1f}", f"{p95:.1f}", f"{worst:.1f}", plan(sale_count // 2)])
+
+    print()
+    print(f"update_sale, {args.updates} calls per phase, ms")
+    print_table(["phase", "median", "p95", "max", "reference lookup plan"], rows)
+
+if __name__ == "__main__":
+    main()
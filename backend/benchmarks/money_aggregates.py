@@ -0,0 +1,89 @@
+"""Report aggregates and amount verification on NUMERIC money columns vs double precision.
+
+Seeds sales, bills and their ledger rows, times the heaviest report sums with the money
+columns as NUMERIC (migration 0007), then converts them back to double precision and
+times the same sums again. Also times one verify_amounts pass, which recomputes every
+document's amounts set-based in chunks.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.money_aggregates --rows 1000000
+"""
+import argparse
+import time
+from sqlalchemy import text
+
+from .common import engine, reset_schema, seed_companies, seed_sales, seed_billing, seed_ledger_from_documents, analyze, time_query, print_table
+from app.database import SessionLocal
+from app import money
+
+COLUMNS = {
+    "sales": ["base_amount", "cgst_amount", "sgst_amount", "igst_amount", "tcs_amount", "total_amount", "amount_paid", "amount_due"],
+    "billing": ["base_amount", "gst_amount", "tds_amount", "total_amount", "amount_paid", "amount_due"],
+    "ledger": ["debit_amount", "credit_amount", "balance"],
+}
+
+QUERIES = {
+    "dashboard sales year": "SELECT sum(total_amount), sum(amount_due) FROM sales WHERE invoice_date >= DATE '2023-04-01' AND invoice_date < DATE '2024-04-01'",
+    "gst output all": "SELECT sum(cgst_amount), sum(sgst_amount), sum(igst_amount) FROM sales",
+    "tds by vendor": "SELECT vendor_id, sum(tds_amount), sum(base_amount) FROM billing WHERE tds_applicable GROUP BY vendor_id",
+    "ledger totals by company": "SELECT company_id, sum(debit_amount), sum(credit_amount) FROM ledger GROUP BY company_id",
+    "rollup rebuild select": (
+        "SELECT date_trunc('month', invoice_date), company_id, process_type, count(*), sum(base_amount), "
+        "sum(cgst_amount), sum(sgst_amount), sum(igst_amount), sum(tcs_amount), sum(total_amount) "
+        "FROM sales GROUP BY 1, 2, 3"
+    ),
+}
+
+def to_double(conn):
+    for table, columns in COLUMNS.items():
+        conn.execute(text(f"ALTER TABLE {table} " + ", ".join(
+            f"ALTER COLUMN {c} TYPE double precision" for c in columns
+        )))
+
+def time_verify(chunk_size: int) -> float:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        money.verify_amounts(db, chunk_size)
+        return (time.perf_counter() - started) * 1000
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="sales rows (billing gets half)")
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=money.RECOMPUTE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.rows} sales, {args.rows // 2} bills, {args.companies} companies...")
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, args.companies)
+        seed_sales(conn, args.rows, args.companies)
+        seed_billing(conn, args.rows // 2, args.companies)
+        seed_ledger_from_documents(conn)
+        analyze(conn)
+
+    results = {}
+    for phase in ("numeric", "double precision"):
+        if phase == "double precision":
+            with engine.begin() as conn:
+                to_double(conn)
+                analyze(conn)
+        with engine.connect() as conn:
+            for label, sql in QUERIES.items():
+                results[(label, phase)] = time_query(conn, sql, repeat=args.repeat)
+        results[("verify_amounts", phase)] = time_verify(args.chunk_size)
+
+    rows = [
+        [label, f"{results[(label, 'numeric')]:.1f}", f"{results[(label, 'double precision')]:.1f}"]
+        for label in [*QUERIES, "verify_amounts"]
+    ]
+    print()
+    print("Median ms")
+    print_table(["query", "numeric", "double precision"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Before/after benchmark for month/year report filters.
+
+Compares the old `extract('month', col) = m AND extract('year', col) = y` filters with
+the half-open date ranges from app.periods, with and without the report indexes.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.period_filters --rows 1000000
+"""
+import argparse
+from .common import engine, reset_schema, seed_companies, seed_sales, seed_billing, seed_ledger_from_documents, analyze, time_query, print_table
+from sqlalchemy import text
+
+INDEXES = [
+    "ix_sales_invoice_date",
+    "ix_sales_company_invoice_date",
+    "ix_billing_bill_date",
+    "ix_billing_vendor_bill_date",
+    "ix_ledger_company_date_id",
+]
+
+QUERIES = {
+    "dashboard sales month": (
+        "SELECT sum(total_amount) FROM sales WHERE extract(month FROM invoice_date) = 6 AND extract(year FROM invoice_date) = 2023",
+        "SELECT sum(total_amount) FROM sales WHERE invoice_date >= DATE '2023-06-01' AND invoice_date < DATE '2023-07-01'",
+    ),
+    "gst output month": (
+        "SELECT sum(cgst_amount), sum(sgst_amount), sum(igst_amount) FROM sales WHERE extract(month FROM invoice_date) = 6 AND extract(year FROM invoice_date) = 2023",
+        "SELECT sum(cgst_amount), sum(sgst_amount), sum(igst_amount) FROM sales WHERE invoice_date >= DATE '2023-06-01' AND invoice_date < DATE '2023-07-01'",
+    ),
+    "tds by vendor month": (
+        "SELECT vendor_id, sum(tds_amount), sum(base_amount) FROM billing WHERE extract(month FROM bill_date) = 6 AND extract(year FROM bill_date) = 2023 AND tds_applicable GROUP BY vendor_id",
+        "SELECT vendor_id, sum(tds_amount), sum(base_amount) FROM billing WHERE bill_date >= DATE '2023-06-01' AND bill_date < DATE '2023-07-01' AND tds_applicable GROUP BY vendor_id",
+    ),
+    "party sales month": (
+        "SELECT sum(total_amount) FROM sales WHERE company_id = 42 AND extract(month FROM invoice_date) = 6 AND extract(year FROM invoice_date) = 2023",
+        "SELECT sum(total_amount) FROM sales WHERE company_id = 42 AND invoice_date >= DATE '2023-06-01' AND invoice_date < DATE '2023-07-01'",
+    ),
+    "ledger window": (
+        "SELECT id, balance FROM ledger WHERE company_id = 42 AND extract(year FROM transaction_date) = 2023 ORDER BY transaction_date, id",
+        "SELECT id, balance FROM ledger WHERE company_id = 42 AND transaction_date >= DATE '2023-01-01' AND transaction_date < DATE '2024-01-01' ORDER BY transaction_date, id",
+    ),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="sales rows (billing gets half)")
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.rows} sales, {args.rows // 2} bills, {args.companies} companies...")
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, args.companies)
+        seed_sales(conn, args.rows, args.companies)
+        seed_billing(conn, args.rows // 2, args.companies)
+        seed_ledger_from_documents(conn)
+        analyze(conn)
+
+    index_defs = {}
+    with engine.connect() as conn:
+        for name in INDEXES:
+            index_defs[name] = conn.execute(text("SELECT indexdef FROM pg_indexes WHERE indexname = :n"), {"n": name}).scalar()
+
+    results = {}
+    for phase in ("no indexes", "with indexes"):
+        with engine.begin() as conn:
+            if phase == "no indexes":
+                for name in INDEXES:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            else:
+                for name in INDEXES:
+                    conn.execute(text(index_defs[name]))
+            analyze(conn)
+        with engine.connect() as conn:
+            for label, (extract_sql, range_sql) in QUERIES.items():
+                results[(label, phase, "extract")] = time_query(conn, extract_sql, repeat=args.repeat)
+                results[(label, phase, "range")] = time_query(conn, range_sql, repeat=args.repeat)
+
+    rows = []
+    for label in QUERIES:
+        rows.append([
+            label,
+            f"{results[(label, 'no indexes', 'extract')]:.1f}",
+            f"{results[(label, 'no indexes', 'range')]:.1f}",
+            f"{results[(label, 'with indexes', 'extract')]:.1f}",
+            f"{results[(label, 'with indexes', 'range')]:.1f}",
+        ])
+    print()
+    print("Median ms per query")
+    print_table(["query", "extract", "range", "extract+idx", "range+idx"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Invoices per second through the sales, bill and payment write paths.
+
+Calls the route handlers directly from `--workers` threads, each with its own session,
+and counts the statements and commits the engine sees per document. Run it on two
+revisions to compare them, e.g. before and after a change to the posting transaction.
+
+    cd backend
+    BENCH_DATABASE_URL=postgresql://.../scratch python -m benchmarks.posting_throughput --invoices 2000 --workers 4
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import date
+from sqlalchemy import event
+
+from .common import engine, reset_schema, seed_companies, print_table
+from app.database import SessionLocal
+from app import models, schemas, auth
+from app.routers import sales, billing, payments
+
+class Counter:
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements += 1
+
+    def on_commit(self, conn):
+        with self._lock:
+            self.commits += 1
+
+def seed(companies: int):
+    reset_schema()
+    with engine.begin() as conn:
+        seed_companies(conn, companies)
+    db = SessionLocal()
+    try:
+        db.add(models.User(
+            email="bench@sktexcot.com",
+            password_hash=auth.get_password_hash("bench-password"),
+            full_name="Benchmark",
+            role=models.UserRole.OWNER
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+def load_user():
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).first()
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+def create_sale(db, user, rng, companies):
+    sales.create_sale(schemas.SalesCreate(
+        invoice_date=date(2024, rng.randint(1, 12), rng.randint(1, 28)),
+        company_id=rng.randint(1, companies),
+        quantity=rng.randint(1, 50),
+        rate=100,
+        gst_type=models.GSTType.INTRA_STATE,
+        gst_rate=5,
+        # Every fourth invoice is part-paid, which adds the auto receipt
+        amount_paid=100 if rng.random() < 0.25 else 0
+    ), db, user)
+
+def create_bill(db, user, rng, companies):
+    billing.create_bill(schemas.BillingCreate(
+        bill_number=f"VB/{rng.getrandbits(48)}",
+        bill_date=date(2024, rng.randint(1, 12), rng.randint(1, 28)),
+        vendor_id=rng.randint(1, companies),
+        quantity=rng.randint(1, 40),
+        rate=80,
+        gst_type=models.GSTType.INTRA_STATE,
+        gst_rate=5
+    ), db, user)
+
+def create_payment(db, user, rng, companies):
+    payments.create_payment(schemas.PaymentCreate(
+        payment_date=date(2024, rng.randint(1, 12), rng.randint(1, 28)),
+        payment_type=models.TransactionType.RECEIPT,
+        company_id=rng.randint(1, companies),
+        amount=rng.randint(100, 5000),
+        payment_mode=models.PaymentMode.BANK
+    ), db, user)
+
+PATHS = [
+    ("sales invoice", create_sale),
+    ("purchase bill", create_bill),
+    ("payment", create_payment),
+]
+
+def worker(fn, user, companies, count, seed_value, errors, lock):
+    rng = random.Random(seed_value)
+    for _ in range(count):
+        db = SessionLocal()
+        try:
+            fn(db, user, rng, companies)
+        except Exception:
+            db.rollback()
+            with lock:
+                errors.append(1)
+        finally:
+            db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=2000, help="documents per write path")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--companies", type=int, default=200)
+    args = parser.parse_args()
+
+    seed(args.companies)
+    user = load_user()
+    counter = Counter()
+    event.listen(engine, "before_cursor_execute", counter.on_execute)
+    event.listen(engine, "commit", counter.on_commit)
+    rows = []
+    try:
+        for label, fn in PATHS:
+            counter.statements = counter.commits = 0
+            errors, lock = [], threading.Lock()
+            per_worker = args.invoices // args.workers
+            threads = [
+                threading.Thread(target=worker, args=(fn, user, args.companies, per_worker, i, errors, lock))
+                for i in range(args.workers)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            done = per_worker * args.workers - len(errors)
+            rows.append([
+                label,
+                done,
+                f"{done / elapsed:.1f}",
+                f"{counter.statements / max(done, 1):.1f}",
+                f"{counter.commits / max(done, 1):.2f}",
+                len(errors),
+            ])
+    finally:
+        event.remove(engine, "before_cursor_execute", counter.on_execute)
+        event.remove(engine, "commit", counter.on_commit)
+
+    print()
+    print(f"{args.workers} workers")
+    print_table(["write path", "documents", "per second", "statements each", "commits each", "errors"], rows)
+
+if __name__ == "__main__":
+    main()
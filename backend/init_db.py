@@ -1,10 +1,12 @@
 from sqlalchemy.orm import Session
 from app.database import engine, Base, SessionLocal
-from app import models, auth
+from app import models, auth, posting, migrations, rollups, audit_partitions
 from app.models import UserRole
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    audit_partitions.ensure_partitions(engine)
     
     db = SessionLocal()
     
@@ -49,6 +51,24 @@ def init_db():
     else:
         print("Database already initialized.")
     
+    # Backfill the company balance aggregate on first start after upgrade
+    if not db.query(models.CompanyBalance).first() and db.query(models.Ledger).first():
+        print("Building company balances from ledger...")
+        posting.rebuild_company_balances(db)
+        db.commit()
+    
+    # Backfill stored running balances and monthly checkpoints likewise
+    if not db.query(models.LedgerCheckpoint).first() and db.query(models.Ledger).first():
+        print("Building running balances and checkpoints from ledger...")
+        posting.rebuild_running_balances(db)
+        db.commit()
+    
+    # Backfill monthly report rollups
+    if not db.query(models.MonthlyRollup).first() and (db.query(models.Sales).first() or db.query(models.Billing).first()):
+        print("Building monthly rollups from sales and billing...")
+        rollups.rebuild_rollups(db)
+        db.commit()
+    
     db.close()
 
 if __name__ == "__main__":
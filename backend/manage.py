@@ -0,0 +1,174 @@
+import argparse
+import sys
+from app.database import SessionLocal, engine
+from app import posting, migrations, rollups, audit_partitions, money
+
+# Maintenance commands. Run from the backend directory, e.g.
+#   python manage.py migrate
+#   python manage.py verify-balances
+#   python manage.py rebuild-balances
+#   python manage.py verify-ledger
+#   python manage.py rebuild-ledger
+#   python manage.py verify-rollups
+#   python manage.py rebuild-rollups
+#   python manage.py verify-amounts
+#   python manage.py recompute-amounts
+#   python manage.py archive-audit
+
+def migrate(args):
+    applied = migrations.run_migrations(engine)
+    print(f"{len(applied)} migration(s) applied." if applied else "Schema is up to date.")
+    return 0
+
+def verify_balances(args):
+    db = SessionLocal()
+    try:
+        drift = posting.verify_company_balances(db)
+    finally:
+        db.close()
+
+    if not drift:
+        print("company_balances matches ledger.")
+        return 0
+
+    print(f"{len(drift)} company balance(s) drifted from ledger:")
+    for d in drift:
+        print(
+            f"  company {d['company_id']}: "
+            f"stored Dr {d['stored_debit']:.2f} / Cr {d['stored_credit']:.2f}, "
+            f"ledger Dr {d['ledger_debit']:.2f} / Cr {d['ledger_credit']:.2f}"
+        )
+    return 1
+
+def rebuild_balances(args):
+    db = SessionLocal()
+    try:
+        drift = posting.verify_company_balances(db)
+        posting.rebuild_company_balances(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"company_balances rebuilt from ledger ({len(drift)} company balance(s) corrected).")
+    return 0
+
+def verify_ledger(args):
+    db = SessionLocal()
+    try:
+        result = posting.verify_running_balances(db)
+    finally:
+        db.close()
+
+    if not result["ledger_rows"] and not result["checkpoints"]:
+        print("Running balances and checkpoints match ledger.")
+        return 0
+
+    print(f"{result['ledger_rows']} ledger row(s) with a wrong running balance, "
+          f"{result['checkpoints']} missing or wrong checkpoint(s).")
+    return 1
+
+def rebuild_ledger(args):
+    db = SessionLocal()
+    try:
+        posting.rebuild_running_balances(db)
+        db.commit()
+    finally:
+        db.close()
+    print("Running balances and checkpoints rebuilt from ledger.")
+    return 0
+
+def verify_rollups(args):
+    db = SessionLocal()
+    try:
+        drifted = rollups.verify_rollups(db)
+    finally:
+        db.close()
+
+    if not drifted:
+        print("monthly_rollups matches sales and billing.")
+        return 0
+
+    print(f"{len(drifted)} rollup row(s) drifted:")
+    for kind, month, company_id, process_type in drifted[:50]:
+        print(f"  {kind} {month:%Y-%m} company {company_id} process '{process_type}'")
+    return 1
+
+def rebuild_rollups(args):
+    db = SessionLocal()
+    try:
+        rollups.rebuild_rollups(db)
+        db.commit()
+    finally:
+        db.close()
+    print("monthly_rollups rebuilt from sales and billing.")
+    return 0
+
+def _progress(name, last_id):
+    print(f"  {name}: through id {last_id}", file=sys.stderr)
+
+def verify_amounts(args):
+    db = SessionLocal()
+    try:
+        report = money.verify_amounts(db, args.chunk_size, _progress)
+    finally:
+        db.close()
+
+    drifted = sum(r["drifted"] for r in report.values())
+    for name, r in report.items():
+        print(f"{name}: {r['checked']} checked, {r['drifted']} drifted from the money rules "
+              f"({r['in_closed_periods']} in closed periods).")
+        if r["sample"]:
+            print(f"  e.g. ids {', '.join(str(i) for i in r['sample'])}")
+    return 1 if drifted else 0
+
+def recompute_amounts(args):
+    db = SessionLocal()
+    try:
+        counts = money.recompute_amounts(db, args.chunk_size, _progress)
+        posting.rebuild_company_balances(db)
+        posting.rebuild_running_balances(db)
+        rollups.rebuild_rollups(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"{counts['sales']} sale(s) and {counts['billing']} bill(s) recomputed; "
+          "balances, running balances and rollups rebuilt. Closed periods were left as they are.")
+    return 0
+
+def archive_audit(args):
+    audit_partitions.ensure_partitions(engine)
+    archived = audit_partitions.archive_partitions(engine, args.retention_months, args.archive_dir)
+    if not archived:
+        print(f"No audit log months older than {args.retention_months} month(s) to archive.")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SK Texcot maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help="Apply pending schema migrations").set_defaults(func=migrate)
+    sub.add_parser("verify-balances", help="Report drift between company_balances and ledger").set_defaults(func=verify_balances)
+    sub.add_parser("rebuild-balances", help="Recompute company_balances from ledger").set_defaults(func=rebuild_balances)
+    sub.add_parser("verify-ledger", help="Report stale running balances or checkpoints").set_defaults(func=verify_ledger)
+    sub.add_parser("rebuild-ledger", help="Recompute running balances and checkpoints from ledger").set_defaults(func=rebuild_ledger)
+
+    sub.add_parser("verify-rollups", help="Report drift between monthly_rollups and sales/billing").set_defaults(func=verify_rollups)
+    sub.add_parser("rebuild-rollups", help="Backfill monthly_rollups from sales and billing").set_defaults(func=rebuild_rollups)
+
+    for name, func, help_text in (
+        ("verify-amounts", verify_amounts, "Report sales/bills whose stored amounts differ from the money rules"),
+        ("recompute-amounts", recompute_amounts, "Recompute drifted sale/bill amounts outside closed periods, then rebuild balances and rollups"),
+    ):
+        amounts = sub.add_parser(name, help=help_text)
+        amounts.add_argument("--chunk-size", type=int, default=money.RECOMPUTE_CHUNK_SIZE, help="documents per id range")
+        amounts.set_defaults(func=func)
+
+    archive = sub.add_parser("archive-audit", help="Create upcoming audit_logs partitions and archive months past retention")
+    archive.add_argument("--retention-months", type=int, default=audit_partitions.AUDIT_RETENTION_MONTHS)
+    archive.add_argument("--archive-dir", default=audit_partitions.AUDIT_ARCHIVE_DIR)
+    archive.set_defaults(func=archive_audit)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+from datetime import date
+import pytest
+from fastapi import HTTPException
+
+from app import models, schemas, auth, closing, posting
+from app.routers import company as company_router
+
+# Months close in order and reopen from the latest, so nothing can move a closed period's
+# cumulative figures: not a backdated posting, nor an opening-balance edit
+
+@pytest.fixture
+def setup(db):
+    user = models.User(
+        email="tests@sktexcot.com",
+        password_hash=auth.get_password_hash("tests-password"),
+        full_name="Tests",
+        role=models.UserRole.OWNER
+    )
+    company = models.Company(name="Company 1", opening_balance=1000.0)
+    db.add_all([user, company])
+    db.commit()
+    for day in (date(2024, 1, 10), date(2024, 2, 10), date(2024, 3, 10)):
+        posting.add_entry(db, models.Ledger(
+            company_id=company.id, transaction_date=day, transaction_type=models.TransactionType.PAYMENT,
+            debit_amount=100.0, credit_amount=0.0
+        ))
+    db.commit()
+    return user, company
+
+def _close(db, user, month: date):
+    return closing.close_period(db, month, date(month.year, month.month + 1, 1), user.id)
+
+def _reopen(db, month: date):
+    return closing.reopen_period(db, month, date(month.year, month.month + 1, 1))
+
+def _conflict(call, *args):
+    with pytest.raises(HTTPException) as error:
+        call(*args)
+    assert error.value.status_code == 409
+    return error.value.detail
+
+def test_months_close_in_order(db, setup):
+    user, _ = setup
+    assert "Jan 2024" in _conflict(_close, db, user, date(2024, 2, 1))
+    db.rollback()
+
+    assert _close(db, user, date(2024, 1, 1)) == [date(2024, 1, 1)]
+    assert _close(db, user, date(2024, 2, 1)) == [date(2024, 2, 1)]
+    # A range starting at a closed month closes the rest of it
+    assert closing.close_period(db, date(2024, 1, 1), date(2024, 4, 1), user.id) == [date(2024, 3, 1)]
+
+def test_months_reopen_from_the_latest(db, setup):
+    user, _ = setup
+    closing.close_period(db, date(2024, 1, 1), date(2024, 3, 1), user.id)
+    assert "Feb 2024" in _conflict(_reopen, db, date(2024, 1, 1))
+    db.rollback()
+
+    closing.close_period(db, date(2024, 1, 1), date(2024, 3, 1), user.id)
+    assert _reopen(db, date(2024, 2, 1)) == [date(2024, 2, 1)]
+    assert _reopen(db, date(2024, 1, 1)) == [date(2024, 1, 1)]
+
+def test_backdated_writes_are_rejected(db, setup):
+    user, _ = setup
+    closing.close_period(db, date(2024, 1, 1), date(2024, 3, 1), user.id)
+    # Inside a closed month, and before the first ledger activity
+    _conflict(closing.ensure_open, db, date(2024, 2, 29))
+    _conflict(closing.ensure_open, db, date(2023, 6, 1))
+    closing.ensure_open(db, date(2024, 3, 1), None)
+
+def test_opening_balance_edits_are_rejected_once_closed(db, setup):
+    user, company = setup
+    update = schemas.CompanyUpdate(opening_balance=2500.0)
+    company_router.update_company(company.id, update, db, user)
+    assert company.opening_balance == 2500.0
+
+    _close(db, user, date(2024, 1, 1))
+    db.commit()
+    _conflict(company_router.update_company, company.id, schemas.CompanyUpdate(opening_balance=0.0), db, user)
+    db.rollback()
+    # Anything else can still change, including the opening balance sent back unchanged
+    company_router.update_company(company.id, schemas.CompanyUpdate(phone="98400", opening_balance=2500.0), db, user)
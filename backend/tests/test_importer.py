@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+import itertools
+import pytest
+
+from app import models, importer, auth
+
+# Undated rows take the day the import started, in the validating pass and the inserting
+# one alike, however long the job runs
+
+def _clock_past_midnight():
+    # A date class whose today() moves on a day every time it's read, from 30 June 2024
+    days = itertools.count()
+
+    class Midnight(date):
+        @classmethod
+        def today(cls):
+            return date(2024, 6, 30) + timedelta(days=next(days))
+    return Midnight
+
+@pytest.fixture
+def user(db):
+    user = models.User(
+        email="tests@sktexcot.com",
+        password_hash=auth.get_password_hash("tests-password"),
+        full_name="Tests",
+        role=models.UserRole.OWNER
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+def test_undated_rows_keep_one_date(db, user, monkeypatch):
+    monkeypatch.setattr(importer, "date", _clock_past_midnight())
+    rows = [
+        {"Party": "Acme Mills", "Quantity": 10, "Rate": 12.5},
+        {"Party": "Acme Mills", "Quantity": 3, "Rate": 40, "Date": "2024-05-02"},
+        {"Party": "Beta Dyers", "Quantity": 1, "Rate": 99},
+    ]
+    result = importer.import_data(db, ["Acme Mills", "Beta Dyers"], lambda: [rows[:2], rows[2:]], user.id, chunk_size=2)
+    assert result["imported_count"] == 3
+    assert result["errors"] == []
+
+    dates = sorted(day for (day,) in db.query(models.Sales.invoice_date))
+    assert dates == [date(2024, 5, 2), date(2024, 6, 30), date(2024, 6, 30)]
@@ -0,0 +1,115 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy import select, cast, literal, Numeric, Boolean
+
+from datetime import date
+from app import money, schemas, models, auth, posting
+from app.models import GSTType, TransactionType, PaymentMode
+from app.routers import sales, billing, payments
+
+# (quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid), with quantities and rates
+# finer than their columns keep, halves on the rounding boundaries and awkward GST rates
+CASES = [
+    (1.2345, 33.33335, 5, 1, 0, 0),
+    (3, 33.33, 18, 2, 1.5, 50),
+    (0.0005, 99999.99995, 12, 0.75, 0, 0),
+    (12.5, 41.1, 2.5, 0.1, 0, 1000),
+    (7.0015, 0.005, 28, 10, 0.01, 0),
+    (250, 12.34565, 5.0005, 1.0005, 0, 3000),
+]
+
+def _stored(value, precision: int, scale: int):
+    # What Postgres keeps when the value is written to a column of that type
+    return cast(literal(str(value)), Numeric(precision, scale))
+
+def _sql_amounts(db, rules, *args):
+    expected = rules(money._SQL, *args)
+    row = db.execute(select(*[value.label(name) for name, value in expected.items()])).mappings().one()
+    return {name: float(value) for name, value in row.items()}
+
+@pytest.mark.parametrize("quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid", CASES)
+def test_inputs_are_rounded_to_their_columns(quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid):
+    stored = (
+        money._stored(quantity, money.QUANTITY_STEP),
+        money._stored(rate, money.RATE_STEP),
+        money._stored(gst_rate, money.PERCENT_STEP),
+    )
+    for gst_type in GSTType:
+        assert money.sale_amounts(quantity, rate, gst_rate, gst_type, tcs_amount, amount_paid) == \
+            money.sale_amounts(*stored, gst_type, tcs_amount, amount_paid)
+    assert money.bill_amounts(quantity, rate, gst_rate, True, tds_rate, amount_paid) == \
+        money.bill_amounts(*stored, True, money._stored(tds_rate, money.PERCENT_STEP), amount_paid)
+
+def test_invoice_lines_add_up_to_the_header():
+    lines = [(quantity, rate) for quantity, rate, *_ in CASES]
+    line_amounts, header = money.invoice_amounts(lines, 5, GSTType.INTRA_STATE, tcs_amount=2.5, amount_paid=100)
+    for name in ("base_amount", "cgst_amount", "sgst_amount", "igst_amount"):
+        assert Decimal(str(header[name])) == sum(Decimal(str(line[name])) for line in line_amounts)
+    assert header["total_amount"] == money.total(*[line["total_amount"] for line in line_amounts], 2.5)
+    assert Decimal(str(header["quantity"])) == sum(money._stored(q, money.QUANTITY_STEP) for q, _ in lines)
+
+@pytest.mark.parametrize("quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid", CASES)
+def test_sale_rules_match_sql(db, quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid):
+    for gst_type in GSTType:
+        python = money.sale_amounts(quantity, rate, gst_rate, gst_type, tcs_amount, amount_paid)
+        sql = _sql_amounts(
+            db, money._sale_rules,
+            _stored(quantity, 18, 3), _stored(rate, 18, 4), _stored(gst_rate, 7, 3),
+            literal(gst_type == GSTType.INTRA_STATE, Boolean), _stored(tcs_amount, 18, 2), _stored(amount_paid, 18, 2)
+        )
+        assert python == sql
+
+@pytest.mark.parametrize("quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid", CASES)
+def test_bill_rules_match_sql(db, quantity, rate, gst_rate, tds_rate, tcs_amount, amount_paid):
+    for tds_applicable in (True, False):
+        python = money.bill_amounts(quantity, rate, gst_rate, tds_applicable, tds_rate, amount_paid)
+        sql = _sql_amounts(
+            db, money._bill_rules,
+            _stored(quantity, 18, 3), _stored(rate, 18, 4), _stored(gst_rate, 7, 3),
+            literal(tds_applicable, Boolean), _stored(tds_rate, 7, 3), _stored(amount_paid, 18, 2)
+        )
+        assert python == sql
+
+def test_request_amounts_are_rounded_to_the_paisa():
+    payment = schemas.PaymentCreate(
+        payment_date=date(2024, 6, 1), payment_type=TransactionType.RECEIPT, company_id=1,
+        amount=0.125, payment_mode=PaymentMode.CASH
+    )
+    assert payment.amount == 0.13
+    assert schemas.SalesUpdate(amount_paid=2.675, tcs_amount=0.005).model_dump(exclude_unset=True) == \
+        {"amount_paid": 2.68, "tcs_amount": 0.01}
+    assert schemas.BillingUpdate(amount_paid=None).amount_paid is None
+
+def test_payments_with_fractions_of_a_paisa_post_without_drift(db):
+    user = models.User(
+        email="tests@sktexcot.com",
+        password_hash=auth.get_password_hash("tests-password"),
+        full_name="Tests",
+        role=models.UserRole.OWNER
+    )
+    company = models.Company(name="Company 1")
+    db.add_all([user, company])
+    db.commit()
+
+    sale = sales.create_sale(schemas.SalesCreate(
+        invoice_date=date(2024, 6, 10), company_id=company.id, quantity=3, rate=33.33,
+        gst_type=GSTType.INTRA_STATE, gst_rate=5, tcs_amount=0.005, amount_paid=0.125
+    ), db, user)
+    billing.create_bill(schemas.BillingCreate(
+        bill_number="B-1", bill_date=date(2024, 6, 12), vendor_id=company.id, quantity=10, rate=7.25,
+        gst_type=GSTType.INTER_STATE, gst_rate=12, amount_paid=1.005
+    ), db, user)
+    receipt = payments.create_payment(schemas.PaymentCreate(
+        payment_date=date(2024, 5, 20), payment_type=TransactionType.RECEIPT, company_id=company.id,
+        amount=10.125, payment_mode=PaymentMode.UPI, sales_id=sale.id
+    ), db, user)
+    payments.update_payment(receipt.id, schemas.PaymentCreate(
+        payment_date=date(2024, 5, 20), payment_type=TransactionType.RECEIPT, company_id=company.id,
+        amount=20.335, payment_mode=PaymentMode.UPI, sales_id=sale.id
+    ), db, user)
+    sales.update_sale(sale.id, schemas.SalesUpdate(amount_paid=5.555), db, user)
+
+    assert posting.verify_running_balances(db) == {"ledger_rows": 0, "checkpoints": 0}
+    assert posting.verify_company_balances(db, tolerance=0) == []
+    report = money.verify_amounts(db)
+    assert report["sales"]["drifted"] == report["billing"]["drifted"] == 0
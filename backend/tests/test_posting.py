@@ -0,0 +1,132 @@
+from datetime import date
+import pytest
+
+from app import models, posting
+
+# Stored running balances, checkpoints and company balances must always equal a full
+# recompute, whatever order entries arrive in and however they are edited
+
+CLEAN = {"ledger_rows": 0, "checkpoints": 0}
+
+@pytest.fixture
+def companies(db):
+    rows = [models.Company(name=f"Company {n}") for n in (1, 2)]
+    db.add_all(rows)
+    db.commit()
+    return [company.id for company in rows]
+
+def _entry(company_id: int, day: date, debit: float = 0.0, credit: float = 0.0):
+    return models.Ledger(
+        company_id=company_id, transaction_date=day, transaction_type=models.TransactionType.PAYMENT,
+        debit_amount=debit, credit_amount=credit
+    )
+
+def _snapshot(db):
+    balances = dict(db.query(models.Ledger.id, models.Ledger.balance).all())
+    checkpoints = {
+        (cp.company_id, cp.month_start): (cp.debit_total, cp.credit_total)
+        for cp in db.query(models.LedgerCheckpoint).all()
+    }
+    return balances, checkpoints
+
+def _assert_consistent(db):
+    db.flush()
+    assert posting.verify_running_balances(db) == CLEAN
+    assert posting.verify_company_balances(db) == []
+
+    stored = _snapshot(db)
+    posting.rebuild_running_balances(db)
+    db.expire_all()
+    assert _snapshot(db) == stored
+    db.rollback()
+
+def _post(db, company_id, days_and_amounts):
+    entries = []
+    for day, debit, credit in days_and_amounts:
+        entries.append(posting.add_entry(db, _entry(company_id, day, debit, credit)))
+    db.commit()
+    return entries
+
+def test_backdated_inserts(db, companies):
+    first, second = companies
+    # Out of date order: each later call lands before rows already posted, across months
+    _post(db, first, [
+        (date(2024, 6, 15), 1000.0, 0.0),
+        (date(2024, 6, 1), 0.0, 250.5),
+        (date(2024, 3, 10), 120.25, 0.0),
+        (date(2024, 6, 15), 0.0, 99.99),
+        (date(2023, 12, 31), 5000.0, 0.0),
+        (date(2024, 4, 30), 0.0, 1.01),
+    ])
+    _post(db, second, [(date(2024, 5, 5), 10.0, 0.0), (date(2024, 1, 1), 0.0, 10.0)])
+    _assert_consistent(db)
+
+    entries = db.query(models.Ledger).filter(models.Ledger.company_id == first).order_by(
+        models.Ledger.transaction_date, models.Ledger.id
+    ).all()
+    assert entries[-1].balance == pytest.approx(5000.0 + 120.25 - 1.01 - 250.5 + 1000.0 - 99.99)
+
+def test_bulk_insert_then_post_pending(db, companies):
+    first, second = companies
+    _post(db, first, [(date(2024, 6, 1), 500.0, 0.0)])
+    rows = [
+        {"company_id": company_id, "transaction_date": day, "transaction_type": models.TransactionType.PAYMENT,
+         "debit_amount": debit, "credit_amount": credit}
+        for company_id, day, debit, credit in [
+            (first, date(2024, 2, 2), 75.5, 0.0),
+            (first, date(2024, 7, 7), 0.0, 20.0),
+            (second, date(2023, 11, 30), 300.0, 0.0),
+        ]
+    ]
+    posting.lock_companies(db, first, second)
+    pending = {}
+    posting.insert_entries(db, rows, pending)
+    posting.post_pending(db, pending)
+    db.commit()
+    _assert_consistent(db)
+
+@pytest.mark.parametrize("values", [
+    {"debit_amount": 777.77},
+    {"transaction_date": date(2023, 10, 1)},
+    {"transaction_date": date(2024, 12, 31), "credit_amount": 42.0},
+    {"transaction_date": date(2024, 6, 15)},
+])
+def test_update_entry(db, companies, values):
+    first, _ = companies
+    entries = _post(db, first, [
+        (date(2024, 1, 20), 100.0, 0.0),
+        (date(2024, 3, 5), 200.0, 0.0),
+        (date(2024, 6, 15), 0.0, 50.0),
+        (date(2024, 8, 1), 300.0, 0.0),
+    ])
+    posting.update_entry(db, entries[1], **values)
+    db.commit()
+    _assert_consistent(db)
+
+def test_update_entry_to_another_company(db, companies):
+    first, second = companies
+    entries = _post(db, first, [(date(2024, 2, 1), 100.0, 0.0), (date(2024, 4, 1), 60.0, 0.0)])
+    _post(db, second, [(date(2024, 3, 1), 0.0, 40.0)])
+    posting.update_entry(db, entries[0], company_id=second, transaction_date=date(2024, 5, 1))
+    db.commit()
+    _assert_consistent(db)
+
+def test_delete_entries(db, companies):
+    first, second = companies
+    entries = _post(db, first, [
+        (date(2024, 1, 10), 100.0, 0.0),
+        (date(2024, 2, 10), 0.0, 30.0),
+        (date(2024, 2, 20), 45.0, 0.0),
+        (date(2024, 5, 1), 10.0, 0.0),
+    ])
+    _post(db, second, [(date(2024, 2, 10), 5.0, 0.0)])
+
+    # A backdated delete in the middle of the series, then every row of one month
+    assert posting.delete_entries(db, models.Ledger.id == entries[1].id) == 1
+    db.commit()
+    _assert_consistent(db)
+
+    assert posting.delete_entries(db, models.Ledger.transaction_date >= date(2024, 2, 1),
+                                  models.Ledger.transaction_date < date(2024, 3, 1)) == 2
+    db.commit()
+    _assert_consistent(db)
@@ -0,0 +1,121 @@
+from datetime import date
+import pytest
+
+from app import models, schemas, auth, rollups, money, posting
+from app.models import GSTType, ProcessType
+from app.routers import sales, billing
+
+# Rollups written by the create/update/delete handlers must match a fresh aggregate of
+# sales and billing after every step, and the documents' amounts the money rules. A
+# document moved to another party or date takes its ledger row and payments with it.
+
+@pytest.fixture
+def setup(db):
+    user = models.User(
+        email="tests@sktexcot.com",
+        password_hash=auth.get_password_hash("tests-password"),
+        full_name="Tests",
+        role=models.UserRole.OWNER
+    )
+    companies = [models.Company(name=f"Company {n}") for n in (1, 2)]
+    db.add_all([user, *companies])
+    db.commit()
+    return user, [company.id for company in companies]
+
+def _assert_consistent(db):
+    assert rollups.verify_rollups(db) == []
+    report = money.verify_amounts(db)
+    assert report["sales"]["drifted"] == report["billing"]["drifted"] == 0
+
+def _ledger_rows(db, reference_model: str, reference_id: int):
+    # (company, date) of the document's ledger row and of its payments' rows
+    payments = db.query(models.Payment.id).filter(
+        (models.Payment.sales_id if reference_model == "Sales" else models.Payment.billing_id) == reference_id
+    )
+    rows = db.query(models.Ledger.company_id, models.Ledger.transaction_date, models.Ledger.reference_model).filter(
+        ((models.Ledger.reference_model == reference_model) & (models.Ledger.reference_id == reference_id)) |
+        ((models.Ledger.reference_model == "Payment") & models.Ledger.reference_id.in_(payments))
+    ).all()
+    return {model: (company_id, day) for company_id, day, model in rows}
+
+def _assert_moved(db, reference_model: str, reference_id: int, company_id: int, day: date):
+    rows = _ledger_rows(db, reference_model, reference_id)
+    assert rows[reference_model] == (company_id, day)
+    assert rows["Payment"][0] == company_id
+    assert posting.verify_running_balances(db) == {"ledger_rows": 0, "checkpoints": 0}
+    assert posting.verify_company_balances(db) == []
+
+def _sale(company_id: int, **values):
+    return schemas.SalesCreate(**{
+        "invoice_date": date(2024, 6, 10), "company_id": company_id, "process_type": ProcessType.DYEING,
+        "quantity": 12.5, "rate": 41.1, "gst_type": GSTType.INTRA_STATE, "gst_rate": 5, **values
+    })
+
+def _bill(vendor_id: int, number: str, **values):
+    return schemas.BillingCreate(**{
+        "bill_number": number, "bill_date": date(2024, 6, 12), "vendor_id": vendor_id, "process_type": "knitting",
+        "quantity": 100, "rate": 7.25, "gst_type": GSTType.INTER_STATE, "gst_rate": 12,
+        "tds_applicable": True, "tds_rate": 1, **values
+    })
+
+def test_sales(db, setup):
+    user, (first, second) = setup
+    single = sales.create_sale(_sale(first, tcs_amount=1.5, amount_paid=100), db, user).id
+    # Backdated into an earlier month, inter-state
+    sales.create_sale(_sale(second, invoice_date=date(2024, 2, 29), gst_type=GSTType.INTER_STATE), db, user)
+    _assert_consistent(db)
+
+    sales.update_sale(single, schemas.SalesUpdate(quantity=20, gst_rate=18), db, user)
+    _assert_consistent(db)
+    # Moved to another company only, then to another month and process only
+    sales.update_sale(single, schemas.SalesUpdate(company_id=second), db, user)
+    _assert_consistent(db)
+    _assert_moved(db, "Sales", single, second, date(2024, 6, 10))
+    sales.update_sale(single, schemas.SalesUpdate(
+        invoice_date=date(2024, 1, 15), process_type=ProcessType.FINISHING
+    ), db, user)
+    _assert_consistent(db)
+    _assert_moved(db, "Sales", single, second, date(2024, 1, 15))
+
+    sales.delete_sale(single, db, user)
+    _assert_consistent(db)
+
+def test_multi_line_sales(db, setup):
+    user, (first, _) = setup
+    # Rolled up from the header, whose amounts are the sums of its lines
+    multi = sales.create_sale(_sale(first, quantity=None, rate=None, lines=[
+        {"process_type": ProcessType.KNITTING, "quantity": 3, "rate": 33.33},
+        {"process_type": ProcessType.STITCHING, "quantity": 1.2345, "rate": 33.33335},
+    ]), db, user).id
+    _assert_consistent(db)
+
+    sales.update_sale(multi, schemas.SalesUpdate(lines=[{"quantity": 7, "rate": 10}]), db, user)
+    _assert_consistent(db)
+    sales.update_sale(multi, schemas.SalesUpdate(invoice_date=date(2024, 4, 1), gst_rate=12), db, user)
+    _assert_consistent(db)
+
+    sales.delete_sale(multi, db, user)
+    _assert_consistent(db)
+
+def test_billing(db, setup):
+    user, (first, second) = setup
+    bill = billing.create_bill(_bill(first, "B-1", amount_paid=50), db, user).id
+    billing.create_bill(_bill(second, "B-2", bill_date=date(2024, 3, 1), tds_applicable=False), db, user)
+    billing.create_bill(_bill(first, "B-3", gst_type=GSTType.INTRA_STATE, process_type=None), db, user)
+    _assert_consistent(db)
+
+    billing.update_bill(bill, schemas.BillingUpdate(rate=9.99, tds_rate=2), db, user)
+    _assert_consistent(db)
+    billing.update_bill(bill, schemas.BillingUpdate(vendor_id=second), db, user)
+    _assert_consistent(db)
+    _assert_moved(db, "Billing", bill, second, date(2024, 6, 12))
+    billing.update_bill(bill, schemas.BillingUpdate(bill_date=date(2023, 12, 20), gst_type=GSTType.INTRA_STATE), db, user)
+    _assert_consistent(db)
+    _assert_moved(db, "Billing", bill, second, date(2023, 12, 20))
+    # Moved back together with an amount change
+    billing.update_bill(bill, schemas.BillingUpdate(vendor_id=first, tds_applicable=False), db, user)
+    _assert_consistent(db)
+    _assert_moved(db, "Billing", bill, first, date(2023, 12, 20))
+
+    billing.delete_bill(bill, db, user)
+    _assert_consistent(db)
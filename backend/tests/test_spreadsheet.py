@@ -0,0 +1,62 @@
+import io
+import tempfile
+import pytest
+from datetime import datetime
+from openpyxl import Workbook
+
+from app import spreadsheet
+
+# Uploads arrive as UploadFile.file, a SpooledTemporaryFile, so the readers are tested on
+# one: in memory, rolled over to disk, and without the readable()/seekable()/writable()
+# it only gained in Python 3.11 (the Docker image runs 3.10)
+
+CSV = "\ufeffParty,Date,Quantity,Rate\nAcme Mills,2024-06-10,12.5,41.1\n,,,\nBeta Dyers,2024-06-11,3,33.33\n"
+
+class _Python310Upload(tempfile.SpooledTemporaryFile):
+    # SpooledTemporaryFile as Python 3.10 has it
+    readable = seekable = writable = property(lambda self: self._missing())
+
+    def _missing(self):
+        raise AttributeError("not on Python 3.10")
+
+UPLOADS = ["in memory", "on disk", "python 3.10"]
+
+def _upload(data: bytes, kind: str):
+    upload_class = _Python310Upload if kind == "python 3.10" else tempfile.SpooledTemporaryFile
+    fileobj = upload_class(max_size=1024 * 1024)
+    fileobj.write(data)
+    if kind == "on disk":
+        fileobj.rollover()
+    return fileobj
+
+@pytest.mark.parametrize("kind", UPLOADS)
+def test_csv_upload(kind):
+    with _upload(CSV.encode("utf-8"), kind) as fileobj:
+        rows = list(spreadsheet.iter_sales_rows(fileobj, "sales.csv", chunk_rows=1))
+        assert [row["Party"] for row in rows] == ["Acme Mills", "Beta Dyers"]
+        assert rows[0]["Quantity"] == 12.5
+        # Still open and readable for the caller once the rows are read
+        fileobj.seek(0)
+        assert fileobj.read(3) == "\ufeff".encode("utf-8")
+
+@pytest.mark.parametrize("kind", UPLOADS)
+def test_xlsx_upload(kind):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Sales"
+    sheet.append(["Party", "Date", "Quantity"])
+    sheet.append(["Acme Mills", datetime(2024, 6, 10), 12.5])
+    sheet.append([None, None, None])
+    data = io.BytesIO()
+    workbook.save(data)
+
+    with _upload(data.getvalue(), kind) as fileobj:
+        rows = list(spreadsheet.iter_sales_rows(fileobj, "sales.xlsx"))
+        assert rows == [{"Party": "Acme Mills", "Date": datetime(2024, 6, 10), "Quantity": 12.5}]
+
+def test_scan():
+    with _upload(CSV.encode("utf-8"), "in memory") as fileobj:
+        preview, companies, count = spreadsheet.scan(spreadsheet.iter_sales_rows(fileobj, "sales.csv"), preview_rows=1)
+    assert len(preview) == 1
+    assert companies == ["Acme Mills", "Beta Dyers"]
+    assert count == 2
@@ -17,6 +17,7 @@ const CONFIG = {
         GST: '/gst/summary',
         TDS: '/tds/summary',
         EXCEL_UPLOAD: '/excel/upload',
-        EXCEL_IMPORT: '/excel/import'
+        EXCEL_IMPORT: '/excel/import',
+        JOBS: '/jobs'
     }
 };
@@ -1,6 +1,6 @@
 const Excel = {
-    // Current Preview Data
-    data: null,
+    // Staged upload awaiting confirmation (rows stay on the server)
+    importId: null,
 
     uploadFile: async () => {
         const fileInput = document.getElementById('excelFile');
@@ -15,9 +15,8 @@ const Excel = {
         try {
             const res = await Utils.api.upload(CONFIG.ENDPOINTS.EXCEL_UPLOAD, formData);
             if (res && res.success) {
-                Excel.data = res.data;
-                Excel.data.companies = res.companies || [];  // Store companies list
-                Excel.renderPreview(res.data, res.companies);
+                Excel.importId = res.import_id;
+                Excel.renderPreview(res.data, res.companies, res.row_count);
                 document.getElementById('previewArea').classList.remove('hidden');
                 document.getElementById('uploadStatus').innerText = `File parsed successfully. Found ${res.companies ? res.companies.length : 0} companies.`;
             } else {
@@ -28,7 +27,7 @@ const Excel = {
         }
     },
 
-    renderPreview: (data, companies) => {
+    renderPreview: (data, companies, rowCount) => {
         const container = document.getElementById('previewContent');
         let html = '';
 
@@ -45,7 +44,7 @@ const Excel = {
         }
 
         if (data.sales) {
-            html += `<h3>Sales Data (${data.sales.length} rows)</h3>`;
+            html += `<h3>Sales Data (${rowCount ?? data.sales.length} rows)</h3>`;
             html += `<div class="table-container" style="max-height:300px; overflow-y:auto; margin-bottom:20px;">`;
             html += `<table class="data-table"><thead><tr>`;
             // Headers
@@ -65,22 +64,48 @@ const Excel = {
         container.innerHTML = html;
     },
 
+    // Poll a background job until it finishes, reporting chunk progress
+    waitForJob: async (jobId, onProgress) => {
+        while (true) {
+            const job = await Utils.api.get(`${CONFIG.ENDPOINTS.JOBS}/${jobId}`);
+            if (!job) return null;
+            if (['succeeded', 'failed', 'cancelled'].includes(job.status)) return job;
+            if (onProgress) onProgress(job);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    },
+
     confirmImport: async () => {
-        if (!Excel.data) return;
+        if (!Excel.importId) return;
 
         if (confirm('Are you sure you want to import this data? Companies will be created automatically.')) {
+            const status = document.getElementById('uploadStatus');
             try {
-                const res = await Utils.api.post(CONFIG.ENDPOINTS.EXCEL_IMPORT, Excel.data);
-                if (res && res.success) {
-                    const msg = `Imported ${res.imported_count} sales records. Created ${res.companies_created} new companies.`;
+                const res = await Utils.api.post(CONFIG.ENDPOINTS.EXCEL_IMPORT, { import_id: Excel.importId });
+                if (!res || !res.job_id) return;
+
+                status.innerText = 'Import queued...';
+                const job = await Excel.waitForJob(res.job_id, (j) => {
+                    status.innerText = j.progress_total
+                        ? `Importing... ${j.progress_done} / ${j.progress_total} rows`
+                        : 'Importing...';
+                });
+                if (!job) return;
+
+                if (job.status === 'succeeded') {
+                    const result = job.result;
+                    const msg = `Imported ${result.imported_count} sales records. Created ${result.companies_created} new companies.`;
                     Utils.showToast(msg, 'success');
-                    if (res.errors && res.errors.length > 0) {
-                        console.warn('Import warnings:', res.errors);
+                    status.innerText = msg;
+                    if (result.errors && result.errors.length > 0) {
+                        console.warn('Import warnings:', result.errors);
                     }
+                    Excel.importId = null;
                     document.getElementById('previewArea').classList.add('hidden');
                     document.getElementById('excelFile').value = '';
                 } else {
-                    if (res.errors) alert('Import Errors:\n' + res.errors.join('\n'));
+                    status.innerText = 'Import failed.';
+                    alert('Import Errors:\n' + (job.error || job.status));
                 }
             } catch (e) { }
         }
@@ -28,45 +28,53 @@ const Ledger = {
         const fromDate = document.getElementById('from_date').value;
         const toDate = document.getElementById('to_date').value;
 
-        try {
-            const query = `?from_date=${fromDate}&to_date=${toDate}`;
-            const res = await Utils.api.get(`${CONFIG.ENDPOINTS.LEDGER}company/${companyId}${query}`);
-
-            if (res && res.success) {
-                const data = res.data;
-                document.getElementById('ledgerSummary').classList.remove('hidden');
-                document.getElementById('openingBal').innerText = Utils.formatCurrency(data.opening_balance.net);
-                document.getElementById('closingBal').innerText = Utils.formatCurrency(data.closing_balance);
+        const tbody = document.querySelector('#ledgerTable tbody');
+        tbody.innerHTML = '';
 
-                const tbody = document.querySelector('#ledgerTable tbody');
+        try {
+            // Statement is streamed as NDJSON (header, entries..., footer) and rendered as it arrives
+            const query = `?from_date=${fromDate}&to_date=${toDate}&format=ndjson`;
+            await Utils.api.stream(`${CONFIG.ENDPOINTS.LEDGER}company/${companyId}/statement${query}`, (items) => {
+                let html = '';
 
-                // Add Opening Row
-                let html = `
-                    <tr style="background:#f9f9f9; font-weight:bold;">
-                        <td>${Utils.formatDate(fromDate)}</td>
-                        <td>OPENING BALANCE</td>
-                        <td>-</td>
-                        <td>${data.opening_balance.net > 0 ? Utils.formatCurrency(data.opening_balance.net) : '-'}</td>
-                        <td>${data.opening_balance.net < 0 ? Utils.formatCurrency(Math.abs(data.opening_balance.net)) : '-'}</td>
-                        <td>${Utils.formatCurrency(data.opening_balance.net)}</td>
-                        <td>Brought Forward</td>
-                    </tr>
-                `;
+                items.forEach(item => {
+                    if (item.type === 'header') {
+                        const net = item.opening_balance.net;
+                        document.getElementById('ledgerSummary').classList.remove('hidden');
+                        document.getElementById('openingBal').innerText = Utils.formatCurrency(net);
+                        document.getElementById('closingBal').innerText = Utils.formatCurrency(net);
 
-                html += data.entries.map(e => `
-                    <tr>
-                        <td>${Utils.formatDate(e.transaction_date)}</td>
-                        <td><span class="status-badge" style="background:var(--primary); color:white">${e.transaction_type}</span></td>
-                        <td>${e.reference_model} #${e.reference_id}</td>
-                        <td>${e.debit_amount ? Utils.formatCurrency(e.debit_amount) : '-'}</td>
-                        <td>${e.credit_amount ? Utils.formatCurrency(e.credit_amount) : '-'}</td>
-                        <td style="font-weight:bold">${Utils.formatCurrency(e.running_balance)}</td>
-                        <td>${e.narration || '-'}</td>
-                    </tr>
-                `).join('');
+                        // Add Opening Row
+                        html += `
+                            <tr style="background:#f9f9f9; font-weight:bold;">
+                                <td>${Utils.formatDate(fromDate)}</td>
+                                <td>OPENING BALANCE</td>
+                                <td>-</td>
+                                <td>${net > 0 ? Utils.formatCurrency(net) : '-'}</td>
+                                <td>${net < 0 ? Utils.formatCurrency(Math.abs(net)) : '-'}</td>
+                                <td>${Utils.formatCurrency(net)}</td>
+                                <td>Brought Forward</td>
+                            </tr>
+                        `;
+                    } else if (item.type === 'entry') {
+                        html += `
+                            <tr>
+                                <td>${Utils.formatDate(item.transaction_date)}</td>
+                                <td><span class="status-badge" style="background:var(--primary); color:white">${item.transaction_type}</span></td>
+                                <td>${item.reference_model} #${item.reference_id}</td>
+                                <td>${item.debit_amount ? Utils.formatCurrency(item.debit_amount) : '-'}</td>
+                                <td>${item.credit_amount ? Utils.formatCurrency(item.credit_amount) : '-'}</td>
+                                <td style="font-weight:bold">${Utils.formatCurrency(item.running_balance)}</td>
+                                <td>${item.narration || '-'}</td>
+                            </tr>
+                        `;
+                    } else if (item.type === 'footer') {
+                        document.getElementById('closingBal').innerText = Utils.formatCurrency(item.closing_balance);
+                    }
+                });
 
-                tbody.innerHTML = html;
-            }
+                if (html) tbody.insertAdjacentHTML('beforeend', html);
+            });
         } catch (e) { }
     },
 
@@ -95,6 +95,51 @@ const Utils = {
         put: (endpoint, data) => Utils.api.request(endpoint, 'PUT', data),
         delete: (endpoint) => Utils.api.request(endpoint, 'DELETE'),
 
+        // Stream an NDJSON endpoint, calling onBatch with each chunk of parsed lines as it arrives
+        async stream(endpoint, onBatch) {
+            const token = localStorage.getItem('access_token');
+            const headers = {};
+            if (token) {
+                headers['Authorization'] = `Bearer ${token}`;
+            }
+
+            try {
+                const response = await fetch(`${CONFIG.API_BASE_URL}${endpoint}`, { headers });
+
+                if (response.status === 401) {
+                    Auth.logout();
+                    return;
+                }
+                if (!response.ok) {
+                    let msg = `Request failed (${response.status})`;
+                    try {
+                        const result = await response.json();
+                        msg = result.detail || result.message || msg;
+                    } catch (e) { }
+                    throw new Error(msg);
+                }
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    const items = lines.filter(l => l.trim()).map(l => JSON.parse(l));
+                    if (items.length) onBatch(items);
+                }
+                if (buffer.trim()) onBatch([JSON.parse(buffer)]);
+            } catch (error) {
+                Utils.showToast(error.message, 'error');
+                console.error('API Stream Failed:', error);
+                throw error;
+            }
+        },
+
         // Special handler for file upload
         async upload(endpoint, formData) {
             const token = localStorage.getItem('access_token');